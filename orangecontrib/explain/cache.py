@@ -0,0 +1,458 @@
+""" Caches of explanation results. """
+import hashlib
+import itertools
+import os
+import pickle
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from types import BuiltinFunctionType, FunctionType, SimpleNamespace
+from typing import Any, Callable, Dict, Optional, Union
+
+import numpy as np
+from scipy import sparse
+
+from Orange.base import Model
+from Orange.data import Domain, Table, Variable
+
+
+def array_hash(x: Union[np.ndarray, sparse.spmatrix]) -> str:
+    """
+    Content hash of a dense or sparse array.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    if sparse.issparse(x):
+        x = sparse.csr_matrix(x)
+        h.update(repr((x.shape, str(x.dtype), "sparse")).encode())
+        for part in (x.data, x.indices, x.indptr):
+            h.update(np.ascontiguousarray(part).tobytes())
+    else:
+        x = np.ascontiguousarray(x)
+        h.update(repr((x.shape, str(x.dtype))).encode())
+        h.update(x.tobytes())
+    return h.hexdigest()
+
+
+def row_hashes(x: Union[np.ndarray, sparse.spmatrix]) -> np.ndarray:
+    """
+    Content hashes of rows of a dense or sparse array; an array of 16-byte
+    strings.
+    """
+    def digest(*parts):
+        h = hashlib.blake2b(digest_size=16)
+        for part in parts:
+            h.update(part)
+        return h.digest()
+
+    if sparse.issparse(x):
+        x = sparse.csr_matrix(x)
+        x.sort_indices()
+        data, indices, indptr = x.data, x.indices, x.indptr
+        hashes = [
+            digest(indices[start:end].tobytes(), data[start:end].tobytes())
+            for start, end in zip(indptr[:-1], indptr[1:])
+        ]
+    else:
+        x = np.ascontiguousarray(x)
+        hashes = [digest(row.tobytes()) for row in x]
+    return np.array(hashes, dtype="S16").reshape(-1)
+
+
+def table_hash(data: Table) -> str:
+    """
+    Hash of the table's features: their names, values and data in X.
+    """
+    attributes = [
+        (type(a).__name__, a.name, tuple(getattr(a, "values", ())))
+        for a in data.domain.attributes
+    ]
+    h = hashlib.blake2b(repr(attributes).encode(), digest_size=16)
+    h.update(array_hash(data.X).encode())
+    return h.hexdigest()
+
+
+def full_table_hash(data: Table) -> str:
+    """
+    Hash of the entire table: its domain, data, weights and row ids.
+    """
+    domain = data.domain
+    variables = [
+        (type(v).__name__, v.name, tuple(getattr(v, "values", ())))
+        for v in domain.class_vars + domain.metas
+    ]
+    h = hashlib.blake2b(repr(variables).encode(), digest_size=16)
+    h.update(table_hash(data).encode())
+    for part in (data.Y, data.W, data.ids):
+        h.update(array_hash(part).encode())
+    h.update(str(object_hash(data.metas)).encode())
+    return h.hexdigest()
+
+
+def object_hash(obj: object) -> Optional[str]:
+    """
+    Hash of the pickled object; None if the object cannot be pickled.
+    """
+    try:
+        pickled = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:  # pylint: disable=broad-except
+        return None
+    return hashlib.blake2b(pickled, digest_size=16).hexdigest()
+
+
+class _Undescribable(Exception):
+    pass
+
+
+def _describe(obj: Any, path: frozenset = frozenset()) -> Any:
+    """
+    Describe the object with basic Python values that are the same in all
+    processes; see stable_hash.
+    """
+    if obj is None or isinstance(obj, (bool, int, float, complex, str, bytes)):
+        return obj
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray) and obj.dtype != object \
+            or sparse.issparse(obj):
+        return array_hash(obj)
+    if isinstance(obj, (type, FunctionType, BuiltinFunctionType)):
+        return f"{obj.__module__}.{obj.__qualname__}"
+    if id(obj) in path:  # a reference cycle
+        return "..."
+    path = path | {id(obj)}
+    if isinstance(obj, np.ndarray):
+        return obj.shape, _describe(obj.ravel().tolist(), path)
+    if isinstance(obj, Variable):
+        return (type(obj).__name__, obj.name,
+                tuple(getattr(obj, "values", ())),
+                _describe(obj.compute_value, path))
+    if isinstance(obj, Domain):
+        return tuple(_describe(part, path)
+                     for part in (obj.attributes, obj.class_vars, obj.metas))
+    if isinstance(obj, Table):
+        return full_table_hash(obj)
+    if isinstance(obj, (list, tuple)):
+        return type(obj).__name__, [_describe(o, path) for o in obj]
+    if isinstance(obj, (set, frozenset)):
+        return type(obj).__name__, sorted(repr(_describe(o, path))
+                                          for o in obj)
+    if isinstance(obj, dict):
+        return "dict", sorted((repr(_describe(k, path)), _describe(v, path))
+                              for k, v in obj.items())
+    name = f"{type(obj).__module__}.{type(obj).__qualname__}"
+    if hasattr(obj, "__dict__"):
+        return name, _describe(vars(obj), path)
+    if hasattr(obj, "get_arrays"):
+        # sklearn's neighbour trees; their pickles include query counters
+        return name, _describe(obj.get_arrays(), path)
+    # extension types, e.g. sklearn's decision trees
+    pickled = object_hash(obj)
+    if pickled is None:
+        raise _Undescribable
+    return name, pickled
+
+
+def stable_hash(obj: Any) -> Optional[str]:
+    """
+    Hash of the object that is the same in all processes, unlike the hash
+    of its pickle: pickles of Orange's variables and domains differ between
+    processes. Variables are described by their types, names, values and
+    transformations (compute_value), arrays by their contents, sklearn's
+    objects by their pickles, and other objects by their attributes.
+
+    None if a part of the object cannot be pickled and described.
+    """
+    try:
+        description = _describe(obj)
+    except _Undescribable:
+        return None
+    return hashlib.blake2b(repr(description).encode(),
+                           digest_size=16).hexdigest()
+
+
+class DiskCache:
+    """
+    A directory of .npz files, each holding a dictionary of arrays stored
+    under a key. When the total size of files exceeds max_size bytes, the
+    least recently used files are removed.
+    """
+    SUFFIX = ".npz"
+
+    def __init__(self, directory: str, max_size: int = 2 ** 29):
+        self.directory = directory
+        self.max_size = max_size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as f:
+                arrays = dict(f)
+        except FileNotFoundError:
+            return None
+        except Exception:  # pylint: disable=broad-except
+            # corrupted or incompatible file
+            self._remove(path)
+            return None
+        try:
+            # mark as recently used
+            os.utime(path)
+        except OSError:
+            pass
+        return arrays
+
+    def put(self, key: str, arrays: Dict[str, np.ndarray]):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # write to a temporary file first, so that others never read
+            # a partially written file
+            fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            return
+        self._evict()
+
+    def clear(self):
+        for path, _, _ in self._files():
+            self._remove(path)
+
+    def _files(self):
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return []
+        files = []
+        for entry in entries:
+            if entry.name.endswith(self.SUFFIX):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((entry.path, stat.st_mtime, stat.st_size))
+        return files
+
+    def _evict(self):
+        files = sorted(self._files(), key=lambda f: f[1])
+        total = sum(size for _, _, size in files)
+        for path, _, size in files:
+            if total <= self.max_size:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def nbytes(obj: Any) -> int:
+    """
+    Memory taken by arrays in obj, which is an array or a (nested) list,
+    tuple or SimpleNamespace of arrays, or a data table; other objects are
+    not counted.
+    """
+    if isinstance(obj, Table):
+        return nbytes([obj.X, obj.Y, obj.metas, obj.W])
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if sparse.issparse(obj):
+        return sum(nbytes(getattr(obj, name, None))
+                   for name in ("data", "indices", "indptr"))
+    if isinstance(obj, (list, tuple)):
+        return sum(nbytes(o) for o in obj)
+    if isinstance(obj, SimpleNamespace):
+        return nbytes(list(vars(obj).values()))
+    return 0
+
+
+class _Pending:
+    def __init__(self):
+        self.event = threading.Event()
+        self.succeeded = False
+        self.value = None
+
+
+class MemoryBudget:
+    """
+    Memory shared by MemoryCaches. When the total size of arrays stored in
+    the caches exceeds max_size bytes, the least recently used values are
+    removed from any of them.
+
+    Caches with the same budget share its lock, which is reentrant because
+    values can be discarded by finalizers run by the garbage collector.
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.lock = threading.RLock()
+        self.caches = weakref.WeakSet()
+        self._clock = itertools.count()
+
+    @property
+    def size(self) -> int:
+        return sum(cache._size for cache in self.caches)
+
+    def tick(self) -> int:
+        return next(self._clock)
+
+    def evict(self):
+        """ Remove the least recently used values; call with the lock held. """
+        while self.size > self.max_size:
+            oldest = min((cache for cache in self.caches if cache._items),
+                         key=lambda cache: next(iter(
+                             cache._items.values()))[2])
+            _, (_, size, _) = oldest._items.popitem(last=False)
+            oldest._size -= size
+
+
+class MemoryCache:
+    """
+    A thread-safe in-memory cache of computed values. When the total size of
+    stored arrays exceeds max_size bytes, or the budget shared with other
+    caches, the least recently used values are removed.
+
+    Values are computed with get_or_compute; when a thread requests a value
+    that is being computed by another thread, it waits for that computation
+    instead of starting its own.
+    """
+    def __init__(self, max_size: int = 2 ** 28,
+                 budget: Optional[MemoryBudget] = None):
+        if budget is None:
+            budget = MemoryBudget(max_size)
+        self.budget = budget
+        self._items = OrderedDict()  # key -> (value, size, last use)
+        self._size = 0
+        self._pending = {}  # key -> _Pending
+        self._lock = budget.lock
+        budget.caches.add(self)
+
+    @property
+    def max_size(self) -> int:
+        return self.budget.max_size
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        wait_callback: Optional[Callable[[], Any]] = None,
+    ) -> Any:
+        """
+        Return the value stored under the key, or compute and store it.
+
+        Parameters
+        ----------
+        key
+            Key of the value.
+        compute
+            Function without arguments that computes the value.
+        wait_callback
+            Called periodically while waiting for a computation in another
+            thread; it can stop waiting by raising an exception.
+        """
+        while True:
+            with self._lock:
+                if key in self._items:
+                    return self._use(key)
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = _Pending()
+                    break
+            while not pending.event.wait(0.1):
+                if wait_callback is not None:
+                    wait_callback()
+            if pending.succeeded:
+                return pending.value
+            # computation in the other thread failed (or was cancelled);
+            # try computing here
+
+        try:
+            value = compute()
+            pending.value, pending.succeeded = value, True
+            self.put(key, value)
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.event.set()
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._items
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key not in self._items:
+                return None
+            return self._use(key)
+
+    def put(self, key: str, value: Any):
+        size = nbytes(value)
+        with self._lock:
+            self._remove(key)
+            if size > self.max_size:
+                return
+            self._items[key] = (value, size, self.budget.tick())
+            self._size += size
+            self.budget.evict()
+
+    def discard(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    def _use(self, key: str) -> Any:
+        value, size, _ = self._items.pop(key)
+        self._items[key] = (value, size, self.budget.tick())
+        return value
+
+    def _remove(self, key: str):
+        if key in self._items:
+            self._size -= self._items.pop(key)[1]
+
+
+# memory shared by all caches of explanations in this process
+memory_budget = MemoryBudget(2 ** 28)
+transformed_cache = MemoryCache(budget=memory_budget)
+
+
+def data_to_model_domain(model: Model, data: Table) -> Table:
+    """
+    Transform data to the model's domain, like model.data_to_model_domain.
+
+    Transformed tables are kept in transformed_cache under the model, the
+    table and its domain, so repeated transformations of the same table are
+    computed only once. Tables are identified by identity, not by content:
+    equal tables in different domains (e.g. with different compute values)
+    are transformed separately. An entry is removed when the model or the
+    table is garbage collected.
+    """
+    if transformed_cache is None or data.domain == model.domain:
+        return model.data_to_model_domain(data)
+
+    # the key holds ids; the stored weak references verify that the ids
+    # were not reused by other objects
+    key = (id(model), id(data), id(data.domain))
+    cached = transformed_cache.get(key)
+    if cached is not None and all(ref() is obj for ref, obj in
+                                  zip(cached[0], (model, data, data.domain))):
+        return cached[1]
+    transformed = model.data_to_model_domain(data)
+    refs = (weakref.ref(model), weakref.ref(data), weakref.ref(data.domain))
+    transformed_cache.put(key, (refs, transformed))
+    weakref.finalize(model, transformed_cache.discard, key)
+    weakref.finalize(data, transformed_cache.discard, key)
+    return transformed
@@ -1,17 +1,35 @@
 import contextlib
-from typing import Callable, List, Optional, Tuple, Union
+import multiprocessing
+import os
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from types import SimpleNamespace
+from typing import Callable, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
+import shap
 from scipy import sparse
-from shap import KernelExplainer, TreeExplainer
-from shap.utils import sample, hclust_ordering
+from scipy.special import comb
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import pairwise_distances_argmin
+from shap import TreeExplainer
+from shap.utils import sample, hclust_ordering, safe_isinstance
 from shap.utils._legacy import kmeans
 
 from Orange.base import Model
-from Orange.data import Table, Domain, Variable
+from Orange.data import Table, Domain, Variable, ContinuousVariable, \
+    StringVariable
+from Orange.misc.environ import cache_dir
+from Orange.tree import MappedDiscreteNode, Node, NumericNode, TreeModel
 from Orange.util import dummy_callback, wrap_callback
 from Orange.widgets.utils.colorpalettes import LimitedDiscretePalette
 
+from orangecontrib.explain.cache import DiskCache, MemoryCache, \
+    array_hash, data_to_model_domain, memory_budget, object_hash, \
+    row_hashes, stable_hash, table_hash
+
 RGB_LOW = [0, 137, 229]
 RGB_HIGH = [255, 0, 66]
 
@@ -20,12 +38,95 @@ ORIGINAL_ORDER = "Original instance ordering"
 OUTPUT_ORDER = "Order instances by output value"
 INSTANCE_ORDERINGS = [SIMILARITY_ORDER, OUTPUT_ORDER, ORIGINAL_ORDER]
 
+# time in seconds that a single batch of explanations should approximately take
+# so that the progress is reported and the cancellation checked often enough
+BATCH_TARGET_TIME = 0.1
+
+# number of rows explained by default - more take too long for most models
+N_SAMPLES = 1000
+
+# number of rows in the first chunk of explained rows - see _chunks
+CHUNK_SIZE = 100
+MAX_CHUNK_SIZE = 10000
+
+# maximal number of values in a block of densified sparse data
+MAX_DENSE_SIZE = 10 ** 7
+
+# when set, percentiles that normalize colors of values are estimated from a
+# sample of that many rows of taller data, which changes colors slightly; by
+# default (None), all rows are used and colors are exact
+MAX_QUANTILE_ROWS: Optional[int] = None
+
+# number of coalitions (feature subsets) that KernelSHAP evaluates per row,
+# in addition to two per feature (see _n_kernel_coalitions)
+KERNEL_N_SAMPLES = 100
+
+# number of rows in the first, coarse explanation when the explanation is
+# refined progressively; see compute_shap_values
+PROGRESSIVE_N_ROWS = 10
+
+# methods that summarize reference data into a small weighted background for
+# KernelSHAP; see summarize_background
+SUMMARY_AUTO = "Automatic"
+SUMMARY_KMEANS = "Weighted k-means"
+SUMMARY_STRATIFIED = "Stratified by class"
+SUMMARY_MINIBATCH_KMEANS = "Mini-batch k-means"
+SUMMARY_METHODS = [SUMMARY_AUTO, SUMMARY_KMEANS, SUMMARY_STRATIFIED,
+                   SUMMARY_MINIBATCH_KMEANS]
+# number of clusters in k-means summaries and of rows in sampled summaries
+SUMMARY_N_CLUSTERS = 10
+SUMMARY_N_ROWS = 100
+# automatic summary uses k-means for at most that many rows and mini-batch
+# k-means for larger data
+MAX_KMEANS_ROWS = 10000
+
+# number of the strongest interactions kept for each row and the maximal
+# number of interaction values in a chunk of rows; see
+# compute_shap_interactions
+N_TOP_INTERACTIONS = 5
+MAX_INTERACTION_SIZE = 10 ** 7
+
+# instances are ordered by similarity with hierarchical clustering, which
+# takes cubic time, for at most that many rows; larger data is ordered by
+# clustering a sample of that many rows; see get_instance_ordering
+MAX_HCLUST_ROWS = 1000
+
+# increase when a change in the code changes computed SHAP values
+CACHE_VERSION = 10
+
+# persistent cache of computed SHAP values; it stores the explained data in
+# the user's cache directory and is disabled by default, see enable_disk_cache
+shap_cache: Optional[DiskCache] = None
+SHAP_CACHE_DIR = os.path.join(cache_dir(), "explain", "shap_values")
+# explanations computed in this process, shared by all widgets; set to None
+# to disable it
+shap_memory_cache: Optional[MemoryCache] = MemoryCache(budget=memory_budget)
+# SHAP values of rows explained in this process (for a model and reference
+# data), so that only new rows are explained when the data changes; set to
+# None to disable it
+shap_rows_cache: Optional[MemoryCache] = MemoryCache(budget=memory_budget)
+# summaries of reference data, computed in this process; set to None to
+# disable it
+background_cache: Optional[MemoryCache] = MemoryCache(budget=memory_budget)
+# bounds for normalization of colors of features, computed in this process;
+# set to None to disable it
+color_bounds_cache: Optional[MemoryCache] = MemoryCache(budget=memory_budget)
+# fingerprints of models are computed once per model object: pickles of some
+# models (e.g. sklearn's neighbour trees) change when the model is used
+_model_hashes = weakref.WeakKeyDictionary()
+# attributes of models that are not included in their fingerprints
+_MODEL_IGNORED_ATTRIBUTES = {"original_data", "instances",
+                             "_code", "_values", "_thresholds"}
+
 
 @contextlib.contextmanager
 def temp_seed(seed):
     """
     This function provides an environment with a custom random seed. It reset
     it back to normal when exiting the environment.
+
+    The seed is global and thus not thread-safe; the explanation code uses
+    its own np.random.Generator instances instead.
     """
     state = np.random.get_state()
     np.random.seed(seed)
@@ -35,20 +136,80 @@ def temp_seed(seed):
         np.random.set_state(state)
 
 
-def _subsample_data(data: Table, n_samples: int) -> Tuple[Table, np.array]:
+def _row_priorities(hashes: np.ndarray) -> np.ndarray:
     """
-    Randomly subsample rows in data to n_samples
+    Random, but reproducible priorities of rows with the given hashes.
+
+    Identical rows share a hash, so the hash is mixed with the row's
+    occurrence among identical rows (0 for the first, 1 for the second...);
+    otherwise all copies of a row would get the same priority and a sample
+    of rows with the lowest priorities would take or skip whole groups of
+    duplicates.
     """
-    if len(data) > n_samples:
-        idx = np.random.choice(len(data), n_samples, replace=False)
-        # first make mask since idx not sorted - sampling with idx mix data
+    n = len(hashes)
+    _, inverse = np.unique(hashes, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    group_starts = np.flatnonzero(np.diff(inverse[order], prepend=-1))
+    group_sizes = np.diff(np.append(group_starts, n))
+    occurrence = np.empty(n, dtype=np.uint64)
+    occurrence[order] = np.arange(n) - np.repeat(group_starts, group_sizes)
+
+    x = np.frombuffer(hashes.tobytes(), dtype=">u8")[:: hashes.itemsize // 8]
+    # splitmix64 finalizer of the hash combined with the occurrence
+    with np.errstate(over="ignore"):
+        x = x.astype(np.uint64) ^ (occurrence * np.uint64(0x9E3779B97F4A7C15))
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        x ^= x >> np.uint64(31)
+    return x
+
+
+def _subsample_data(
+    data: Table,
+    n_samples: Optional[int],
+    hashes: Optional[np.ndarray] = None,
+    rng: Optional[np.random.Generator] = None,
+) -> np.ndarray:
+    """
+    Randomly subsample rows in data to n_samples. Return a boolean mask of
+    selected rows. When n_samples is None all rows are selected. Rows are
+    sampled with rng (a generator with seed 0 by default).
+
+    When hashes of rows are given, the rows with the lowest priorities -
+    hashes mixed with the occurrence of the row among identical rows - are
+    selected. Such a sample is random, yet a row that is selected remains
+    selected when rows are added to data unless the new rows displace it -
+    which lets us reuse explanations of rows when data grows.
+    """
+    if n_samples is not None and len(data) > n_samples:
+        if hashes is None:
+            if rng is None:
+                rng = np.random.default_rng(0)
+            idx = rng.choice(len(data), n_samples, replace=False)
+        else:
+            idx = np.argsort(_row_priorities(hashes), kind="stable")
+            idx = idx[:n_samples]
+        # make mask since idx not sorted - sampling with idx mix data
         mask_array = np.zeros(len(data), dtype=bool)
         mask_array[idx] = True
-        data_sample = data[mask_array]
     else:
-        data_sample = data
         mask_array = np.ones(len(data), dtype=bool)
-    return data_sample, mask_array
+    return mask_array
+
+
+def _chunks(indices: np.ndarray) -> Iterator[np.ndarray]:
+    """
+    Split indices of rows into chunks that are explained (and reported)
+    one after another. The first chunk has CHUNK_SIZE rows and each
+    following one is twice as big (at most MAX_CHUNK_SIZE rows), so that
+    first results are available soon but even a big table is reported in
+    a reasonable number of steps.
+    """
+    start, size = 0, CHUNK_SIZE
+    while start < len(indices):
+        yield indices[start : start + size]
+        start += size
+        size = min(2 * size, MAX_CHUNK_SIZE)
 
 
 def _join_shap_values(
@@ -68,114 +229,1142 @@ def _join_shap_values(
         return [np.vstack(s) for s in zip(*shap_values)]
 
 
-def _explain_trees(
-    model: Model,
-    transformed_data: Table,
-    transformed_reference_data: Table,
+def _dense_chunks(x: sparse.spmatrix) -> Iterator[np.ndarray]:
+    """
+    Densify a sparse matrix in chunks of rows with at most MAX_DENSE_SIZE
+    values, so that the memory stays bounded for wide data.
+    """
+    x = sparse.csr_matrix(x)
+    size = max(1, MAX_DENSE_SIZE // max(x.shape[1], 1))
+    for start in range(0, x.shape[0], size):
+        yield x[start : start + size].toarray()
+
+
+def _explain_in_batches(
+    explain: Callable[[np.ndarray], Union[List[np.ndarray], np.ndarray]],
+    x: np.ndarray,
+    out: np.ndarray,
     progress_callback: Callable,
-) -> Tuple[
-    Optional[List[np.ndarray]], Optional[np.ndarray], Optional[np.ndarray]
-]:
+    target_time: float = BATCH_TARGET_TIME,
+    batch_size: int = 1,
+) -> Tuple[np.ndarray, int]:
     """
-    Computes and returns SHAP values for learners that are explained by
-    TreeExplainer: all sci-kit models based on trees. In case that explanation
-    with TreeExplainer is not possible it returns None
+    Call explain on consecutive batches of rows from x and write the results
+    into out, an array of shape (num classes x num rows x num attributes).
+    The batch size starts at batch_size rows and adapts such that each batch
+    takes about target_time seconds - explainers are much faster on bigger
+    batches while short batches let us report the progress (and check for
+    cancellation) regularly.
+
+    Return out and the adapted batch size, with which the next call for the
+    same explainer can start.
     """
-    if sparse.issparse(transformed_data.X):
-        # sparse not supported by TreeExplainer, KernelExplainer can handle it
-        return None, None, None
-    try:
-        explainer = TreeExplainer(
-            model.skl_model, data=sample(transformed_reference_data.X, 100),
+    i = 0
+    while i < x.shape[0]:
+        progress_callback(i / x.shape[0])
+        batch = x[i : i + batch_size]
+        t = time.perf_counter()
+        values = explain(batch)
+        if isinstance(values, np.ndarray) and values.ndim == 2:
+            # regression
+            values = [values]
+        for class_out, class_values in zip(out, values):
+            class_out[i : i + batch.shape[0]] = class_values
+        elapsed = time.perf_counter() - t
+        i += batch.shape[0]
+
+        if elapsed < target_time / 2:
+            batch_size *= 2
+        elif elapsed > target_time:
+            batch_size = max(1, batch_size // 2)
+    return out, batch_size
+
+
+def _linear_coefficients(
+    model: Model
+) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    Coefficients (num classes x num attributes) and intercepts of a model
+    with a sci-kit linear estimator (linear and logistic regression, ridge,
+    lasso, ...) or None when the model is not linear. Binary classifiers
+    have one decision function (log-odds of class 1), which is expanded to
+    both classes; classes that were missing in training data get zero
+    coefficients.
+    """
+    skl_model = getattr(model, "skl_model", None)
+    if not type(skl_model).__module__.startswith("sklearn.linear_model") \
+            or not hasattr(skl_model, "coef_") \
+            or not hasattr(skl_model, "intercept_"):
+        return None, None
+
+    coef = np.atleast_2d(skl_model.coef_).astype(float)
+    intercept = np.atleast_1d(skl_model.intercept_).astype(float)
+    class_ = model.domain.class_var
+    if class_.is_discrete:
+        n_classes = len(skl_model.classes_)
+        if len(coef) == 1 and n_classes == 2:
+            coef = np.vstack((-coef, coef))
+            intercept = np.hstack((-intercept, intercept))
+        if len(coef) != n_classes:
+            return None, None
+        sklc = skl_model.classes_.astype(int)
+        coef_ = np.zeros((len(class_.values), coef.shape[1]))
+        coef_[sklc] = coef
+        intercept_ = np.zeros(len(class_.values))
+        intercept_[sklc] = intercept
+        coef, intercept = coef_, intercept_
+    elif len(coef) != 1:
+        return None, None
+    return coef, intercept
+
+
+def explanation_space(model: Model) -> Optional[str]:
+    """
+    The space in which classifications of the model are explained when it
+    is not the space of probabilities: "log-odds" for binary and "logit"
+    for multinomial linear classifiers, whose SHAP values explain their
+    decision function (see _explain_linear), and None for other models.
+    Predictions returned by explain_predictions are in the same space, so
+    that the base value and the sum of SHAP values equal the prediction.
+    """
+    if not model.domain.has_discrete_class \
+            or _linear_coefficients(model)[0] is None:
+        return None
+    return "log-odds" if len(model.skl_model.classes_) == 2 else "logit"
+
+
+def n_explained_rows(
+    model: Model, n_rows: int, n_samples: Optional[int] = N_SAMPLES
+) -> int:
+    """
+    Number of rows that compute_shap_values explains in a table with n_rows
+    rows: all rows of linear models (see Explainer.explain_all_rows) or when
+    n_samples is None, and at most n_samples rows otherwise.
+    """
+    if n_samples is None or _linear_coefficients(model)[0] is not None:
+        return n_rows
+    return min(n_rows, n_samples)
+
+
+def _explain_linear(
+    model: Model, transformed_reference_data: Table
+) -> Tuple[Optional[Callable], Optional[np.ndarray]]:
+    """
+    Prepare the explanation for models with sci-kit linear estimators
+    (linear and logistic regression, ridge, lasso, ...). Under the feature
+    independence, SHAP values of a linear model are exactly
+    coef * (x - E[x]), so all rows can be explained with one matrix
+    operation. Classifiers are explained in the space of their decision
+    function (log-odds; logits for multinomial models). Return a function
+    that computes SHAP values and the base value; or None when the model is
+    not linear.
+    """
+    coef, intercept = _linear_coefficients(model)
+    if coef is None:
+        return None, None
+
+    x_ref = transformed_reference_data.X
+    mean = np.asarray(x_ref.mean(axis=0)).ravel()
+    base_value = intercept + coef @ mean
+    if not model.domain.class_var.is_discrete:
+        base_value = base_value[0]
+
+    def explain(x: np.ndarray) -> List[np.ndarray]:
+        if sparse.issparse(x):
+            x = x.toarray()
+        x = x - mean
+        return [x * c for c in coef]
+
+    return explain, base_value
+
+
+def _tree_branches(node: Node, x: np.ndarray) -> np.ndarray:
+    """
+    Indices of branches of the node that rows with values x of the node's
+    attribute go to; -1 when the prediction stops at the node since the
+    value is missing or its branch is empty.
+    """
+    missing = np.isnan(x)
+    x = np.where(missing, 0, x)
+    if isinstance(node, NumericNode):
+        branches = (x > node.threshold).astype(int)
+    elif isinstance(node, MappedDiscreteNode):
+        branches = node.mapping[x.astype(int)].astype(int)
+    else:
+        branches = x.astype(int)
+    branches[missing] = -1
+    empty = [i for i, child in enumerate(node.children) if child is None]
+    if empty:
+        branches[np.isin(branches, empty)] = -1
+    return branches
+
+
+class _OrangeTreeShap:
+    """
+    Exact (interventional) TreeSHAP for Orange's TreeModel, which has no
+    skl_model that TreeExplainer could explain.
+
+    The prediction of the tree is a sum over its outcomes: nodes where the
+    prediction stops (leaves, and inner nodes when the value of their
+    attribute is missing or its branch is empty) weighted by the indicator
+    that the row satisfies the conditions on the path to the outcome.
+    When a row x is explained with respect to a background row z, an outcome
+    contributes only if each feature on its path is satisfied by x or by z;
+    with a features satisfied only by x and b only by z, the Shapley values
+    of such an indicator are (a-1)! b! / (a+b)! for the former features and
+    -a! (b-1)! / (a+b)! for the latter. Values are computed for all pairs of
+    explained and background rows and all outcomes at once and averaged over
+    the background.
+    """
+    # maximal number of (row, background row, outcome, feature) combinations
+    # processed at once
+    MAX_BLOCK_SIZE = 10 ** 7
+
+    def __init__(
+        self,
+        model: TreeModel,
+        background: Union[np.ndarray, sparse.csr_matrix],
+        background_weights: np.ndarray,
+    ):
+        self.n_features = len(model.domain.attributes)
+        self.weights = background_weights / background_weights.sum()
+
+        # inner nodes, and outcomes given by their value and the path:
+        # a list of conditions (index of inner node, index of branch)
+        self.nodes, paths, values = [], [], []
+
+        def add_outcomes(node, path):
+            if model.domain.class_var.is_discrete:
+                values.append(node.value / np.sum(node.value))
+            else:
+                values.append(node.value[:1])
+            paths.append(path)
+            if node.children:
+                node_idx = len(self.nodes)
+                self.nodes.append(node)
+                paths[-1] = path + [(node_idx, -1)]
+                for i, child in enumerate(node.children):
+                    if child is not None:
+                        add_outcomes(child, path + [(node_idx, i)])
+
+        add_outcomes(model.root, [])
+        self.values = np.array(values)
+
+        # conditions on the same feature are grouped: a feature is satisfied
+        # when all its conditions are; groups of each outcome are padded to
+        # the same number with empty groups, which are always satisfied
+        conditions = sorted({c for path in paths for c in path})
+        self.cond_nodes = np.array([n for n, _ in conditions], dtype=int)
+        self.cond_branches = np.array([b for _, b in conditions], dtype=int)
+        cond_index = {c: i for i, c in enumerate(conditions)}
+        groups = [
+            sorted({self.nodes[n].attr_idx for n, _ in path}) for path in paths
+        ]
+        self.depth = max(1, max(map(len, groups)))
+        group_conds, group_features = [], []
+        for o, (path, features) in enumerate(zip(paths, groups)):
+            for j, feature in enumerate(features):
+                slot = o * self.depth + j
+                group_features.append((slot, feature))
+                group_conds += [
+                    (cond_index[c], slot)
+                    for c in path if self.nodes[c[0]].attr_idx == feature
+                ]
+        n_slots = len(paths) * self.depth
+        rows, cols = np.array(group_conds, dtype=int).reshape(-1, 2).T
+        self.groups = sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, cols)), shape=(len(conditions), n_slots)
+        )
+        rows, cols = np.array(group_features, dtype=int).reshape(-1, 2).T
+        self.features = sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, cols)),
+            shape=(n_slots, self.n_features)
         )
-    # I know it is too broad but this is what TreeExplainer trows
-    except Exception:
-        return None, None, None
 
-    # TreeExplaner cannot explain in normal time more cases than 1000
-    data_sample, sample_mask = _subsample_data(transformed_data, 1000)
+        a, b = np.mgrid[: self.depth + 1, : self.depth + 1]
+        # weights of features satisfied only by x (wa) and only by z (wb)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            wa = 1 / ((a + b) * comb(a + b - 1, b))
+            wb = 1 / ((a + b) * comb(a + b - 1, a))
+        self.wa = np.where((a > 0) & np.isfinite(wa), wa, 0)
+        self.wb = np.where((b > 0) & np.isfinite(wb), wb, 0)
+
+        self.satisfied_background = self._satisfied(background)
+        predictions = model(background, model.Probs) \
+            if model.domain.class_var.is_discrete else model(background)
+        self.expected_value = self.weights @ predictions
+
+    def _satisfied(self, x: Union[np.ndarray, sparse.csr_matrix]) -> np.ndarray:
+        """
+        Return a boolean array (rows x outcomes x depth) that tells whether
+        the row satisfies conditions on the outcome's features.
+        """
+        used = sorted({node.attr_idx for node in self.nodes})
+        columns = x[:, used]
+        if sparse.issparse(columns):
+            columns = columns.toarray()
+        columns = dict(zip(used, columns.T))
+        branches = np.column_stack(
+            [_tree_branches(node, columns[node.attr_idx])
+             for node in self.nodes]
+            or [np.zeros(x.shape[0], dtype=int)]
+        )
+        violated = branches[:, self.cond_nodes] != self.cond_branches
+        n_violated = violated.astype(float) @ self.groups
+        return (n_violated == 0).reshape(x.shape[0], -1, self.depth)
+
+    def shap_values(
+        self, x: Union[np.ndarray, sparse.csr_matrix]
+    ) -> List[np.ndarray]:
+        n, m = x.shape[0], len(self.weights)
+        sx, sz = self._satisfied(x), self.satisfied_background
+        # skip outcomes that no pair of rows reaches
+        reachable = np.all(sx.any(axis=0) | sz.any(axis=0), axis=1)
+        outcomes = np.flatnonzero(reachable)
+
+        phi = np.zeros((n, self.n_features, self.values.shape[1]))
+        block = max(1, self.MAX_BLOCK_SIZE // (n * m * self.depth))
+        for start in range(0, len(outcomes), block):
+            out = outcomes[start : start + block]
+            sxb, szb = sx[:, None, out], sz[None, :, out]
+            valid = np.all(sxb | szb, axis=3)
+            only_x, only_z = sxb & ~szb, ~sxb & szb
+            a, b = only_x.sum(axis=3), only_z.sum(axis=3)
+            weights = valid * self.weights[None, :, None]
+            wa, wb = self.wa[a, b] * weights, self.wb[a, b] * weights
+            coef = np.sum(
+                only_x * wa[..., None] - only_z * wb[..., None], axis=1
+            )
+            slots = (out[:, None] * self.depth + np.arange(self.depth)).ravel()
+            features = self.features[slots]
+            for c in range(self.values.shape[1]):
+                contrib = coef * self.values[out, c][None, :, None]
+                phi[:, :, c] += contrib.reshape(n, -1) @ features
+        return [phi[:, :, i] for i in range(phi.shape[2])]
 
-    # this method will work in batches since explaining only one attribute
-    # at time the processing timed doubles comparing to batch size 10
-    shap_values = []
-    batch_size = 1  # currently set to 1 to minimize widget blocking
-    for i in range(0, len(data_sample), batch_size):
-        progress_callback(i / len(data_sample))
-        batch = data_sample.X[i : i + batch_size]
-        shap_values.append(explainer.shap_values(batch, check_additivity=False))
 
-    shap_values = _join_shap_values(shap_values)
+def _explain_orange_tree(
+    model: TreeModel, transformed_reference_data: Table
+) -> Tuple[Callable, np.ndarray]:
+    """
+    Prepare the explanation for Orange's TreeModel. Return a function that
+    computes SHAP values for rows of the transformed data and the base value.
+    """
+    background = sample(transformed_reference_data.X, 100)
+    explainer = _OrangeTreeShap(model, background, np.ones(background.shape[0]))
     base_value = explainer.expected_value
+    if not model.domain.class_var.is_discrete:
+        base_value = base_value.item()
+    return explainer.shap_values, base_value
+
 
-    if (
+def _arrange_tree_classes(
+    model: Model, base_value: Union[np.ndarray, float]
+) -> Tuple[Callable, Union[np.ndarray, float]]:
+    """
+    TreeExplainer's outputs do not always match classes of the model's class
+    variable. Return a function that arranges TreeExplainer's (SHAP or
+    interaction) values into a list with an array for each class, and the
+    base value arranged in the same way.
+    """
+    # workaround for the error in the TreeExplainer, for the binary
+    # classification the TreeExplainer returns explanations for class 1 only
+    # https://github.com/slundberg/shap/pull/1046
+    only_positive_class = (
         type(model.skl_model).__name__ in ("XGBClassifier", "XGBRFClassifier", "GradientBoostingClassifier")
         and len(model.skl_model.classes_) == 2
-        and len(shap_values) == 1
-    ):
-        # workaround for the error in the TreeExplainer, for the binary
-        # classification the TreeExplainer returns explanations for class 1 only
-        # https://github.com/slundberg/shap/pull/1046
-        shap_values = [-shap_values[0], shap_values[0]]
+        and np.size(base_value) == 1
+    )
+    if only_positive_class:
         base_value = np.array([-base_value, base_value])
 
     # when while training one class value is missing in data but is still in
     # variable's values skl_model do not output probability for it.
     # Missing class cannot be explained, report zeros
     class_ = model.domain.class_var
-    if class_.is_discrete and len(class_.values) > len(model.skl_model.classes_):
+    missing_classes = class_.is_discrete and \
+        len(class_.values) > len(model.skl_model.classes_)
+    sklc = None
+    if missing_classes:
         sklc = model.skl_model.classes_.astype(int).tolist()
-        shap_values = [
-            shap_values[sklc.index(i)] if i in sklc else np.zeros(shap_values[0].shape)
-            for i in range(len(class_.values))
-        ]
         bv = np.zeros(len(class_.values))
         bv[sklc] = base_value
         base_value = bv
 
-    return shap_values, sample_mask, base_value
+    def arrange(values: Union[List[np.ndarray], np.ndarray]) \
+            -> List[np.ndarray]:
+        if isinstance(values, np.ndarray):
+            values = [values]
+        if only_positive_class:
+            values = [-values[0], values[0]]
+        if missing_classes:
+            values = [
+                values[sklc.index(i)]
+                if i in sklc else np.zeros(values[0].shape)
+                for i in range(len(class_.values))
+            ]
+        return values
 
+    return arrange, base_value
 
-def _explain_other_models(
+
+def _explain_trees(
     model: Model,
-    transformed_data: Table,
     transformed_reference_data: Table,
-    progress_callback: Callable,
-) -> Tuple[List[np.ndarray], np.ndarray, np.ndarray]:
+    approximate: bool = False,
+) -> Tuple[Optional[Callable], Optional[np.ndarray]]:
     """
-    Computes SHAP values for any learner with KernelExplainer.
+    Prepare the explanation for learners that are explained by TreeExplainer:
+    all sci-kit models based on trees. Return a function that computes SHAP
+    values for rows of the transformed data and the base value. In case that
+    explanation with TreeExplainer is not possible it returns None
+
+    When approximate is True, sci-kit models are explained with Saabas'
+    attributions along the decision paths (with the base value on the
+    training data), which takes a fraction of the time of the exact
+    interventional TreeSHAP. Orange's trees are always explained exactly.
     """
-    # 1000 is a number that for normal data and model do not take so long
-    data_sample, sample_mask = _subsample_data(transformed_data, 1000)
+    if isinstance(model, TreeModel):
+        return _explain_orange_tree(model, transformed_reference_data)
+    if approximate:
+        try:
+            explainer = TreeExplainer(model.skl_model)
+        # I know it is too broad but this is what TreeExplainer trows
+        except Exception:
+            return None, None
+        shap_values = partial(explainer.shap_values, approximate=True)
+    else:
+        background = sample(transformed_reference_data.X, 100)
+        if sparse.issparse(background):
+            # sparse data is not supported by TreeExplainer
+            background = background.toarray()
+        try:
+            explainer = TreeExplainer(model.skl_model, data=background)
+        # I know it is too broad but this is what TreeExplainer trows
+        except Exception:
+            return None, None
+        shap_values = explainer.shap_values
+
+    arrange, base_value = _arrange_tree_classes(
+        model, explainer.expected_value
+    )
+
+    def explain(x: Union[np.ndarray, sparse.csr_matrix]) -> List[np.ndarray]:
+        if sparse.issparse(x):
+            return _join_shap_values([explain(xd) for xd in _dense_chunks(x)])
+        return arrange(shap_values(x, check_additivity=False))
+
+    return explain, base_value
+
+
+# sci-kit models explained by TreeExplainer; classes are given by their paths,
+# so that optional packages need not be imported to check them
+_TREE_EXPLAINER_MODELS = (
+    "sklearn.tree.BaseDecisionTree",
+    "sklearn.ensemble._forest.BaseForest",
+    "sklearn.ensemble._gb.BaseGradientBoosting",
+    "sklearn.ensemble._hist_gradient_boosting.gradient_boosting."
+    "BaseHistGradientBoosting",
+    "xgboost.sklearn.XGBModel",
+    "lightgbm.sklearn.LGBMModel",
+    "catboost.core.CatBoost",
+)
+
+
+def supports_approximation(model: Model) -> bool:
+    """
+    Whether the model's explanation can be approximated (see _explain_trees)
+    to get a first explanation quickly: sci-kit models based on trees. The
+    check is made on the model's type, without building an explainer.
+    """
+    if isinstance(model, TreeModel):
+        return False
+    skl_model = getattr(model, "skl_model", None)
+    if not safe_isinstance(skl_model, _TREE_EXPLAINER_MODELS):
+        return False
+    # TreeExplainer explains sci-kit's gradient boosting only for regression
+    # and binary classification
+    return not (safe_isinstance(skl_model,
+                                "sklearn.ensemble.GradientBoostingClassifier")
+                and len(skl_model.classes_) > 2)
+
+
+def _is_additive_tree(model: Model) -> bool:
+    """
+    Whether the base value and the sum of SHAP values equal the model's
+    prediction (probabilities for classification). This holds for Orange's
+    trees, explained exactly with _OrangeTreeShap. TreeExplainer's values for
+    sci-kit models are explained in the space of log-odds (boosting) or
+    differ from predictions on some rows (thresholds are compared in a
+    different precision), so their sums are not used as predictions.
+    """
+    return isinstance(model, TreeModel)
+
+
+def _n_kernel_coalitions(n_features: int, n_samples: int) -> int:
+    """
+    Number of coalitions that KernelSHAP evaluates per row: n_samples and
+    two per feature, since the regression needs more coalitions than
+    features to be determined, or all coalitions when there are fewer.
+    """
+    return max(min(2 ** n_features - 2, n_samples + 2 * n_features), 0)
+
 
+def _kernel_coalitions(
+    n_features: int, n_samples: int, rng: np.random.Generator
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Coalitions (subsets of features) and their weights for KernelSHAP; see
+    _n_kernel_coalitions for their number. When all coalitions are
+    evaluated, they are enumerated and weighted by the Shapley kernel.
+    Otherwise, coalition sizes are sampled proportionally to the kernel and
+    each coalition is paired with its complement; sampled coalitions have
+    equal weights.
+    """
+    m = n_features
+    n_samples = _n_kernel_coalitions(m, n_samples)
+    if 2 ** m - 2 <= n_samples:
+        coalitions = (np.arange(1, 2 ** m - 1)[:, None] >> np.arange(m)) & 1
+        coalitions = coalitions.astype(bool)
+        sizes = coalitions.sum(axis=1)
+        weights = (m - 1) / (comb(m, sizes) * sizes * (m - sizes))
+    else:
+        sizes = np.arange(1, m)
+        p = (m - 1) / (sizes * (m - sizes))
+        sizes = rng.choice(sizes, n_samples // 2, p=p / p.sum())
+        ranks = rng.random((len(sizes), m)).argsort(axis=1).argsort(axis=1)
+        coalitions = ranks < sizes[:, None]
+        coalitions = np.vstack((coalitions, ~coalitions))
+        weights = np.ones(len(coalitions))
+    return coalitions, weights / weights.sum()
+
+
+class _KernelShap:
+    """
+    KernelSHAP that explains a block of rows at once. The model is called
+    only once for all synthetic rows of the block (each coalition of each
+    explained row combined with each background row) and the weighted linear
+    regressions (constrained such that SHAP values sum to the difference
+    between the prediction and the base value) for all rows are solved
+    together.
+    """
+    # maximal number of values in the arrays of a block of rows: synthetic
+    # rows, the model's outputs for them and the KKT systems
+    MAX_BLOCK_VALUES = 5 * 10 ** 6
+
+    def __init__(
+        self,
+        model: Model,
+        background: Union[np.ndarray, sparse.csr_matrix],
+        background_weights: np.ndarray,
+        n_samples: int = KERNEL_N_SAMPLES,
+        rng: Optional[np.random.Generator] = None,
+    ):
+        if rng is None:
+            rng = np.random.default_rng(0)
+        self.model = model
+        self.background = background.toarray() \
+            if sparse.issparse(background) else np.asarray(background)
+        self.background_weights = background_weights / background_weights.sum()
+        self.coalitions, self.coalition_weights = _kernel_coalitions(
+            self.background.shape[1], n_samples, rng
+        )
+        self.expected_value = self.background_weights @ self.predict(
+            self.background
+        )
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        """ Model's output: one column for each class or one for regression """
+        if self.model.domain.class_var.is_continuous:
+            return self.model(x).reshape(-1, 1)
+        return self.model(x, self.model.Probs)
+
+    def shap_values(
+        self, x: Union[np.ndarray, sparse.csr_matrix]
+    ) -> List[np.ndarray]:
+        x = x.toarray() if sparse.issparse(x) else np.asarray(x)
+        m, n_out = x.shape[1], len(self.expected_value)
+        n_synthetic = len(self.coalitions) * len(self.background)
+        row_values = n_synthetic * (m + n_out) + (m + 1) * (m + 1 + n_out)
+        block_size = max(1, self.MAX_BLOCK_VALUES // row_values)
+        phi = np.vstack([
+            self._explain_block(x[i : i + block_size])
+            for i in range(0, len(x), block_size)
+        ] or [np.zeros((0, x.shape[1], len(self.expected_value)))])
+        return [phi[:, :, i] for i in range(phi.shape[2])]
+
+    def _explain_block(self, x: np.ndarray) -> np.ndarray:
+        n, m = x.shape
+        n_out = len(self.expected_value)
+        if m == 0:
+            return np.zeros((n, 0, n_out))
+        if m == 1:
+            # there are no coalitions besides the empty and the full one;
+            # the only feature gets the entire difference from the base value
+            return (self.predict(x) - self.expected_value)[:, None, :]
+        z, w = self.coalitions, self.coalition_weights
+        bg = self.background
+
+        synthetic = np.where(
+            z[None, :, None, :], x[:, None, None, :], bg[None, None, :, :]
+        ).reshape(-1, m)
+        ey = self.predict(synthetic).reshape(n, len(z), len(bg), n_out)
+        y = ey.transpose(0, 1, 3, 2) @ self.background_weights \
+            - self.expected_value
+        d = self.predict(x) - self.expected_value
+
+        # features with the same value in x and in all background rows do
+        # not affect the prediction; their SHAP value is zero
+        varying = ~np.all(
+            np.isclose(bg[None], x[:, None], equal_nan=True), axis=1
+        )
+        v = varying.astype(float)
+        zf = z.astype(float)
+
+        # KKT system of the constrained weighted least squares for each row
+        kkt = np.zeros((n, m + 1, m + 1))
+        kkt[:, :m, :m] = (zf.T * w) @ zf * v[:, :, None] * v[:, None, :]
+        rows, cols = np.nonzero(~varying)
+        kkt[rows, cols, cols] = 1
+        kkt[:, :m, m] = kkt[:, m, :m] = v
+        kkt[~varying.any(axis=1), m, m] = 1
+
+        rhs = np.zeros((n, m + 1, n_out))
+        rhs[:, :m] = np.einsum("sm,s,nsc->nmc", zf, w, y) * v[:, :, None]
+        rhs[:, m] = d * varying.any(axis=1)[:, None]
+        try:
+            solution = np.linalg.solve(kkt, rhs)
+        except np.linalg.LinAlgError:
+            # singular systems, e.g. features that are never separated
+            solution = np.linalg.pinv(kkt) @ rhs
+        phi = solution[:, :m]
+        # restore the exact additivity that the numerical solution (of large
+        # or singular systems) may lose; the residual is split among features
+        n_varying = np.maximum(v.sum(axis=1), 1)
+        residual = rhs[:, m] - phi.sum(axis=1)
+        phi += v[:, :, None] * (residual / n_varying[:, None])[:, None, :]
+        return phi
+
+
+# KernelSHAP of a worker process; see _init_kernel_worker
+_worker_explainer: Optional[_KernelShap] = None
+# start method of worker processes; they are not forked, since forking a
+# multithreaded process (e.g. Qt's) can deadlock in the child
+_WORKER_START_METHOD = \
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() \
+    else "spawn"
+
+
+def _init_kernel_worker(explainer: _KernelShap):
+    # explainer (with the model and background) is pickled only once,
+    # when the worker starts
+    global _worker_explainer  # pylint: disable=global-statement
+    _worker_explainer = explainer
+
+
+def _kernel_worker_explain(x: np.ndarray) -> List[np.ndarray]:
+    return _worker_explainer.shap_values(x)
+
+
+class BackgroundSummary(SimpleNamespace):
+    data: Optional[Union[np.ndarray, sparse.csr_matrix]] = None
+    weights: Optional[np.ndarray] = None
+    method: Optional[str] = None
+    # time in seconds that the summarization (or the lookup of the cached
+    # summary) took
+    elapsed: Optional[float] = None
+    # whether the summary was taken from background_cache
+    cached: bool = False
+
+
+def _kmeans_summary(data: Table) -> Tuple[np.ndarray, np.ndarray]:
     try:
-        ref = kmeans(transformed_reference_data.X, k=10)
+        ref = kmeans(data.X, k=SUMMARY_N_CLUSTERS)
+        return ref.data, np.asarray(ref.weights)
     except ValueError:
         # k-means fails with value error when it cannot produce enough clusters
         # in this case we will use sample instead of clusters
-        ref = sample(transformed_reference_data.X, nsamples=100)
-
-    explainer = KernelExplainer(
-        lambda x: (
-            model(x)
-            if model.domain.class_var.is_continuous
-            else model(x, model.Probs)
-        ),
-        ref,
+        background = sample(data.X, nsamples=SUMMARY_N_ROWS)
+        return background, np.ones(background.shape[0])
+
+
+def _minibatch_kmeans_summary(data: Table) -> Tuple[np.ndarray, np.ndarray]:
+    n_clusters = min(SUMMARY_N_CLUSTERS, len(data))
+    kmeans_ = MiniBatchKMeans(
+        n_clusters=n_clusters, batch_size=1024, n_init=3, random_state=0
+    ).fit(data.X)
+    weights = np.bincount(kmeans_.labels_, minlength=n_clusters)
+    nonempty = weights > 0
+    return kmeans_.cluster_centers_[nonempty], weights[nonempty].astype(float)
+
+
+def _stratified_summary(
+    data: Table
+) -> Tuple[Union[np.ndarray, sparse.csr_matrix], np.ndarray]:
+    """
+    Sample rows such that each class is represented proportionally (and at
+    least by one row). Rows are weighted by the size of their class in data
+    over the number of sampled rows of the class, which corrects the
+    rounding of proportions.
+    """
+    class_var = data.domain.class_var
+    if class_var is None or not class_var.is_discrete \
+            or len(data) <= SUMMARY_N_ROWS:
+        background = sample(data.X, nsamples=SUMMARY_N_ROWS)
+        return background, np.ones(background.shape[0])
+
+    rng = np.random.default_rng(0)
+    y = np.where(np.isnan(data.Y), -1, data.Y)
+    indices, weights = [], []
+    for value in np.unique(y):
+        rows = np.flatnonzero(y == value)
+        size = max(1, round(SUMMARY_N_ROWS * len(rows) / len(data)))
+        indices.append(rng.choice(rows, min(size, len(rows)), replace=False))
+        weights.append(np.full(len(indices[-1]), len(rows) / len(indices[-1])))
+    indices = np.hstack(indices)
+    return data.X[indices], np.hstack(weights)
+
+
+_SUMMARIES = {
+    SUMMARY_KMEANS: _kmeans_summary,
+    SUMMARY_STRATIFIED: _stratified_summary,
+    SUMMARY_MINIBATCH_KMEANS: _minibatch_kmeans_summary,
+}
+
+
+def summarize_background(
+    transformed_reference_data: Table,
+    method: str = SUMMARY_AUTO,
+    use_cache: bool = True,
+) -> BackgroundSummary:
+    """
+    Summarize the reference data into a small weighted background that
+    KernelSHAP perturbs rows with; the time of KernelSHAP is proportional to
+    its size.
+
+    - SUMMARY_KMEANS: centroids of k-means clusters (rounded to values in
+      data) weighted by cluster sizes. Represents data best, but takes
+      several seconds for hundreds of thousands of rows.
+    - SUMMARY_MINIBATCH_KMEANS: centroids of mini-batch k-means. Much faster
+      on large data, with slightly less accurate centroids.
+    - SUMMARY_STRATIFIED: sample of rows with classes represented
+      proportionally. The fastest; keeps the class distribution but needs
+      more rows (and thus more time for KernelSHAP) than the clusters.
+    - SUMMARY_AUTO: k-means for data with at most MAX_KMEANS_ROWS rows,
+      mini-batch k-means for larger data.
+
+    Summaries are cached in background_cache per content of the data.
+
+    Parameters
+    ----------
+    transformed_reference_data
+        Reference data, transformed to the model's domain.
+    method
+        One of SUMMARY_METHODS.
+    use_cache
+        Whether to reuse the summary stored in background_cache.
+
+    Returns
+    -------
+    The summary with the data, weights of its rows (which sum to 1), the
+    method used and the time in seconds that the summarization took. A
+    summary from background_cache is marked as cached and its time is the
+    time of the lookup.
+    """
+    data = transformed_reference_data
+    if method == SUMMARY_AUTO:
+        method = SUMMARY_KMEANS if len(data) <= MAX_KMEANS_ROWS \
+            else SUMMARY_MINIBATCH_KMEANS
+    if method not in _SUMMARIES:
+        raise ValueError(f"Unknown summary method: {method}")
+
+    def compute():
+        t = time.perf_counter()
+        background, weights = _SUMMARIES[method](data)
+        return BackgroundSummary(
+            data=background, weights=weights / weights.sum(), method=method,
+            elapsed=time.perf_counter() - t
+        )
+
+    if not use_cache or background_cache is None:
+        return compute()
+    t = time.perf_counter()
+    computed = False
+
+    def compute_and_mark():
+        nonlocal computed
+        computed = True
+        return compute()
+
+    content = (table_hash(data), method, SUMMARY_N_CLUSTERS, SUMMARY_N_ROWS)
+    if method == SUMMARY_STRATIFIED:
+        content += (array_hash(data.Y),)
+    summary = background_cache.get_or_compute(object_hash(content),
+                                              compute_and_mark)
+    if computed:
+        return summary
+    return BackgroundSummary(
+        data=summary.data, weights=summary.weights, method=summary.method,
+        elapsed=time.perf_counter() - t, cached=True
     )
 
-    shap_values = []
-    for i, row in enumerate(data_sample.X):
-        progress_callback(i / len(data_sample))
-        shap_values.append(
-            explainer.shap_values(
-                row, nsamples=100, silent=True, l1_reg="num_features(90)"
+
+def _n_workers(n_jobs: int) -> int:
+    return os.cpu_count() if n_jobs == -1 else n_jobs
+
+
+def _explain_other_models(
+    model: Model,
+    background: BackgroundSummary,
+    n_jobs: int = 1,
+    exit_stack: Optional[contextlib.ExitStack] = None,
+    n_samples: int = KERNEL_N_SAMPLES,
+    rng: Optional[np.random.Generator] = None,
+) -> Tuple[Callable, np.ndarray]:
+    """
+    Prepare the explanation for any learner with KernelSHAP that perturbs
+    rows with the summarized background data and evaluates n_samples
+    coalitions per row (sampled with rng when not all are evaluated). Return
+    a function that computes SHAP values for rows of the transformed data and
+    the base value.
+
+    When n_jobs is not 1, rows are explained in a pool of n_jobs processes
+    (-1 means one per CPU); each call splits the rows into a shard per
+    worker. The pool is shut down when exit_stack closes.
+    """
+    background, weights = background.data, background.weights
+    explainer = _KernelShap(model, background, weights, n_samples, rng)
+    if n_jobs == 1:
+        return explainer.shap_values, explainer.expected_value
+
+    n_jobs = _n_workers(n_jobs)
+    pool = exit_stack.enter_context(ProcessPoolExecutor(
+        n_jobs, mp_context=multiprocessing.get_context(_WORKER_START_METHOD),
+        initializer=_init_kernel_worker, initargs=(explainer,)
+    ))
+
+    def explain(x: np.ndarray) -> List[np.ndarray]:
+        shards = np.array_split(np.arange(x.shape[0]), n_jobs)
+        shards = [x[idx] for idx in shards if len(idx)]
+        # map keeps the order of shards - and with it the order of rows
+        return _join_shap_values(list(pool.map(_kernel_worker_explain, shards)))
+
+    return explain, explainer.expected_value
+
+
+class Explainer:
+    """
+    Explanation of a model with respect to the reference (background) data.
+
+    Everything that does not depend on the explained rows - transformation
+    of the reference data, its summarization and construction of the
+    underlying explainer - is done once, when the object is created, so
+    that explaining a stream of (small) batches is cheap. The explanation
+    is deterministic: a row gets the same SHAP values in any batch.
+
+    Explainer that uses a pool of processes (n_jobs other than 1) must be
+    closed when it is no longer needed; it can be used as a context manager.
+
+    Parameters
+    ----------
+    model
+        Model which is explained.
+    reference_data
+        Background data for perturbation purposes
+    n_jobs
+        Number of processes that explain models with KernelExplainer; -1
+        means one process per CPU. Results do not depend on this number.
+    summary_method
+        The method that summarizes reference data for KernelSHAP; one of
+        SUMMARY_METHODS (see summarize_background).
+    kernel_n_samples
+        Number of coalitions that KernelSHAP evaluates per row.
+    approximate
+        Whether to approximate the explanation of tree models; see
+        supports_approximation.
+
+    Attributes
+    ----------
+    base_value
+        The base value (average prediction on reference data) for each class.
+    explain_all_rows
+        True when the explanation is exact and fast (linear models), so that
+        there is no need to explain just a sample of rows.
+    exact
+        False when SHAP values are estimated from sampled coalitions or
+        approximated.
+    evaluations_per_row
+        Number of model's evaluations needed to explain a row: the number of
+        coalitions times the size of background for KernelSHAP, and 1 for
+        other explainers.
+    background_summary
+        Summary of reference data (with the time that summarization took)
+        when the model is explained with KernelSHAP; otherwise None.
+    """
+    def __init__(
+        self,
+        model: Model,
+        reference_data: Table,
+        n_jobs: int = 1,
+        summary_method: str = SUMMARY_AUTO,
+        kernel_n_samples: int = KERNEL_N_SAMPLES,
+        approximate: bool = False,
+    ):
+        self.model = model
+        self.kernel_n_samples = kernel_n_samples
+        self.background_summary = None
+        self.exact = True
+        self.evaluations_per_row = 1
+        # size of batches adapted by _explain_in_batches, kept between calls
+        self._batch_size = 1
+        self._exit_stack = contextlib.ExitStack()
+        # ensure that explanations are same for the same data; the generator
+        # is local, so explainers in different threads do not interfere
+        rng = np.random.default_rng(0)
+        reference_data_transformed = self.transform(reference_data)
+        explain, base_value = _explain_linear(
+            model, reference_data_transformed
+        )
+        self.explain_all_rows = explain is not None
+        if explain is None:
+            explain, base_value = _explain_trees(
+                model, reference_data_transformed, approximate
+            )
+            self.exact = explain is None or not approximate \
+                or isinstance(model, TreeModel)
+        if explain is None:
+            self.background_summary = summarize_background(
+                reference_data_transformed, summary_method
+            )
+            explain, base_value = _explain_other_models(
+                model, self.background_summary, n_jobs, self._exit_stack,
+                kernel_n_samples, rng
             )
+            n_features = reference_data_transformed.X.shape[1]
+            n_coalitions = \
+                _n_kernel_coalitions(n_features, kernel_n_samples)
+            self.exact = n_coalitions >= 2 ** n_features - 2
+            # with a single feature, rows are explained by their predictions
+            self.evaluations_per_row = max(
+                n_coalitions * self.background_summary.data.shape[0], 1)
+            # the first batch already gives a row to each worker
+            self._batch_size = _n_workers(n_jobs)
+        self._explain = explain
+        # for regression use array with one value
+        if not isinstance(base_value, np.ndarray):
+            base_value = np.array([base_value])
+        self.base_value = base_value
+
+    def __enter__(self) -> "Explainer":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """ Release resources (the pool of processes), if any. """
+        self._exit_stack.close()
+
+    def transform(self, data: Table) -> Table:
+        """ Transform data to the domain in which the model is explained. """
+        return data_to_model_domain(self.model, data)
+
+    def shap_values(
+        self,
+        x: Union[np.ndarray, sparse.csr_matrix],
+        progress_callback: Callable = None,
+        out: Optional[np.ndarray] = None,
+        dtype: np.dtype = np.float64,
+    ) -> List[np.ndarray]:
+        """
+        Compute SHAP values for rows of transformed data. The result is a
+        list of arrays (num rows x num attributes), one for each class.
+
+        The values are written into out, an array of shape (num classes x
+        num rows x num attributes), and the arrays in the list are its views.
+        When out is not given, it is allocated with the given dtype.
+        """
+        if progress_callback is None:
+            progress_callback = dummy_callback
+        if out is None:
+            out = np.empty((len(self.base_value), *x.shape), dtype=dtype)
+        out, self._batch_size = _explain_in_batches(
+            self._explain, x, out, progress_callback,
+            batch_size=self._batch_size
         )
-    return (
-        _join_shap_values(shap_values),
-        sample_mask,
-        explainer.expected_value,
+        return list(out)
+
+    def explain(
+        self,
+        data: Table,
+        progress_callback: Callable = None,
+        dtype: np.dtype = np.float64,
+    ) -> List[np.ndarray]:
+        """
+        Compute SHAP values for all rows of data. The result is a list of
+        arrays (num rows x num attributes), one for each class.
+        """
+        return self.shap_values(
+            self.transform(data).X, progress_callback, dtype=dtype
+        )
+
+
+def _model_fingerprint(model: Model) -> Optional[str]:
+    """
+    Hash of the model that is the same in all processes, so that the disk
+    cache can be reused in later sessions; see stable_hash. Attributes that
+    do not affect the model's outputs are skipped: training data, and arrays
+    of TreeModel that are compiled from its nodes (and partially
+    uninitialized).
+    """
+    attributes = {
+        name: value for name, value in getattr(model, "__dict__", {}).items()
+        if name not in _MODEL_IGNORED_ATTRIBUTES
+    }
+    return stable_hash((type(model), attributes))
+
+
+def _model_hash(model: Model) -> Optional[str]:
+    try:
+        model_hash = _model_hashes[model]
+    except KeyError:
+        model_hash = _model_hashes[model] = _model_fingerprint(model)
+    except TypeError:  # model is not hashable or weakly referencable
+        model_hash = _model_fingerprint(model)
+    return model_hash
+
+
+def _shap_rows_key(
+    model: Model,
+    reference_data: Table,
+    summary_method: str,
+    dtype: np.dtype = np.float64,
+    approximate: bool = False,
+) -> Optional[str]:
+    """
+    Key of explained rows in shap_rows_cache; None when the model cannot be
+    pickled and thus cannot be fingerprinted.
+    """
+    model_hash = _model_hash(model)
+    if model_hash is None:
+        return None
+    params = (CACHE_VERSION, shap.__version__, KERNEL_N_SAMPLES,
+              summary_method, SUMMARY_N_CLUSTERS, SUMMARY_N_ROWS,
+              np.dtype(dtype).str, approximate)
+    return object_hash((model_hash, table_hash(reference_data), params))
+
+
+def _shap_cache_key(
+    model: Model,
+    data: Table,
+    reference_data: Table,
+    n_samples: Optional[int],
+    summary_method: str,
+    dtype: np.dtype = np.float64,
+    approximate: bool = False,
+) -> Optional[str]:
+    """
+    Key of the explanation in shap_memory_cache and shap_cache; None when
+    the model cannot be pickled and thus cannot be fingerprinted.
+    """
+    rows_key = _shap_rows_key(
+        model, reference_data, summary_method, dtype, approximate
     )
+    if rows_key is None:
+        return None
+    return object_hash((rows_key, table_hash(data), n_samples))
+
+
+def _find_rows(
+    known: Optional[Tuple[np.ndarray, np.ndarray]],
+    hashes: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find rows with the given hashes among known rows - sorted hashes and
+    SHAP values (num classes x num rows x num attributes) of rows explained
+    before. Return a mask of found rows and
+    their positions among known rows.
+    """
+    if known is None:
+        return np.zeros(len(hashes), dtype=bool), np.zeros(0, dtype=int)
+    known_hashes, _ = known
+    positions = np.searchsorted(known_hashes, hashes)
+    found = positions < len(known_hashes)
+    found[found] = known_hashes[positions[found]] == hashes[found]
+    return found, positions[found]
+
+
+def _merge_rows(
+    known: Optional[Tuple[np.ndarray, np.ndarray]],
+    hashes: np.ndarray,
+    shap_values: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Add rows with given hashes and SHAP values to known rows.
+    """
+    if known is not None:
+        known_hashes, known_values = known
+        hashes = np.hstack((known_hashes, hashes))
+        shap_values = np.concatenate((known_values, shap_values), axis=1)
+    hashes, idx = np.unique(hashes, return_index=True)
+    return hashes, shap_values[:, idx]
+
+
+def enable_disk_cache(enable: bool = True):
+    """
+    Enable or disable the persistent cache of SHAP values in SHAP_CACHE_DIR,
+    which reuses explanations across sessions. The cache stores explained
+    data, so disabling it also removes the stored values.
+    """
+    global shap_cache  # pylint: disable=global-statement
+    if enable:
+        if shap_cache is None:
+            shap_cache = DiskCache(SHAP_CACHE_DIR)
+    else:
+        DiskCache(SHAP_CACHE_DIR).clear()
+        shap_cache = None
+
+
+def is_explanation_cached(
+    model: Model,
+    data: Table,
+    reference_data: Table,
+    n_samples: Optional[int] = N_SAMPLES,
+    summary_method: str = SUMMARY_AUTO,
+    dtype: np.dtype = np.float64,
+    approximate: bool = False,
+) -> bool:
+    """
+    Whether compute_shap_values with these arguments returns an explanation
+    stored in shap_memory_cache or shap_cache, without computing it.
+    """
+    caches = [cache for cache in (shap_memory_cache, shap_cache)
+              if cache is not None]
+    if not caches:
+        return False
+    key = _shap_cache_key(model, data, reference_data, n_samples,
+                          summary_method, dtype, approximate)
+    return key is not None and any(key in cache for cache in caches)
+
+
+def _load_shap_values(
+    key: str,
+) -> Optional[Tuple[List[np.ndarray], np.ndarray, np.ndarray]]:
+    arrays = shap_cache.get(key)
+    if arrays is None:
+        return None
+    shap_values = list(arrays["shap_values"])
+    return shap_values, arrays["sample_mask"], arrays["base_value"]
+
+
+def _store_shap_values(
+    key: str,
+    shap_values: np.ndarray,
+    sample_mask: np.ndarray,
+    base_value: np.ndarray,
+):
+    shap_cache.put(key, dict(shap_values=shap_values,
+                             sample_mask=sample_mask, base_value=base_value))
 
 
 def compute_shap_values(
@@ -183,6 +1372,16 @@ def compute_shap_values(
     data: Table,
     reference_data: Table,
     progress_callback: Callable = None,
+    n_samples: Optional[int] = N_SAMPLES,
+    partial_result_callback: Callable = None,
+    n_jobs: int = 1,
+    use_cache: bool = True,
+    summary_method: str = SUMMARY_AUTO,
+    time_budget: Optional[float] = None,
+    max_evaluations: Optional[int] = None,
+    refined_result_callback: Callable = None,
+    dtype: np.dtype = np.float64,
+    approximate: bool = False,
 ) -> Tuple[List[np.ndarray], Table, np.ndarray, np.ndarray]:
     """
     Compute SHAP values - explanation for a model. And also give a transformed
@@ -198,6 +1397,47 @@ def compute_shap_values(
         Background data for perturbation purposes
     progress_callback
         The callback for reporting the progress.
+    n_samples
+        Number of randomly sampled rows that are explained. When None, all
+        rows in data are explained. Linear models are always explained on
+        all rows.
+    partial_result_callback
+        The callback that receives results for rows explained so far. Rows
+        are explained in chunks; after each chunk it is called with the chunk's
+        SHAP values, the transformed data, indices of the chunk's rows in the
+        transformed data and the base value.
+    n_jobs
+        Number of processes that explain models with KernelExplainer; -1
+        means one process per CPU. Results do not depend on this number.
+    use_cache
+        Whether to reuse results stored in shap_memory_cache and shap_cache
+        (and to store new results there). When another thread is computing
+        the same explanation, the call waits for its result. SHAP values of
+        rows that were already explained (with the same model and reference
+        data) are taken from shap_rows_cache.
+    summary_method
+        The method that summarizes reference data for KernelSHAP; one of
+        SUMMARY_METHODS (see summarize_background).
+    time_budget
+        When given (in seconds), the explanation is refined progressively:
+        the first, coarse explanation is computed for PROGRESSIVE_N_ROWS
+        rows, then each following one doubles the number of explained rows
+        (up to n_samples) and KernelSHAP's number of coalitions, as long as
+        the next refinement is expected to finish within the budget.
+    max_evaluations
+        When given, the explanation is refined progressively (as with
+        time_budget) as long as the total number of model's evaluations
+        (see Explainer.evaluations_per_row) stays within this limit.
+    refined_result_callback
+        The callback that receives each refined explanation: SHAP values,
+        the transformed data, the sample mask and the base value. Progressive
+        refinement does not use caches or partial_result_callback.
+    dtype
+        The type of stored SHAP values; np.float32 halves the memory.
+    approximate
+        Whether to approximate explanations of sci-kit tree models, which is
+        much faster than the exact explanation; see supports_approximation.
+        Progressive refinement does not approximate.
 
     Returns
     -------
@@ -206,7 +1446,9 @@ def compute_shap_values(
         result is a list of SHAP values for each class - the class order is
         taken from values in the class_var. Each array in the list has shape
         (num cases x num attributes) - explanation for the contribution of each
-         attribute to the final prediction.
+         attribute to the final prediction. The arrays are views of a single
+        contiguous array (num classes x num cases x num attributes), which
+        can be obtained with np.stack or from the base of the first array.
     data_transformed
         The table on which explanation was made: table preprocessed by models
         preprocessors
@@ -216,54 +1458,463 @@ def compute_shap_values(
     base_value
         The base value (average prediction on dataset) for each class.
     """
-    # ensure that sampling and SHAP value calculation is same for same data
-    with temp_seed(0):
-        if progress_callback is None:
-            progress_callback = dummy_callback
-        progress_callback(0, "Computing explanation ...")
+    if progress_callback is None:
+        progress_callback = dummy_callback
+    progress_callback(0, "Computing explanation ...")
+
+    data_transformed = data_to_model_domain(model, data)
+    # the reference data is often the explained table itself; the explainer
+    # then gets it already transformed (transforming it again is a no-op)
+    reference = data_transformed if reference_data is data else reference_data
+
+    if time_budget is not None or max_evaluations is not None:
+        shap_values, sample_mask, base_value = _refine_shap_values(
+            model, data_transformed, reference, progress_callback,
+            n_samples, refined_result_callback, n_jobs, summary_method,
+            time_budget, max_evaluations, dtype
+        )
+        progress_callback(1)
+        return shap_values, data_transformed, sample_mask, base_value
+
+    key = None
+    caches = (shap_cache, shap_memory_cache, shap_rows_cache)
+    if use_cache and any(cache is not None for cache in caches):
+        key = _shap_cache_key(
+            model, data, reference_data, n_samples, summary_method, dtype,
+            approximate
+        )
+
+    computed = False
 
-        data_transformed = model.data_to_model_domain(data)
-        reference_data_transformed = model.data_to_model_domain(reference_data)
+    def compute():
+        nonlocal computed
+        computed = True
+        return _compute_shap_values(
+            model, data_transformed, reference_data, reference, key,
+            progress_callback, n_samples, partial_result_callback, n_jobs,
+            summary_method, dtype, approximate
+        )
+
+    if key is None or shap_memory_cache is None:
+        shap_values, sample_mask, base_value = compute()
+    else:
+        shap_values, sample_mask, base_value = \
+            shap_memory_cache.get_or_compute(
+                key, compute,
+                wait_callback=lambda: progress_callback(
+                    0, "Waiting for explanation ..."
+                )
+            )
+        if not computed and partial_result_callback is not None:
+            partial_result_callback(shap_values, data_transformed,
+                                    np.flatnonzero(sample_mask), base_value)
+    progress_callback(1)
+    return shap_values, data_transformed, sample_mask, base_value
+
+
+def _compute_shap_values(
+    model: Model,
+    data_transformed: Table,
+    reference_data: Table,
+    reference: Table,
+    key: Optional[str],
+    progress_callback: Callable,
+    n_samples: Optional[int],
+    partial_result_callback: Optional[Callable],
+    n_jobs: int,
+    summary_method: str,
+    dtype: np.dtype,
+    approximate: bool,
+) -> Tuple[List[np.ndarray], np.ndarray, np.ndarray]:
+    cached = None
+    if key is not None and shap_cache is not None:
+        cached = _load_shap_values(key)
+    if cached is not None:
+        shap_values, sample_mask, base_value = cached
+        if partial_result_callback is not None:
+            partial_result_callback(shap_values, data_transformed,
+                                    np.flatnonzero(sample_mask), base_value)
+        return shap_values, sample_mask, base_value
+
+    hashes = row_hashes(data_transformed.X)
+    rows_key = known = None
+    if key is not None and shap_rows_cache is not None:
+        rows_key = _shap_rows_key(
+            model, reference_data, summary_method, dtype, approximate
+        )
+        known = shap_rows_cache.get(rows_key)
 
-        shap_values, sample_mask, base_value = _explain_trees(
-            model,
+    with Explainer(model, reference, n_jobs, summary_method,
+                   approximate=approximate) as explainer:
+        base_value = explainer.base_value
+        sample_mask = _subsample_data(
             data_transformed,
-            reference_data_transformed,
-            progress_callback,
+            None if explainer.explain_all_rows else n_samples,
+            hashes
         )
-        if shap_values is None:
-            shap_values, sample_mask, base_value = _explain_other_models(
-                model,
-                data_transformed,
-                reference_data_transformed,
-                progress_callback,
+
+        # rows explained before are taken from known rows
+        row_indices = np.flatnonzero(sample_mask)
+        found, positions = _find_rows(known, hashes[row_indices])
+        shap_values = np.empty(
+            (len(base_value), len(row_indices), data_transformed.X.shape[1]),
+            dtype=dtype
+        )
+        if known is not None:
+            shap_values[:, found] = known[1][:, positions]
+
+        # chunks are formed from all sampled rows to keep the order of
+        # partial results; only new rows in them are explained
+        n_new, n_done, start = np.sum(~found), 0, 0
+        for chunk in _chunks(row_indices):
+            chunk_slice = slice(start, start + len(chunk))
+            start += len(chunk)
+            new = ~found[chunk_slice]
+            if new.any():
+                cb = wrap_callback(
+                    progress_callback,
+                    start=n_done / n_new,
+                    end=(n_done + new.sum()) / n_new,
+                )
+                if new.all():
+                    # explain directly into the result
+                    explainer.shap_values(
+                        data_transformed.X[chunk], cb,
+                        out=shap_values[:, chunk_slice]
+                    )
+                else:
+                    chunk_values = explainer.shap_values(
+                        data_transformed.X[chunk[new]], cb, dtype=dtype
+                    )
+                    shap_values[:, chunk_slice][:, new] = chunk_values
+                n_done += new.sum()
+            if partial_result_callback is not None:
+                partial_result_callback(
+                    list(shap_values[:, chunk_slice]),
+                    data_transformed, chunk, base_value
+                )
+
+    if rows_key is not None and n_new:
+        shap_rows_cache.put(rows_key, _merge_rows(
+            known, hashes[row_indices][~found], shap_values[:, ~found]
+        ))
+    if key is not None and shap_cache is not None:
+        _store_shap_values(key, shap_values, sample_mask, base_value)
+    return list(shap_values), sample_mask, base_value
+
+
+def _refine_shap_values(
+    model: Model,
+    data_transformed: Table,
+    reference_data: Table,
+    progress_callback: Callable,
+    n_samples: Optional[int],
+    refined_result_callback: Optional[Callable],
+    n_jobs: int,
+    summary_method: str,
+    time_budget: Optional[float],
+    max_evaluations: Optional[int],
+    dtype: np.dtype,
+) -> Tuple[List[np.ndarray], np.ndarray, np.ndarray]:
+    """
+    Explain data progressively; see compute_shap_values.
+    """
+    start_time = time.perf_counter()
+    hashes = row_hashes(data_transformed.X)
+    max_rows = len(data_transformed) if n_samples is None \
+        else min(n_samples, len(data_transformed))
+    n_rows = min(PROGRESSIVE_N_ROWS, max_rows)
+    kernel_n_samples = KERNEL_N_SAMPLES
+    evaluations = 0
+
+    def used_budget():
+        used = 0
+        if time_budget is not None:
+            used = (time.perf_counter() - start_time) / max(time_budget, 1e-9)
+        if max_evaluations is not None:
+            used = max(used, evaluations / max(max_evaluations, 1))
+        return min(used, 1)
+
+    explainer = None
+    try:
+        while True:
+            if explainer is None or \
+                    kernel_n_samples != explainer.kernel_n_samples:
+                if explainer is not None:
+                    explainer.close()
+                explainer = Explainer(model, reference_data, n_jobs,
+                                      summary_method, kernel_n_samples)
+                if explainer.explain_all_rows:
+                    n_rows = max_rows = len(data_transformed)
+                # rows explained by the current explainer
+                explained = np.zeros(len(data_transformed), dtype=bool)
+                shap_values = np.zeros(
+                    (len(explainer.base_value), *data_transformed.X.shape),
+                    dtype=dtype
+                )
+
+            # samples of increasing size are nested (see _subsample_data)
+            sample_mask = _subsample_data(data_transformed, n_rows, hashes)
+            new = sample_mask & ~explained
+            round_time = time.perf_counter()
+            progress = used_budget()
+            shap_values[:, new] = explainer.shap_values(
+                data_transformed.X[new],
+                wrap_callback(progress_callback, start=progress, end=progress),
+                dtype=dtype
             )
+            round_time = time.perf_counter() - round_time
+            explained |= new
+            round_evaluations = new.sum() * explainer.evaluations_per_row
+            evaluations += round_evaluations
+
+            result = list(shap_values[:, sample_mask]), sample_mask, \
+                explainer.base_value
+            if refined_result_callback is not None:
+                refined_result_callback(result[0], data_transformed,
+                                        *result[1:])
+            progress_callback(used_budget())
+
+            # the next refinement: more rows and more coalitions
+            if n_rows == max_rows and explainer.exact:
+                break
+            next_rows = min(2 * n_rows, max_rows)
+            if explainer.exact:
+                # only new rows are explained
+                next_evaluations = \
+                    (next_rows - n_rows) * explainer.evaluations_per_row
+            else:
+                # all rows are explained again with twice as many coalitions
+                next_evaluations = \
+                    next_rows * 2 * explainer.evaluations_per_row
+            if max_evaluations is not None and \
+                    evaluations + next_evaluations > max_evaluations:
+                break
+            if time_budget is not None and round_evaluations:
+                expected_time = \
+                    next_evaluations * round_time / round_evaluations
+                if time.perf_counter() - start_time + expected_time \
+                        > time_budget:
+                    break
+            n_rows = next_rows
+            if not explainer.exact:
+                kernel_n_samples *= 2
+    finally:
+        if explainer is not None:
+            explainer.close()
+    return result
+
+
+class ShapInteractions(SimpleNamespace):
+    # mean absolute interaction values (num classes x num attributes x
+    # num attributes); the diagonal holds main effects and the interaction
+    # of a pair is split equally between its two symmetric entries
+    mean_abs: Optional[np.ndarray] = None
+    # the strongest interactions of explained rows: indices of attribute
+    # pairs (num classes x num rows x k x 2) and interactions of pairs
+    # (num classes x num rows x k)
+    top_pairs: Optional[np.ndarray] = None
+    top_values: Optional[np.ndarray] = None
+    # mask of explained rows in the transformed data
+    sample_mask: Optional[np.ndarray] = None
+    names: Optional[List[str]] = None
+
+
+def supports_interactions(model: Model) -> bool:
+    """
+    Whether SHAP interaction values of the model can be computed with
+    compute_shap_interactions: sci-kit models based on trees, which are
+    explained by TreeExplainer without background data, as when the
+    explanation is approximated. Orange's trees are explained by
+    _OrangeTreeShap, which does not compute interactions.
+    """
+    return supports_approximation(model)
 
-        # for regression return array with one value
-        if not isinstance(base_value, np.ndarray):
-            base_value = np.array([base_value])
 
-        progress_callback(1)
-    return shap_values, data_transformed, sample_mask, base_value
+def compute_shap_interactions(
+    model: Model,
+    data: Table,
+    progress_callback: Callable = None,
+    n_samples: Optional[int] = N_SAMPLES,
+    n_top: int = N_TOP_INTERACTIONS,
+) -> ShapInteractions:
+    """
+    Compute SHAP interaction values of a tree model.
+
+    Interaction values of all rows would take num rows x num attributes^2
+    values, so rows are explained in chunks and only aggregates are kept:
+    mean absolute interactions of all pairs and the strongest interactions
+    of each row. The memory thus does not grow with the square of the
+    number of attributes times the number of rows.
+
+    Parameters
+    ----------
+    model
+        Tree model (supported by shap's TreeExplainer) which is explained.
+    data
+        Data to be explained.
+    progress_callback
+        The callback for reporting the progress.
+    n_samples
+        Number of sampled rows that are explained (the same rows as in
+        compute_shap_values). When None, all rows in data are explained.
+    n_top
+        Number of the strongest interactions kept for each row.
+
+    Returns
+    -------
+    Interactions; see ShapInteractions.
+    """
+    if progress_callback is None:
+        progress_callback = dummy_callback
+    progress_callback(0, "Computing interactions ...")
+
+    skl_model = getattr(model, "skl_model", None)
+    try:
+        # interactions are only supported for path dependent explanations,
+        # which need no background data
+        explainer = TreeExplainer(skl_model)
+    # I know it is too broad but this is what TreeExplainer trows
+    except Exception:
+        raise ValueError("Interactions can only be computed for tree models "
+                         "supported by TreeExplainer.")
+    arrange, base_value = _arrange_tree_classes(
+        model, explainer.expected_value
+    )
+    n_classes = np.size(base_value)
+
+    data_transformed = data_to_model_domain(model, data)
+    x = data_transformed.X
+    n_attrs = x.shape[1]
+    sample_mask = _subsample_data(
+        data_transformed, n_samples, row_hashes(x)
+    )
+    row_indices = np.flatnonzero(sample_mask)
+
+    pairs = np.array(np.triu_indices(n_attrs, 1)).T
+    n_top = min(n_top, len(pairs))
+    sum_abs = np.zeros((n_classes, n_attrs, n_attrs))
+    top_pairs = np.empty((n_classes, len(row_indices), n_top, 2), dtype=int)
+    top_values = np.empty((n_classes, len(row_indices), n_top))
+
+    # chunks grow as in _chunks, but their interactions must fit into
+    # MAX_INTERACTION_SIZE values
+    max_size = max(1, MAX_INTERACTION_SIZE // (n_classes * n_attrs ** 2))
+    start, size = 0, min(CHUNK_SIZE, max_size)
+    while start < len(row_indices):
+        progress_callback(start / len(row_indices))
+        chunk_slice = slice(start, start + size)
+        chunk = row_indices[chunk_slice]
+        start += size
+        size = min(2 * size, MAX_CHUNK_SIZE, max_size)
+        x_chunk = x[chunk]
+        if sparse.issparse(x_chunk):
+            x_chunk = x_chunk.toarray()
+        values = arrange(explainer.shap_interaction_values(x_chunk))
+        for c, class_values in enumerate(values):
+            sum_abs[c] += np.abs(class_values).sum(axis=0)
+            if not n_top:
+                continue
+            # interaction of a pair is the sum of its symmetric entries
+            pair_values = class_values[:, pairs[:, 0], pairs[:, 1]] \
+                + class_values[:, pairs[:, 1], pairs[:, 0]]
+            abs_values = np.abs(pair_values)
+            top = np.argpartition(-abs_values, n_top - 1, axis=1)[:, :n_top]
+            order = np.argsort(
+                -np.take_along_axis(abs_values, top, axis=1), axis=1
+            )
+            top = np.take_along_axis(top, order, axis=1)
+            top_pairs[c, chunk_slice] = pairs[top]
+            top_values[c, chunk_slice] = \
+                np.take_along_axis(pair_values, top, axis=1)
+
+    progress_callback(1)
+    return ShapInteractions(
+        mean_abs=sum_abs / max(len(row_indices), 1),
+        top_pairs=top_pairs,
+        top_values=top_values,
+        sample_mask=sample_mask,
+        names=[a.name for a in data_transformed.domain.attributes],
+    )
+
+
+def get_interactions_table(
+    interactions: ShapInteractions, target_index: int = 0
+) -> Table:
+    """
+    Construct a table with mean absolute interactions of attribute pairs for
+    the target class, ordered from the strongest to the weakest.
+    """
+    names = interactions.names
+    pairs = np.array(np.triu_indices(len(names), 1)).T
+    mean_abs = interactions.mean_abs[target_index]
+    scores = mean_abs[pairs[:, 0], pairs[:, 1]] \
+        + mean_abs[pairs[:, 1], pairs[:, 0]]
+    order = np.argsort(-scores, kind="stable")
+    pairs, scores = pairs[order], scores[order]
+
+    domain = Domain([ContinuousVariable("Score")],
+                    metas=[StringVariable("Feature 1"),
+                           StringVariable("Feature 2")])
+    table = Table.from_numpy(
+        domain, scores[:, None],
+        metas=np.array(names, dtype=object)[pairs].reshape(-1, 2)
+    )
+    table.name = "Feature Interactions"
+    return table
+
+
+def _column_statistics(
+    values: np.ndarray, percentiles: Tuple[float, ...]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compute percentiles, minima and maxima of columns, ignoring missing
+    values, from a single sort of the data. Percentiles are interpolated
+    linearly, exactly as by np.nanpercentile.
+
+    Returns
+    -------
+    An array of percentiles with a row for each percentile, and arrays of
+    minima and maxima. Statistics of columns without values are nan.
+    """
+    n_cols = values.shape[1]
+    if len(values) == 0:
+        nans = np.full(n_cols, np.nan)
+        return np.tile(nans, (len(percentiles), 1)), nans, nans.copy()
+
+    # missing values are sorted to the end of columns
+    sorted_ = np.sort(values, axis=0)
+    n = len(values) - np.count_nonzero(np.isnan(sorted_), axis=0)
+    last = np.maximum(n - 1, 0)
+    columns = np.arange(n_cols)
+
+    virtual = last * (np.array(percentiles, dtype=float)[:, None] / 100)
+    previous = np.floor(virtual)
+    gamma = virtual - previous
+    previous = previous.astype(int)
+    a = sorted_[previous, columns]
+    b = sorted_[np.minimum(previous + 1, last), columns]
+    # the same interpolation as numpy's, which is more precise when the
+    # value is closer to b
+    diff = b - a
+    quantiles = a + diff * gamma
+    upper = gamma >= 0.5
+    quantiles[upper] = (b - diff * (1 - gamma))[upper]
+    return quantiles, sorted_[0], sorted_[last, columns]
 
 
 def _get_min_max(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
     """
     Compute min and max bases for each column in the data. This are not real
-    min or max values but values at 5/95 percentile.
+    min or max values but values at 5/95 percentile. When they are equal,
+    the real minimum and maximum are used.
     """
-    vmin = np.nanpercentile(values, 5, axis=0)
-    vmax = np.nanpercentile(values, 95, axis=0)
+    (vmin, vmax), min_, max_ = _column_statistics(values, (5, 95))
 
     # fix where equal
     equals = vmin == vmax
-    vmin[equals] = np.nanpercentile(values[:, equals], 1, axis=0)
-    vmax[equals] = np.nanpercentile(values[:, equals], 1, axis=0)
-
-    # fix where still equal
-    equals = vmin == vmax
-    vmin[equals] = np.min(values[:, equals], axis=0)
-    vmax[equals] = np.max(values[:, equals], axis=0)
+    vmin[equals] = min_[equals]
+    vmax[equals] = max_[equals]
 
     # fix where vmin higher than vmax - rare numerical precision issues
     greater = vmin > vmax
@@ -274,6 +1925,27 @@ def _get_min_max(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
     return vmin, vmax
 
 
+def _color_bounds(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Bounds for normalization of colors of columns; see _get_min_max. Bounds
+    are kept in color_bounds_cache, so colors of the same data are
+    normalized without recomputing them. When MAX_QUANTILE_ROWS is set,
+    bounds of taller data are computed from a sample of that many rows.
+    """
+    if MAX_QUANTILE_ROWS is not None and len(values) > MAX_QUANTILE_ROWS:
+        rng = np.random.default_rng(0)
+        values = values[np.sort(
+            rng.choice(len(values), MAX_QUANTILE_ROWS, replace=False))]
+    if color_bounds_cache is None:
+        return _get_min_max(values)
+    key = ("bounds", array_hash(values))
+    vmin, vmax = color_bounds_cache.get_or_compute(
+        key, partial(_get_min_max, values)
+    )
+    # callers may modify the arrays
+    return vmin.copy(), vmax.copy()
+
+
 def compute_colors(data: Table) -> np.ndarray:
     """
     Compute colors which represent how high is a value comparing to other
@@ -288,56 +1960,63 @@ def compute_colors(data: Table) -> np.ndarray:
     -------
     Colors for each data instance and each feature. The shape of the matrix is
     M x N x C, where M is a number of instances, N is a number of features, and
-    C is 3 (one value for each RGB channel).
+    C is 3 (one value for each RGB channel). Colors are of type np.uint8.
     """
-
-    def continuous_colors(x):
-        min_, max_ = _get_min_max(x)
-        x = x.copy()
-        for i in range(len(max_)):
-            x[x[:, i] > max_[i], i] = max_[i]
-            x[x[:, i] < min_[i], i] = min_[i]
-        normalized_x = (x - min_) / (max_ - min_)
-        # when max_ and min_ completely same use average color
-        normalized_x[:, max_ == min_] = 0.5
-
-        v = [normalized_x * (b - a) + a for (a, b) in zip(RGB_LOW, RGB_HIGH)]
-        cont_colors = np.dstack(v)
-
-        # missing values are imputed as gray
-        return cont_colors
-
-    def discrete_colors(x, attributes):
-        disc_colors = np.zeros(x.shape + (3,))
-        for i, a in enumerate(attributes):
-            nonnan = ~np.isnan(x[:, i])
-            colors = (
-                a.colors
-                if hasattr(a, "colors")
-                else LimitedDiscretePalette(len(a.values)).palette
-            )
-            disc_colors[nonnan, i] = colors[x[nonnan, i].astype(int)]
-        return disc_colors
-
-    # the final array is dense and we do not expect huge matrices here
-    values = data.X.toarray() if sparse.issparse(data.X) else data.X
-    colors = np.zeros(values.shape + (3,), dtype=float)
+    x = data.X
+    colors = np.zeros(x.shape + (3,), dtype=np.uint8)
     is_discrete = np.array(
         [a.is_discrete for a in data.domain.attributes], dtype=bool
     )
-
-    colors[:, ~is_discrete] = continuous_colors(values[:, ~is_discrete])
-    colors[:, is_discrete] = discrete_colors(
-        values[:, is_discrete],
-        [a for a in data.domain.attributes if a.is_discrete],
-    )
-
-    colors[np.isnan(colors)] = 100
-    return colors.astype(int)
+    continuous = np.flatnonzero(~is_discrete)
+
+    if len(continuous):
+        # the final array is dense and we do not expect huge matrices here
+        values = x[:, continuous]
+        if sparse.issparse(values):
+            values = values.toarray()
+        min_, max_ = _color_bounds(values)
+        # when max_ and min_ completely same use average color
+        equal = max_ == min_
+        low, high = np.array(RGB_LOW, float), np.array(RGB_HIGH, float)
+        # rows are colored in chunks to bound the size of intermediate
+        # float arrays
+        size = max(1, MAX_DENSE_SIZE // (3 * len(continuous)))
+        for start in range(0, len(values), size):
+            chunk = np.clip(values[start : start + size], min_, max_)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                normalized = (chunk - min_) / (max_ - min_)
+            normalized[:, equal] = 0.5
+            rgb = normalized[:, :, None] * (high - low) + low
+            # missing values are imputed as gray
+            rgb[np.isnan(rgb)] = 100
+            # truncated, as by conversion to int
+            colors[start : start + size, continuous] = rgb
+
+    for i in np.flatnonzero(is_discrete):
+        a = data.domain.attributes[i]
+        column = x[:, i]
+        if sparse.issparse(column):
+            column = column.toarray()
+        column = np.asarray(column).ravel()
+        nonnan = ~np.isnan(column)
+        palette = (
+            a.colors
+            if hasattr(a, "colors")
+            else LimitedDiscretePalette(len(a.values)).palette
+        )
+        colors[nonnan, i] = palette[column[nonnan].astype(int)]
+    return colors
 
 
 def get_shap_values_and_colors(
-    model: Model, data: Table, progress_callback: Callable = None
+    model: Model,
+    data: Table,
+    progress_callback: Callable = None,
+    n_samples: Optional[int] = N_SAMPLES,
+    partial_result_callback: Callable = None,
+    approximate: bool = False,
+    time_budget: Optional[float] = None,
+    refined_result_callback: Callable = None,
 ) -> Tuple[List[np.ndarray], List[str], np.ndarray, np.ndarray]:
     """
     Compute SHAP values and colors that represent how high is the feature value
@@ -352,6 +2031,23 @@ def get_shap_values_and_colors(
         Data, which's prediction is explained.
     progress_callback
         The callback for reporting the progress.
+    n_samples
+        Number of randomly sampled rows that are explained. When None, all
+        rows in data are explained.
+    partial_result_callback
+        The callback that receives results for each chunk of explained rows:
+        the chunk's SHAP values, attributes, indices of the chunk's rows in
+        data and colors of these rows.
+    approximate
+        Whether to approximate explanations of tree models; see
+        compute_shap_values.
+    time_budget
+        When given (in seconds), the explanation is refined progressively
+        within the budget; see compute_shap_values.
+    refined_result_callback
+        The callback that receives each refined explanation (when
+        time_budget is given): SHAP values, attributes, the sample mask and
+        colors of explained rows.
 
     Returns
     -------
@@ -376,8 +2072,38 @@ def get_shap_values_and_colors(
         progress_callback = dummy_callback
     cb = wrap_callback(progress_callback, end=0.9)
 
+    partial_cb = None
+    if partial_result_callback is not None:
+        def partial_cb(shap_values_, transformed_data_, row_indices, _):
+            # colors of a chunk are normalized on the chunk only, the final
+            # result has colors normalized on all explained rows
+            partial_result_callback(
+                shap_values_,
+                [t.name for t in transformed_data_.domain.attributes],
+                row_indices,
+                compute_colors(transformed_data_[row_indices]),
+            )
+
+    refined_cb = None
+    if refined_result_callback is not None:
+        def refined_cb(shap_values_, transformed_data_, sample_mask_, _):
+            refined_result_callback(
+                shap_values_,
+                [t.name for t in transformed_data_.domain.attributes],
+                sample_mask_,
+                compute_colors(transformed_data_[sample_mask_]),
+            )
+
     shap_values, transformed_data, sample_mask, _ = compute_shap_values(
-        model, data, data, progress_callback=cb
+        model,
+        data,
+        data,
+        progress_callback=cb,
+        n_samples=n_samples,
+        partial_result_callback=partial_cb,
+        approximate=approximate,
+        time_budget=time_budget,
+        refined_result_callback=refined_cb,
     )
 
     colors = compute_colors(transformed_data[sample_mask])
@@ -392,6 +2118,10 @@ def explain_predictions(
     data: Table,
     background_data: Table,
     progress_callback: Callable = None,
+    n_samples: Optional[int] = N_SAMPLES,
+    partial_result_callback: Callable = None,
+    time_budget: Optional[float] = None,
+    refined_result_callback: Callable = None,
 ) -> Tuple[List[np.ndarray], np.ndarray, Table, np.ndarray, np.ndarray]:
     """
     Compute SHAP values and predictions for each item in data.
@@ -409,6 +2139,21 @@ def explain_predictions(
         SHAP used them in the perturbation process.
     progress_callback
         Callback to report progress.
+    n_samples
+        Number of randomly sampled rows that are explained. When None, all
+        rows in data are explained.
+    partial_result_callback
+        The callback that receives results for each chunk of explained rows:
+        the chunk's SHAP values, predictions for the chunk's rows, the
+        transformed data, indices of the chunk's rows in it and the base value.
+    time_budget
+        When given (in seconds), the explanation is refined progressively
+        within the budget; see compute_shap_values.
+    refined_result_callback
+        The callback that receives each refined explanation (when
+        time_budget is given): SHAP values, predictions (for all rows; NaN
+        for rows of additive models that are not explained yet), the
+        transformed data, the sample mask and the base value.
 
     Returns
     -------
@@ -422,7 +2167,9 @@ def explain_predictions(
         num_cases X num_classes array with predictions/probabilities from the
         model for each case. In the case of classification, each column is a
         probability for each class. For regression, the number of columns is 1
-        and the result is prediction itself.
+        and the result is prediction itself. Linear classifiers are explained
+        in the space of log-odds, so their predictions are values of the
+        decision function (see explanation_space).
     transformed_data
         Table on which explanation was made: table preprocessed by models
         preprocessors
@@ -436,36 +2183,186 @@ def explain_predictions(
         progress_callback = dummy_callback
     progress_callback(0)
 
-    # prediction happens independent from the class -
-    # same than for prediction widget
-    classless_data = data.transform(
-        Domain(data.domain.attributes, None, data.domain.metas)
-    )
-    predictions = model(
-        classless_data,
-        model.Probs if model.domain.class_var.is_discrete else model.Value,
-    )
-    # for regression - predictions array is 1d transform it shape N x 1
-    if predictions.ndim == 1:
-        predictions = predictions[:, None]
+    # data is transformed once; both, predictions and explanations are
+    # computed on the transformed table
+    transformed_data = data_to_model_domain(model, data)
+    if background_data is data:
+        background_data = transformed_data
+
+    coef, intercept = _linear_coefficients(model) \
+        if explanation_space(model) is not None else (None, None)
+
+    def predict(table: Table) -> np.ndarray:
+        if coef is not None:
+            # linear classifiers are explained in the space of log-odds
+            return np.asarray(table.X @ coef.T) + intercept
+        # prediction happens independent from the class -
+        # same than for prediction widget
+        pred = model(
+            table,
+            model.Probs if model.domain.class_var.is_discrete else model.Value,
+        )
+        # for regression - predictions array is 1d transform it shape N x 1
+        return pred[:, None] if pred.ndim == 1 else pred
+
+    def additive_predictions(shap_values_, base_value_):
+        return base_value_ + np.stack([v.sum(axis=1) for v in shap_values_],
+                                      axis=1)
+
+    # predictions of explained rows of trees are sums of SHAP values
+    additive = _is_additive_tree(model)
+    predictions = None if additive else predict(transformed_data)
+
+    partial_cb = None
+    if partial_result_callback is not None:
+        def partial_cb(shap_values_, transformed_data_, row_indices, base_value_):
+            if additive:
+                pred = additive_predictions(shap_values_, base_value_)
+            else:
+                pred = predictions[row_indices]
+            partial_result_callback(shap_values_, pred, transformed_data_,
+                                    row_indices, base_value_)
+
+    refined_cb = None
+    if refined_result_callback is not None:
+        def refined_cb(shap_values_, transformed_data_, sample_mask_,
+                       base_value_):
+            if additive:
+                pred = np.full((len(transformed_data_), len(base_value_)),
+                               np.nan)
+                pred[sample_mask_] = \
+                    additive_predictions(shap_values_, base_value_)
+            else:
+                pred = predictions
+            refined_result_callback(shap_values_, pred, transformed_data_,
+                                    sample_mask_, base_value_)
 
     shap_values, transformed_data, sample_mask, base_value = \
-        compute_shap_values(model, data, background_data, progress_callback)
+        compute_shap_values(model, transformed_data, background_data,
+                            progress_callback, n_samples, partial_cb,
+                            time_budget=time_budget,
+                            refined_result_callback=refined_cb)
+    if additive:
+        predictions = np.empty((len(transformed_data), len(base_value)))
+        predictions[sample_mask] = \
+            additive_predictions(shap_values, base_value)
+        if not sample_mask.all():
+            predictions[~sample_mask] = predict(transformed_data[~sample_mask])
     return shap_values, predictions, transformed_data, sample_mask, base_value
 
 
-def _compute_segments(
-    shap_valus: np.ndarray, prediction: float
-) -> List[Tuple[float, float]]:
+def _top_features(abs_values: np.ndarray, n: int) -> np.ndarray:
     """
-    Compute starting and ending point of the segment on y-asis.
+    Indices of n features with the highest absolute SHAP values in each row,
+    sorted by decreasing absolute values; among equal values, features with
+    higher indices come first.
     """
-    curr = prediction
-    segments = []
-    for sh in shap_valus:
-        segments.append((curr, curr - sh))
-        curr -= sh
-    return segments
+    n_rows, n_features = abs_values.shape
+    n = min(n, n_features)
+    if n < n_features:
+        # the n-th highest value in each row; all higher values are selected
+        # and the remaining places are filled with the last equal values
+        kth = np.partition(abs_values, n_features - n, axis=1)[
+            :, n_features - n, None
+        ]
+        selected = abs_values > kth
+        ties = abs_values == kth
+        missing = n - np.count_nonzero(selected, axis=1)
+        from_end = np.cumsum(ties[:, ::-1], axis=1)[:, ::-1]
+        selected |= ties & (from_end <= missing[:, None])
+        indices = np.nonzero(selected)[1].reshape(n_rows, n)
+    else:
+        indices = np.tile(np.arange(n_features), (n_rows, 1))
+    order = np.lexsort(
+        (-indices, -np.take_along_axis(abs_values, indices, axis=1)), axis=1
+    )
+    return np.take_along_axis(indices, order, axis=1)
+
+
+def _force_plot_rows(
+    shap_values: np.ndarray,
+    x: np.ndarray,
+    predictions: np.ndarray,
+    names: List[str],
+    top_n_features: int,
+) -> Iterator[Tuple[Tuple, Tuple, Tuple, Tuple]]:
+    """
+    Compute force plot data (SHAP values, segments, labels and the range;
+    see prepare_force_plot_data) for each row in shap_values. Predictions
+    are predictions for the target class.
+    """
+    top = _top_features(np.abs(shap_values), top_n_features)
+    values = np.take_along_axis(shap_values, top, axis=1)
+    pred = predictions[:, None]
+    # ends of segments: the prediction minus cumulative SHAP values; adding
+    # the negated values gives the same results as consecutive subtraction
+    pos_ends = np.cumsum(np.hstack((pred, -np.maximum(values, 0))), axis=1)
+    neg_ends = np.cumsum(np.hstack((pred, -np.minimum(values, 0))), axis=1)
+
+    # rows are assembled from lists, which is faster than indexing arrays
+    for vals, features, xs, pos_e, neg_e in zip(
+            values.tolist(), top.tolist(),
+            np.take_along_axis(x, top, axis=1).tolist(),
+            pos_ends.tolist(), neg_ends.tolist()):
+        pos = [k for k, v in enumerate(vals) if v > 0]
+        neg = [k for k, v in enumerate(vals) if v < 0]
+        # segments start at the prediction and end at cumulative sums
+        pos_e = [pos_e[0]] + [pos_e[k + 1] for k in pos]
+        neg_e = [neg_e[0]] + [neg_e[k + 1] for k in neg]
+        yield (
+            ([vals[k] for k in pos], [vals[k] for k in neg]),
+            (list(zip(pos_e[:-1], pos_e[1:])),
+             list(zip(neg_e[:-1], neg_e[1:]))),
+            ([(names[features[k]], xs[k]) for k in pos],
+             [(names[features[k]], xs[k]) for k in neg]),
+            (pos_e[-1], neg_e[-1]),
+        )
+
+
+class ForcePlotRows:
+    """
+    Data for force plots of rows, prepared only for rows that are requested;
+    see prepare_force_plot_data for the description of arguments. Items are
+    tuples with SHAP values, segments, labels and the range of a row, so
+    preparing a single row takes time proportional to the number of features.
+    """
+    def __init__(
+        self,
+        shap_values: List[np.ndarray],
+        transformed_data: Table,
+        predictions: np.ndarray,
+        target_class: int,
+        top_n_features: Optional[int] = None,
+    ):
+        self.shap_values = shap_values[target_class]
+        self.x = transformed_data.X
+        self.predictions = np.asarray(predictions)[:, target_class]
+        self.names = [a.name for a in transformed_data.domain.attributes]
+        self.top_n_features = top_n_features \
+            if top_n_features is not None else self.shap_values.shape[1]
+
+    def __len__(self) -> int:
+        return len(self.shap_values)
+
+    def __getitem__(self, index: int) -> Tuple[Tuple, Tuple, Tuple, Tuple]:
+        index = range(len(self))[index]
+        return next(self.rows(slice(index, index + 1)))
+
+    def rows(
+        self, rows: slice = slice(None)
+    ) -> Iterator[Tuple[Tuple, Tuple, Tuple, Tuple]]:
+        """
+        Force plot data of a range of rows, computed together.
+        """
+        # data may have more rows than shap_values
+        rows = slice(*rows.indices(len(self)))
+        x = self.x[rows]
+        if sparse.issparse(x):
+            x = x.toarray()
+        return _force_plot_rows(
+            self.shap_values[rows], x, self.predictions[rows],
+            self.names, self.top_n_features
+        )
 
 
 def prepare_force_plot_data(
@@ -477,7 +2374,7 @@ def prepare_force_plot_data(
 ) -> Tuple[List[Tuple], List[Tuple], List[Tuple], List[Tuple]]:
     """
     Prepare data for a force plot. It select top_n_features most important
-    features.
+    features. Use ForcePlotRows to prepare data only for some rows.
 
     Parameters
     ----------
@@ -514,53 +2411,43 @@ def prepare_force_plot_data(
     ranges
         Range of the graph for each data item.
     """
-    shap_values = shap_values[target_class]
-    if top_n_features is None:
-        top_n_features = shap_values.shape[1]
-
-    top_features_idx = np.fliplr(np.argsort(np.abs(shap_values), axis=1),)[
-        :, :top_n_features
-    ]
+    rows = ForcePlotRows(shap_values, transformed_data, predictions,
+                         target_class, top_n_features)
+    selected_shap_values, segments, selected_labels, ranges = [], [], [], []
+    for start in range(0, len(rows), MAX_CHUNK_SIZE):
+        for values, segments_, labels, range_ in rows.rows(
+                slice(start, start + MAX_CHUNK_SIZE)):
+            selected_shap_values.append(values)
+            segments.append(segments_)
+            selected_labels.append(labels)
+            ranges.append(range_)
+    return selected_shap_values, segments, selected_labels, ranges
 
-    assert top_features_idx.shape == (
-        len(shap_values),
-        min(shap_values.shape[1], top_n_features),
-    )
 
-    data_attributes = transformed_data.domain.attributes
+def _similarity_ordering(x: np.ndarray) -> np.ndarray:
+    """
+    Order rows so that similar rows are close to each other.
 
-    selected_shap_values = []
-    selected_labels = []
-    segments = []
-    ranges = []
-    for sv, tfi, dat, pred in zip(
-        shap_values, top_features_idx, transformed_data, predictions
-    ):
-        positive_idx = tfi[sv[tfi] > 0]
-        negative_ids = tfi[sv[tfi] < 0]
-        selected_shap_values.append(
-            (sv[positive_idx].tolist(), sv[negative_ids].tolist())
-        )
-        selected_labels.append(
-            (
-                [(data_attributes[i].name, dat.x[i]) for i in positive_idx],
-                [(data_attributes[i].name, dat.x[i]) for i in negative_ids],
-            )
-        )
-        pos_segments = _compute_segments(sv[positive_idx], pred[target_class])
-        neg_segments = _compute_segments(sv[negative_ids], pred[target_class])
-        segments.append((pos_segments, neg_segments))
-        ranges.append(
-            (
-                pos_segments[-1][1]
-                if len(pos_segments)
-                else pred[target_class],
-                neg_segments[-1][1]
-                if len(neg_segments)
-                else pred[target_class],
-            )
-        )
-    return selected_shap_values, segments, selected_labels, ranges
+    At most MAX_HCLUST_ROWS rows are ordered by hierarchical clustering.
+    For larger data, a sample of rows is ordered by clustering and each
+    remaining row is put next to the closest sampled row. Rows assigned to
+    the same sampled row are ordered by their projection on the direction
+    from the preceding to the following sampled row.
+    """
+    if len(x) <= MAX_HCLUST_ROWS:
+        return hclust_ordering(x)
+
+    rng = np.random.default_rng(0)
+    sample_idx = np.sort(rng.choice(len(x), MAX_HCLUST_ROWS, replace=False))
+    anchors = x[sample_idx][hclust_ordering(x[sample_idx])]
+    # anchors are sorted, so the nearest anchor is also the position
+    nearest = pairwise_distances_argmin(x, anchors)
+    neighbours = np.vstack((anchors[:1], anchors, anchors[-1:]))
+    directions = neighbours[2:] - neighbours[:-2]
+    projections = np.einsum(
+        "ij,ij->i", x - anchors[nearest], directions[nearest]
+    )
+    return np.lexsort((projections, nearest))
 
 
 def get_instance_ordering(
@@ -597,14 +2484,14 @@ def get_instance_ordering(
     """
     if isinstance(order_by, Variable):
         x_data = data.get_column(order_by)
-        clust_ord = np.argsort(hclust_ordering(shap_values))
+        clust_ord = np.argsort(_similarity_ordering(shap_values))
         return np.lexsort([clust_ord, x_data])
     elif order_by == ORIGINAL_ORDER:
         return np.arange(shap_values.shape[0])
     elif order_by == OUTPUT_ORDER:
         return np.argsort(predictions)[::-1]
     elif order_by == SIMILARITY_ORDER:
-        return hclust_ordering(shap_values)
+        return _similarity_ordering(shap_values)
     else:
         raise NotImplementedError(order_by)
 
@@ -648,35 +2535,163 @@ def prepare_force_plot_data_multi_inst(
 
     """
     attributes = transformed_domain.attributes
-    exps = [(np.sum(shap_values[k, :]) + base_value, shap_values[k, :])
-            for k in range(shap_values.shape[0])]
-
-    pos_data = []
-    pos_labels = []
-    pos_idxs = np.argsort(shap_values.clip(min=0).sum(axis=0))[::-1]
-    for i, k in enumerate(pos_idxs):
-        y_upper = np.array([(s - v[pos_idxs[:i]].clip(0).sum())
-                            for s, v in exps])
-        y_lower = np.array([(s - v[pos_idxs[:i + 1]].clip(0).sum())
-                            for s, v in exps])
-        pos_data.append((y_upper, y_lower))
-        pos_labels.append(attributes[k].name)
-
-    neg_data = []
-    neg_labels = []
-    neg_idxs = np.argsort(shap_values.clip(max=0).sum(axis=0))
-    for i, k in enumerate(neg_idxs):
-        y_lower = np.array([(s - v[neg_idxs[:i]].clip(max=0).sum())
-                            for s, v in exps])
-        y_upper = np.array([(s - v[neg_idxs[:i + 1]].clip(max=0).sum())
-                            for s, v in exps])
-        neg_data.append((y_upper, y_lower))
-        neg_labels.append(attributes[k].name)
+    outputs = np.sum(shap_values, axis=1) + base_value
+
+    def bounds(values, order):
+        # row i holds the outputs minus the sum of the first i features in
+        # the order; bands lie between consecutive rows
+        sums = np.zeros((len(order) + 1, len(values)))
+        np.cumsum(values[:, order].T, axis=0, out=sums[1:])
+        return outputs - sums
+
+    positive = shap_values.clip(min=0)
+    pos_idxs = np.argsort(positive.sum(axis=0))[::-1]
+    pos_bounds = bounds(positive, pos_idxs)
+    pos_data = list(zip(pos_bounds[:-1], pos_bounds[1:]))
+    pos_labels = [attributes[k].name for k in pos_idxs]
+
+    negative = shap_values.clip(max=0)
+    neg_idxs = np.argsort(negative.sum(axis=0))
+    neg_bounds = bounds(negative, neg_idxs)
+    neg_data = list(zip(neg_bounds[1:], neg_bounds[:-1]))
+    neg_labels = [attributes[k].name for k in neg_idxs]
 
     return (np.arange(shap_values.shape[0]),
             pos_data, neg_data, pos_labels, neg_labels)
 
 
+class ExplanationResult:
+    """
+    SHAP values of explained rows of data, shared by widgets that show them.
+
+    SHAP values are kept in a single contiguous float32 array of shape
+    (num classes, num explained rows, num attributes); regression has a
+    single class. Explained rows are given by their sorted indices in data.
+    Statistics derived from SHAP values (colors, mean absolute values,
+    instance orderings) are computed when first requested and then kept, so
+    they are not recomputed when a plot is redrawn.
+
+    Attributes
+    ----------
+    values
+        SHAP values; values[i] are SHAP values for the i-th class.
+    row_indices
+        Indices of explained rows in data.
+    n_rows
+        Number of rows in data.
+    names
+        Names of attributes.
+    transformed_data
+        Data transformed to the model's domain (all rows), if available.
+    predictions
+        Predictions for all rows in data, one column for each class, if
+        available.
+    base_value
+        Base value (average model's output) for each class, if available.
+    interactions
+        SHAP interaction values of explained rows, if computed; see
+        compute_shap_interactions.
+    """
+    __slots__ = ("values", "row_indices", "n_rows", "names",
+                 "transformed_data", "predictions", "base_value",
+                 "interactions", "_mask", "_colors", "_mean_abs", "_orderings")
+
+    def __init__(
+        self,
+        values: Union[np.ndarray, List[np.ndarray]],
+        row_indices: np.ndarray,
+        n_rows: int,
+        names: Optional[List[str]] = None,
+        *,
+        transformed_data: Optional[Table] = None,
+        predictions: Optional[np.ndarray] = None,
+        base_value: Optional[np.ndarray] = None,
+        colors: Optional[np.ndarray] = None,
+        interactions: Optional[ShapInteractions] = None,
+    ):
+        values = np.asarray(values, dtype=np.float32)
+        row_indices = np.asarray(row_indices, dtype=np.intp)
+        if np.any(row_indices[1:] < row_indices[:-1]):
+            order = np.argsort(row_indices, kind="stable")
+            row_indices = row_indices[order]
+            values = values[:, order]
+            if colors is not None:
+                colors = colors[order]
+        if names is None:
+            names = [a.name for a in transformed_data.domain.attributes]
+
+        self.values = np.ascontiguousarray(values)
+        self.row_indices = row_indices
+        self.n_rows = n_rows
+        self.names = names
+        self.transformed_data = transformed_data
+        self.predictions = predictions
+        self.base_value = base_value
+        self.interactions = interactions
+        self._mask = None
+        self._colors = colors
+        self._mean_abs = {}
+        self._orderings = {}
+
+    @classmethod
+    def from_mask(
+        cls,
+        values: Union[np.ndarray, List[np.ndarray]],
+        mask: np.ndarray,
+        names: Optional[List[str]] = None,
+        **kwargs
+    ) -> "ExplanationResult":
+        """
+        Construct the result from a boolean mask of explained rows, as
+        returned by compute_shap_values and explain_predictions.
+        """
+        return cls(values, np.flatnonzero(mask), len(mask), names, **kwargs)
+
+    @property
+    def mask(self) -> np.ndarray:
+        """ Boolean mask of explained rows in data """
+        if self._mask is None:
+            mask = np.zeros(self.n_rows, dtype=bool)
+            mask[self.row_indices] = True
+            self._mask = mask
+        return self._mask
+
+    @property
+    def colors(self) -> np.ndarray:
+        """ Colors of values of explained rows; see compute_colors """
+        if self._colors is None:
+            self._colors = compute_colors(
+                self.transformed_data[self.row_indices]
+            )
+        return self._colors
+
+    def mean_abs(self, target: int) -> np.ndarray:
+        """ Mean absolute SHAP values of attributes for the target class """
+        if target not in self._mean_abs:
+            # accumulated in double precision
+            self._mean_abs[target] = np.mean(np.abs(self.values[target]),
+                                             axis=0, dtype=np.float64)
+        return self._mean_abs[target]
+
+    def ordering(
+        self, target: int, order_by: Union[str, Variable], data: Table
+    ) -> np.ndarray:
+        """
+        Order of explained rows; see get_instance_ordering. Data is the
+        explained data; orderings are kept for each target and order_by.
+        """
+        key = (target, order_by)
+        if key not in self._orderings:
+            predictions = None
+            if self.predictions is not None:
+                predictions = self.predictions[self.row_indices, target]
+            self._orderings[key] = get_instance_ordering(
+                self.values[target], predictions, data[self.row_indices],
+                order_by
+            )
+        return self._orderings[key]
+
+
 if __name__ == "__main__":
     import matplotlib.pyplot as plt
     from Orange.classification import RandomForestLearner
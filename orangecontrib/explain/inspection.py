@@ -13,6 +13,8 @@ from Orange.evaluation.scoring import Score, TargetScore, RegressionScore, R2
 from Orange.regression import Model as RegModel
 from Orange.util import dummy_callback, wrap_callback
 
+from orangecontrib.explain.cache import data_to_model_domain
+
 
 def permutation_feature_importance(
         model: Model,
@@ -87,7 +89,7 @@ def _check_model(model: Model, data: Table) -> bool:
             f"{model} can not be used for data with continuous class."
         )
 
-    mod_data_X = model.data_to_model_domain(data).X
+    mod_data_X = data_to_model_domain(model, data).X
     if data.X.shape != mod_data_X.shape:
         return True
     elif sp.issparse(data.X) and sp.issparse(mod_data_X):
@@ -196,7 +198,7 @@ def individual_condition_expectation(
     _, index = np.unique(orig_values, return_index=True)
     orig_values = orig_values[index]
     if needs_pp:
-        data = model.data_to_model_domain(data)
+        data = data_to_model_domain(model, data)
 
     assert feature.name in [a.name for a in data.domain.attributes]
     feature_index = data.domain.index(feature.name)
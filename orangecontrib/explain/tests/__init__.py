@@ -0,0 +1,13 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+
+def disable_caches(test_case: TestCase):
+    """
+    Disable caches of explanations for the duration of the test, so that
+    tests are not affected by each other and do not fill the disk cache.
+    """
+    for name in ("shap_cache", "shap_memory_cache", "shap_rows_cache"):
+        patcher = patch(f"orangecontrib.explain.explainer.{name}", None)
+        patcher.start()
+        test_case.addCleanup(patcher.stop)
@@ -0,0 +1,321 @@
+import gc
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import Mock, patch
+
+import numpy as np
+from scipy import sparse
+
+from Orange.classification import LogisticRegressionLearner
+from Orange.data import Table, Domain
+from Orange.preprocess.transformation import Identity
+
+import orangecontrib.explain.cache
+from orangecontrib.explain.cache import DiskCache, MemoryBudget, MemoryCache, \
+    array_hash, table_hash, object_hash, nbytes, row_hashes, \
+    full_table_hash, data_to_model_domain, stable_hash
+
+
+class TestHashes(unittest.TestCase):
+    def test_array_hash(self):
+        x = np.arange(12, dtype=float).reshape(3, 4)
+        self.assertEqual(array_hash(x), array_hash(x.copy()))
+        self.assertEqual(array_hash(x), array_hash(np.asfortranarray(x)))
+        self.assertNotEqual(array_hash(x), array_hash(x.reshape(4, 3)))
+        self.assertNotEqual(array_hash(x), array_hash(x.astype(np.float32)))
+        y = x.copy()
+        y[1, 1] = 42
+        self.assertNotEqual(array_hash(x), array_hash(y))
+
+        xs = sparse.csr_matrix(x)
+        self.assertEqual(array_hash(xs), array_hash(sparse.csc_matrix(x)))
+        self.assertNotEqual(array_hash(xs), array_hash(x))
+
+    def test_row_hashes(self):
+        x = np.array([[1, 0, 2], [0, 0, 3], [1, 0, 2], [0, 0, 0]], dtype=float)
+        hashes = row_hashes(x)
+        self.assertEqual(hashes.shape, (4,))
+        self.assertEqual(hashes[0], hashes[2])
+        self.assertEqual(len(set(hashes)), 3)
+        np.testing.assert_array_equal(row_hashes(x[1:3]), hashes[1:3])
+
+        xs = sparse.csr_matrix(x)
+        hashes = row_hashes(xs)
+        self.assertEqual(hashes.shape, (4,))
+        self.assertEqual(hashes[0], hashes[2])
+        self.assertEqual(len(set(hashes)), 3)
+        np.testing.assert_array_equal(row_hashes(xs[1:3]), hashes[1:3])
+        np.testing.assert_array_equal(
+            row_hashes(sparse.csc_matrix(x)), hashes
+        )
+
+        self.assertEqual(row_hashes(np.zeros((0, 3))).shape, (0,))
+
+    def test_table_hash(self):
+        iris = Table("iris")
+        self.assertEqual(table_hash(iris), table_hash(Table("iris")))
+        self.assertNotEqual(table_hash(iris), table_hash(iris[:10]))
+
+        # same values, different features
+        domain = iris.domain
+        renamed = Table.from_numpy(Domain(domain.attributes[::-1]), iris.X)
+        self.assertNotEqual(table_hash(iris), table_hash(renamed))
+
+    def test_full_table_hash(self):
+        iris = Table("iris")
+        self.assertEqual(full_table_hash(iris), full_table_hash(iris.copy()))
+        self.assertNotEqual(full_table_hash(iris), full_table_hash(iris[:10]))
+
+        # same features, different target
+        other = iris.copy()
+        with other.unlocked(other.Y):
+            other.Y[0] = 2
+        self.assertEqual(table_hash(iris), table_hash(other))
+        self.assertNotEqual(full_table_hash(iris), full_table_hash(other))
+
+    def test_object_hash(self):
+        self.assertEqual(object_hash([1, "a"]), object_hash([1, "a"]))
+        self.assertNotEqual(object_hash([1, "a"]), object_hash([1, "b"]))
+        self.assertIsNone(object_hash(lambda x: x))
+
+    def test_stable_hash(self):
+        data = Table("heart_disease")
+        model = LogisticRegressionLearner()(data)
+        # transformations of features are described by their parameters
+        model2 = LogisticRegressionLearner()(data)
+        self.assertEqual(stable_hash(model.domain), stable_hash(model2.domain))
+        self.assertEqual(stable_hash(model.skl_model),
+                         stable_hash(model2.skl_model))
+        model3 = LogisticRegressionLearner()(data[:100])
+        self.assertNotEqual(stable_hash(model.domain),
+                            stable_hash(model3.domain))
+        self.assertNotEqual(stable_hash(model.skl_model),
+                            stable_hash(model3.skl_model))
+
+        self.assertEqual(stable_hash({"a": [1, 2.5], "b": {3}}),
+                         stable_hash({"b": {3}, "a": [1, 2.5]}))
+        self.assertNotEqual(stable_hash([1, 2]), stable_hash((1, 2)))
+        cyclic = []
+        cyclic.append(cyclic)
+        self.assertIsNotNone(stable_hash(cyclic))
+        self.assertIsNone(stable_hash(threading.Lock()))
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = DiskCache(os.path.join(self.tmp.name, "cache"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_get_put(self):
+        self.assertIsNone(self.cache.get("a"))
+        arrays = {"x": np.arange(5), "y": np.ones((2, 3))}
+        self.cache.put("a", arrays)
+        cached = self.cache.get("a")
+        self.assertEqual(set(cached), {"x", "y"})
+        np.testing.assert_array_equal(cached["x"], arrays["x"])
+        np.testing.assert_array_equal(cached["y"], arrays["y"])
+
+        self.cache.clear()
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_corrupted(self):
+        self.cache.put("a", {"x": np.arange(5)})
+        with open(self.cache._path("a"), "wb") as f:
+            f.write(b"foo")
+        self.assertIsNone(self.cache.get("a"))
+        self.assertFalse(os.path.exists(self.cache._path("a")))
+
+    def test_eviction(self):
+        x = np.zeros(1000)
+        self.cache.put("a", {"x": x})
+        size = os.path.getsize(self.cache._path("a"))
+        self.cache.max_size = 2 * size
+
+        self.cache.put("b", {"x": x})
+        os.utime(self.cache._path("a"), (0, 0))
+        os.utime(self.cache._path("b"), (1, 1))
+        # a is used more recently than b
+        self.assertIsNotNone(self.cache.get("a"))
+
+        self.cache.put("c", {"x": x})
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("c"))
+
+
+class TestMemoryCache(unittest.TestCase):
+    def test_nbytes(self):
+        x = np.zeros((10, 5))
+        self.assertEqual(nbytes(x), 400)
+        self.assertEqual(nbytes([x, (x, None)]), 800)
+        self.assertEqual(nbytes(sparse.csr_matrix(np.eye(4))),
+                         4 * 8 + 4 * 4 + 5 * 4)
+        iris = Table("iris")
+        self.assertEqual(nbytes(iris), 150 * 4 * 8 + 150 * 8)
+
+    def test_get_or_compute(self):
+        cache = MemoryCache()
+        compute = Mock(return_value=np.arange(5))
+        value = cache.get_or_compute("a", compute)
+        self.assertIs(cache.get_or_compute("a", compute), value)
+        compute.assert_called_once()
+
+        compute.side_effect = ValueError
+        self.assertRaises(ValueError, cache.get_or_compute, "b", compute)
+        self.assertIsNone(cache.get("b"))
+
+        cache.clear()
+        self.assertIsNone(cache.get("a"))
+
+    def test_eviction(self):
+        x = np.zeros(100)
+        cache = MemoryCache(max_size=2 * x.nbytes)
+        cache.put("a", x)
+        cache.put("b", x)
+        self.assertIs(cache.get("a"), x)
+        cache.put("c", x)
+        self.assertIs(cache.get("a"), x)
+        self.assertIsNone(cache.get("b"))
+        self.assertIs(cache.get("c"), x)
+
+        cache.put("d", np.zeros(300))
+        self.assertIsNone(cache.get("d"))
+        self.assertIs(cache.get("a"), x)
+
+    def test_shared_budget(self):
+        x = np.zeros(100)
+        budget = MemoryBudget(3 * x.nbytes)
+        cache1 = MemoryCache(budget=budget)
+        cache2 = MemoryCache(budget=budget)
+        cache1.put("a", x)
+        cache2.put("b", x)
+        cache1.put("c", x)
+        self.assertEqual(budget.size, 3 * x.nbytes)
+
+        # the least recently used value is removed from any cache
+        self.assertIs(cache1.get("a"), x)
+        cache2.put("d", x)
+        self.assertIsNone(cache2.get("b"))
+        self.assertIs(cache1.get("a"), x)
+        self.assertIs(cache1.get("c"), x)
+        self.assertIs(cache2.get("d"), x)
+
+        cache1.discard("a")
+        cache2.clear()
+        self.assertEqual(budget.size, x.nbytes)
+
+    def _compute_concurrently(self, cache, compute):
+        started, proceed = threading.Event(), threading.Event()
+        results = []
+
+        def compute_first():
+            started.set()
+            proceed.wait()
+            return compute()
+
+        def request(func):
+            try:
+                results.append(cache.get_or_compute("a", func))
+            except ValueError:
+                results.append(None)
+
+        first = threading.Thread(target=request, args=(compute_first,))
+        first.start()
+        started.wait()
+        wait_callback = Mock(side_effect=proceed.set)
+        second = threading.Thread(
+            target=lambda: results.append(
+                cache.get_or_compute("a", compute, wait_callback)
+            )
+        )
+        second.start()
+        first.join()
+        second.join()
+        wait_callback.assert_called()
+        return results
+
+    def test_wait_for_other_thread(self):
+        compute = Mock(return_value=np.arange(5))
+        results = self._compute_concurrently(MemoryCache(), compute)
+        compute.assert_called_once()
+        self.assertIs(results[0], results[1])
+
+    def test_wait_for_other_thread_failed(self):
+        x = np.arange(5)
+        compute = Mock(side_effect=[ValueError, x])
+        results = self._compute_concurrently(MemoryCache(), compute)
+        self.assertEqual(compute.call_count, 2)
+        self.assertIsNone(results[0])
+        self.assertIs(results[1], x)
+
+
+class TestDataToModelDomain(unittest.TestCase):
+    def setUp(self):
+        self.data = Table("heart_disease")
+        self.model = LogisticRegressionLearner()(self.data)
+        self.transform = Mock(wraps=self.model.data_to_model_domain)
+        self.model.data_to_model_domain = self.transform
+        patcher = patch.object(orangecontrib.explain.cache,
+                               "transformed_cache", MemoryCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cached(self):
+        transformed = data_to_model_domain(self.model, self.data)
+        self.assertIs(data_to_model_domain(self.model, self.data),
+                      transformed)
+        self.transform.assert_called_once()
+
+        data_to_model_domain(self.model, self.data[:10])
+        self.assertEqual(self.transform.call_count, 2)
+
+        # another model has its own transformations
+        model = LogisticRegressionLearner()(self.data)
+        self.assertIsNot(data_to_model_domain(model, self.data), transformed)
+
+    def test_equal_content_other_domain(self):
+        data = Table("iris")
+        model = LogisticRegressionLearner()(data)
+        transformed = data_to_model_domain(model, data)
+
+        # the same values, but the attribute is computed from another column
+        attrs = list(data.domain.attributes)
+        attrs[0] = attrs[0].copy(compute_value=Identity(attrs[1]))
+        domain = Domain(attrs, data.domain.class_var)
+        other = Table.from_numpy(domain, data.X, data.Y, ids=data.ids)
+        other_transformed = data_to_model_domain(model, other)
+        self.assertFalse(np.array_equal(transformed.X, other_transformed.X))
+
+    def test_entries_removed(self):
+        data = self.data.copy()
+        data_to_model_domain(self.model, data)
+        cache = orangecontrib.explain.cache.transformed_cache
+        self.assertEqual(len(cache._items), 1)
+        del data
+        self.transform.reset_mock()  # the mock holds the call's arguments
+        gc.collect()
+        self.assertEqual(len(cache._items), 0)
+
+    def test_model_domain(self):
+        # data in the model's domain is not transformed or stored
+        transformed = data_to_model_domain(self.model, self.data)
+        self.assertIs(data_to_model_domain(self.model, transformed),
+                      transformed)
+        self.assertEqual(len(orangecontrib.explain.cache.transformed_cache
+                             ._items), 1)
+
+    def test_no_cache(self):
+        with patch.object(orangecontrib.explain.cache,
+                          "transformed_cache", None):
+            data_to_model_domain(self.model, self.data)
+            data_to_model_domain(self.model, self.data)
+        self.assertEqual(self.transform.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
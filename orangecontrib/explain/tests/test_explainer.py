@@ -1,9 +1,17 @@
 import inspect
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from unittest.mock import Mock, patch
 
 import numpy as np
+import scipy.sparse as sp
 from numpy.testing import assert_array_equal
 from Orange.classification import (
+    KNNLearner,
     LogisticRegressionLearner,
     RandomForestLearner,
     SGDClassificationLearner,
@@ -11,8 +19,10 @@ from Orange.classification import (
     TreeLearner,
     ThresholdLearner,
 )
-from Orange.data import Table, Domain, ContinuousVariable
-from Orange.regression import LinearRegressionLearner, CurveFitLearner
+from Orange.data import Table, Domain, ContinuousVariable, DiscreteVariable
+from Orange.regression import LinearRegressionLearner, CurveFitLearner, \
+    KNNRegressionLearner, RandomForestRegressionLearner, \
+    TreeLearner as TreeRegressionLearner
 from Orange.tests import test_regression, test_classification
 from Orange.widgets.data import owcolor
 from Orange.modelling import GBLearner
@@ -20,22 +30,57 @@ try:
     from Orange.modelling import XGBLearner, XGBRFLearner
 except ImportError:
     XGBLearner = XGBRFLearner = None
-from shap import TreeExplainer
+from shap import KernelExplainer, TreeExplainer
+from shap.utils import hclust_ordering
+from shap.utils._legacy import kmeans
 
+import orangecontrib.explain.explainer
+from orangecontrib.explain.cache import DiskCache, MemoryCache, row_hashes
 from orangecontrib.explain.explainer import (
+    _explain_trees,
     compute_colors,
+    Explainer,
+    compute_shap_interactions,
     compute_shap_values,
+    enable_disk_cache,
     explain_predictions,
+    explanation_space,
+    ExplanationResult,
+    is_explanation_cached,
+    ForcePlotRows,
+    get_interactions_table,
     INSTANCE_ORDERINGS,
     get_instance_ordering,
     get_shap_values_and_colors,
+    OUTPUT_ORDER,
+    SIMILARITY_ORDER,
     prepare_force_plot_data,
     prepare_force_plot_data_multi_inst,
+    RGB_HIGH,
+    RGB_LOW,
+    summarize_background,
+    supports_approximation,
+    SUMMARY_AUTO,
+    SUMMARY_KMEANS,
+    SUMMARY_MINIBATCH_KMEANS,
+    SUMMARY_STRATIFIED,
+    _column_statistics,
+    _explain_in_batches,
+    _force_plot_rows,
+    _get_min_max,
+    _KernelShap,
+    _OrangeTreeShap,
+    _dense_chunks,
+    _subsample_data,
+    _top_features,
 )
+from orangecontrib.explain.tests import disable_caches
 
 
 class TestExplainer(unittest.TestCase):
     def setUp(self) -> None:
+        disable_caches(self)
+
         self.iris = Table.from_file("iris")
         self.housing = Table.from_file("housing")[:100, -10:]
         self.titanic = Table("titanic")
@@ -70,6 +115,102 @@ class TestExplainer(unittest.TestCase):
         self.assertTupleEqual(shap_values[1].shape, (1, 4))
         self.assertTupleEqual(shap_values[2].shape, (1, 4))
 
+    def test_orange_tree_explainer(self):
+        data = self.iris.copy()
+        with data.unlocked():
+            data.X[:10:3, 0] = np.nan
+            data.X[1:10:3, 2] = np.nan
+        titanic = Table("titanic")
+        iris_reg = self.iris.transform(
+            Domain(self.iris.domain.attributes[:3],
+                   self.iris.domain.attributes[3])
+        )
+        for model, x, background in (
+                (TreeLearner()(data), data.X[::7], data.X[::13]),
+                (TreeLearner(binarize=True)(titanic), titanic.X[::50],
+                 titanic.X[::100]),
+                (TreeRegressionLearner()(iris_reg), iris_reg.X[::7],
+                 iris_reg.X[::13]),
+        ):
+            weights = np.random.RandomState(0).random(len(background))
+            explainer = _OrangeTreeShap(model, background, weights)
+            # few features: KernelSHAP evaluates all coalitions, values are
+            # exact and must match
+            kernel = _KernelShap(model, background, weights)
+            np.testing.assert_array_almost_equal(
+                explainer.shap_values(x), kernel.shap_values(x)
+            )
+            np.testing.assert_array_almost_equal(
+                explainer.expected_value, kernel.expected_value
+            )
+
+        # the whole table explained with TreeSHAP, sparse data included
+        model = TreeRegressionLearner()(self.housing)
+        with patch("orangecontrib.explain.explainer._explain_other_models") \
+                as explain_other:
+            shap_values, transformed, _, base_value = compute_shap_values(
+                model, self.housing, self.housing
+            )
+            explain_other.assert_not_called()
+        np.testing.assert_array_almost_equal(
+            shap_values[0].sum(axis=1) + base_value, model(transformed.X)
+        )
+
+        housing = self.housing.to_sparse()
+        shap_values_sp, _, _, base_value_sp = compute_shap_values(
+            model, housing, housing
+        )
+        np.testing.assert_array_almost_equal(shap_values, shap_values_sp)
+        np.testing.assert_array_almost_equal(base_value, base_value_sp)
+
+    def test_explain_in_batches(self):
+        x = np.arange(100).reshape(50, 2)
+        batch_sizes = []
+
+        def explain(batch):
+            batch_sizes.append(len(batch))
+            return [batch, -batch]
+
+        progress = []
+        out = np.empty((2, 50, 2))
+        shap_values, batch_size = _explain_in_batches(
+            explain, x, out, progress.append)
+        self.assertIs(shap_values, out)
+        self.assertGreater(batch_size, max(batch_sizes))
+        self.assertEqual(sum(batch_sizes), 50)
+        # fast explanations are done in growing batches
+        self.assertLess(len(batch_sizes), 10)
+        self.assertEqual(progress[0], 0)
+        self.assertTrue(all(0 <= p < 1 for p in progress))
+        self.assertEqual(len(progress), len(batch_sizes))
+
+        # slow explanations stay in small batches
+        batch_sizes.clear()
+        _explain_in_batches(explain, x, np.empty((2, 50, 2)), lambda _: None,
+                            target_time=-1)
+        self.assertEqual(batch_sizes, [1] * 50)
+
+        # the adapted size is passed to the next call
+        batch_sizes.clear()
+        _explain_in_batches(explain, x, np.empty((2, 50, 2)), lambda _: None,
+                            batch_size=16)
+        self.assertEqual(batch_sizes[0], 16)
+
+        np.testing.assert_array_equal(shap_values[0], x)
+        np.testing.assert_array_equal(shap_values[1], -x)
+
+    def test_batch_size_kept(self):
+        model = RandomForestLearner(n_estimators=5)(self.iris)
+        x = model.data_to_model_domain(self.iris).X
+        with Explainer(model, self.iris) as explainer, \
+                patch("orangecontrib.explain.explainer._explain_in_batches",
+                      wraps=_explain_in_batches) as explain_in_batches:
+            explainer.shap_values(x[:50])
+            explainer.shap_values(x[50:])
+        sizes = [c[1]["batch_size"] for c in explain_in_batches.call_args_list]
+        self.assertEqual(sizes[0], 1)
+        self.assertGreater(sizes[1], 1)
+
     def test_kernel_explainer(self):
         learner = LogisticRegressionLearner()
         model = learner(self.iris)
@@ -99,6 +240,421 @@ class TestExplainer(unittest.TestCase):
         self.assertTupleEqual(shap_values[1].shape, (1, 4))
         self.assertTupleEqual(shap_values[2].shape, (1, 4))
 
+    def test_kernel_explainer_parallel(self):
+        model = KNNLearner()(self.iris)
+        data = self.iris[::10]
+
+        shap_values, _, _, base_value = compute_shap_values(
+            model, data, self.iris
+        )
+        shap_values_par, _, _, base_value_par = compute_shap_values(
+            model, data, self.iris, n_jobs=2
+        )
+        np.testing.assert_array_equal(shap_values, shap_values_par)
+        np.testing.assert_array_equal(base_value, base_value_par)
+
+        # explanation of a row does not depend on other explained rows
+        shap_values_rev, _, _, _ = compute_shap_values(
+            model, data[::-1], self.iris
+        )
+        for sv, sv_rev in zip(shap_values, shap_values_rev):
+            np.testing.assert_array_equal(sv, sv_rev[::-1])
+
+    def test_kernel_shap(self):
+        model = KNNLearner()(self.iris)
+        ref = kmeans(self.iris.X, k=10)
+        explainer = _KernelShap(model, ref.data, np.array(ref.weights))
+        shap_values = explainer.shap_values(self.iris.X[::10])
+
+        # iris has few features: all coalitions are evaluated, which makes
+        # values exact and equal to those computed by shap
+        kernel_explainer = KernelExplainer(
+            lambda x: model(x, model.Probs), ref
+        )
+        expected = kernel_explainer.shap_values(
+            self.iris.X[::10], silent=True, l1_reg=False
+        )
+        np.testing.assert_array_almost_equal(shap_values, expected)
+        np.testing.assert_array_almost_equal(
+            explainer.expected_value, kernel_explainer.expected_value
+        )
+
+        # explanation of many features with sampled coalitions is additive
+        model = KNNLearner()(self.titanic)
+        data = model.data_to_model_domain(self.titanic[::100])
+        explainer = _KernelShap(model, data.X, np.ones(len(data)))
+        shap_values = explainer.shap_values(data.X)
+        np.testing.assert_array_almost_equal(
+            np.sum(shap_values, axis=2).T + explainer.expected_value,
+            model(data.X, model.Probs)
+        )
+
+    def test_kernel_shap_many_features(self):
+        # with more features than KERNEL_N_SAMPLES, KernelSHAP is compared
+        # to exact interventional TreeSHAP with the same background
+        rng = np.random.default_rng(0)
+        m = 50
+        x = rng.normal(size=(1000, m))
+        y = x[:, 0] * x[:, 1] + x[:, 2] ** 2 + np.sin(2 * x[:, 3]) + x[:, 4]
+        domain = Domain([ContinuousVariable(f"x{i}") for i in range(m)],
+                        ContinuousVariable("y"))
+        data = Table.from_numpy(domain, x, y)
+        model = RandomForestRegressionLearner(
+            n_estimators=20, random_state=0)(data)
+        background, rows = x[:10], x[10:30]
+
+        explainer = _KernelShap(model, background, np.ones(len(background)))
+        shap_values = explainer.shap_values(rows)[0]
+        reference = TreeExplainer(
+            model.skl_model, data=background
+        ).shap_values(rows)
+
+        self.assertLess(np.abs(shap_values - reference).mean(), 0.03)
+        importance = np.abs(shap_values).mean(axis=0)
+        reference_importance = np.abs(reference).mean(axis=0)
+        np.testing.assert_array_equal(
+            np.argsort(importance)[::-1][:3],
+            np.argsort(reference_importance)[::-1][:3]
+        )
+        np.testing.assert_array_almost_equal(
+            shap_values.sum(axis=1) + explainer.expected_value,
+            model(rows)
+        )
+
+        # blocks are bounded by the number of values, not rows
+        with patch.object(_KernelShap, "MAX_BLOCK_VALUES", 1):
+            with patch.object(_KernelShap, "_explain_block",
+                              wraps=explainer._explain_block) as block:
+                np.testing.assert_array_almost_equal(
+                    explainer.shap_values(rows[:3])[0], shap_values[:3]
+                )
+                self.assertEqual(block.call_count, 3)
+
+    def test_kernel_shap_single_feature(self):
+        # with one feature, there are no coalitions to evaluate and the
+        # feature's value is the difference from the expected value
+        data = self.iris[:, [0, 4]]
+        model = KNNLearner()(data)
+        shap_values, transformed, mask, base_value = compute_shap_values(
+            model, data, data
+        )
+        self.assertEqual(3, len(shap_values))
+        self.assertTupleEqual((len(data), 1), shap_values[0].shape)
+        np.testing.assert_array_almost_equal(
+            np.hstack(shap_values) + base_value,
+            model(transformed[mask], model.Probs)
+        )
+
+        with Explainer(model, data) as explainer:
+            self.assertTrue(explainer.exact)
+            self.assertEqual(1, explainer.evaluations_per_row)
+
+    def test_explainer(self):
+        for model in (KNNLearner()(self.iris),
+                      RandomForestLearner(n_estimators=10)(self.iris),
+                      LogisticRegressionLearner()(self.iris)):
+            data = self.iris[::5]
+            shap_values, _, _, base_value = compute_shap_values(
+                model, data, self.iris
+            )
+            explainer = Explainer(model, self.iris)
+            np.testing.assert_array_almost_equal(
+                explainer.base_value, base_value
+            )
+            np.testing.assert_array_almost_equal(
+                explainer.explain(data), shap_values
+            )
+            # the same explanation in a stream of small batches
+            batches = [explainer.explain(data[i : i + 7])
+                       for i in range(0, len(data), 7)]
+            np.testing.assert_array_almost_equal(
+                [np.vstack(b) for b in zip(*batches)], shap_values
+            )
+
+        model = KNNLearner()(self.iris)
+        with patch("orangecontrib.explain.explainer.ProcessPoolExecutor",
+                   wraps=ProcessPoolExecutor) as executor, \
+                Explainer(model, self.iris, n_jobs=2) as explainer:
+            # the first batch gives a row to each worker
+            self.assertEqual(explainer._batch_size, 2)
+            shap_values = explainer.explain(self.iris[:10])
+        self.assertRaises(RuntimeError, explainer.explain, self.iris[:10])
+        # workers are not forked from this (possibly multithreaded) process
+        context = executor.call_args[1]["mp_context"]
+        self.assertNotEqual(context.get_start_method(), "fork")
+        np.testing.assert_array_almost_equal(
+            Explainer(model, self.iris).explain(self.iris[:10]), shap_values
+        )
+
+    def test_contiguous_storage(self):
+        model = RandomForestLearner(n_estimators=10)(self.iris)
+        shap_values, _, mask, _ = compute_shap_values(
+            model, self.iris, self.iris
+        )
+        # the list is a view of a single (classes x rows x attributes) array
+        base = shap_values[0].base
+        self.assertEqual(base.shape, (3, mask.sum(), 4))
+        self.assertTrue(base.flags.c_contiguous)
+        self.assertTrue(all(sv.base is base for sv in shap_values))
+
+        shap_values32, _, mask32, _ = compute_shap_values(
+            model, self.iris, self.iris, dtype=np.float32
+        )
+        np.testing.assert_array_equal(mask, mask32)
+        self.assertTrue(all(sv.dtype == np.float32 for sv in shap_values32))
+        np.testing.assert_allclose(shap_values32, shap_values, atol=1e-6)
+
+        explainer = Explainer(model, self.iris)
+        x = explainer.transform(self.iris[:10]).X
+        out = np.zeros((3, 10, 4), dtype=np.float32)
+        values = explainer.shap_values(x, out=out)
+        self.assertTrue(all(v.base is out for v in values))
+        np.testing.assert_allclose(out, np.array(shap_values)[:, :10],
+                                   atol=1e-6)
+
+    @patch("orangecontrib.explain.cache.transformed_cache", None)
+    def test_transform_once(self):
+        data = Table("heart_disease")
+        model = KNNLearner()(data)
+        transform = Mock(wraps=model.data_to_model_domain)
+        model.data_to_model_domain = transform
+        shap_values, _, _, _ = compute_shap_values(model, data, data)
+        # reference data is the same table: it is transformed only once
+        transformed = [args[0] for args, _ in transform.call_args_list
+                       if args[0].domain != model.domain]
+        self.assertEqual(transformed, [data])
+
+        model = KNNLearner()(data)
+        expected, _, _, _ = compute_shap_values(model, data, data.copy())
+        np.testing.assert_array_almost_equal(shap_values, expected)
+
+    def test_concurrent_explainers(self):
+        # KernelSHAP samples coalitions of heart disease's many features
+        data = self.hearth_disease[::10]
+        model = KNNLearner()(data)
+        state = np.random.get_state()
+        expected = Explainer(model, data).explain(data)
+        # global random state is neither used nor changed
+        self.assertTrue(all(np.array_equal(a, b) for a, b in
+                            zip(state, np.random.get_state())))
+
+        def explain(_):
+            return Explainer(model, data).explain(data)
+
+        with ThreadPoolExecutor(4) as pool:
+            for shap_values in pool.map(explain, range(4)):
+                np.testing.assert_array_equal(shap_values, expected)
+
+        # sampling without hashes is deterministic, too
+        np.testing.assert_array_equal(_subsample_data(data, 5),
+                                      _subsample_data(data, 5))
+        self.assertEqual(_subsample_data(data, 5).sum(), 5)
+
+    def test_subsample_duplicates(self):
+        # titanic has 2201 rows, but only 14 distinct ones
+        titanic = Table("titanic")
+        hashes = row_hashes(titanic.X)
+        mask = _subsample_data(titanic, 1000, hashes)
+        self.assertEqual(mask.sum(), 1000)
+        sample = titanic[mask]
+        self.assertGreaterEqual(len(np.unique(sample.X, axis=0)), 12)
+        self.assertAlmostEqual(sample.Y.mean(), titanic.Y.mean(), delta=0.05)
+        for i, attr in enumerate(titanic.domain.attributes):
+            for value in range(len(attr.values)):
+                self.assertAlmostEqual(
+                    np.mean(sample.X[:, i] == value),
+                    np.mean(titanic.X[:, i] == value),
+                    delta=0.05
+                )
+
+        # samples are nested, also when duplicated rows are added
+        larger = _subsample_data(titanic, 1200, hashes)
+        self.assertFalse(np.any(mask & ~larger))
+        data = Table.concatenate([titanic, titanic[:300]])
+        grown = _subsample_data(data, 1000, row_hashes(data.X))
+        self.assertFalse(np.any(grown[:len(titanic)] & ~mask))
+
+    def test_approximate(self):
+        model = RandomForestLearner(n_estimators=10)(self.iris)
+        self.assertTrue(supports_approximation(model))
+        self.assertFalse(supports_approximation(TreeLearner()(self.iris)))
+        self.assertFalse(supports_approximation(KNNLearner()(self.iris)))
+        with patch("orangecontrib.explain.explainer.TreeExplainer") as te:
+            self.assertTrue(supports_approximation(
+                GBLearner()(self.hearth_disease)))
+            # multiclass gradient boosting is not supported by TreeExplainer
+            self.assertFalse(supports_approximation(GBLearner()(self.iris)))
+            te.assert_not_called()
+
+        exact, _, mask, _ = compute_shap_values(model, self.iris, self.iris)
+        approx, _, approx_mask, base_value = compute_shap_values(
+            model, self.iris, self.iris, approximate=True
+        )
+        np.testing.assert_array_equal(mask, approx_mask)
+        self.assertFalse(np.allclose(exact, approx))
+        # approximations are also additive
+        np.testing.assert_array_almost_equal(
+            np.array(approx).sum(axis=2).T + base_value,
+            model(self.iris, model.Probs)
+        )
+        self.assertFalse(Explainer(model, self.iris, approximate=True).exact)
+        self.assertTrue(Explainer(model, self.iris).exact)
+
+    def test_shap_interactions(self):
+        for learner, data in (
+                (RandomForestLearner(n_estimators=10), self.iris),
+                (RandomForestLearner(n_estimators=10), self.titanic),
+                (RandomForestRegressionLearner(n_estimators=10), self.housing),
+        ):
+            model = learner(data)
+            progress = []
+            with patch("orangecontrib.explain.explainer.MAX_INTERACTION_SIZE",
+                       2000):
+                interactions = compute_shap_interactions(
+                    model, data, lambda p, *_: progress.append(p),
+                    n_samples=100, n_top=3
+                )
+            # chunks are small enough to report the progress
+            self.assertGreater(len(progress), 3)
+
+            mask = interactions.sample_mask
+            self.assertEqual(mask.sum(), 100)
+            x = model.data_to_model_domain(data).X[mask]
+            values = TreeExplainer(model.skl_model).shap_interaction_values(x)
+            if isinstance(values, np.ndarray):
+                values = [values]
+            n_attrs = x.shape[1]
+            self.assertEqual(interactions.mean_abs.shape,
+                             (len(values), n_attrs, n_attrs))
+            self.assertEqual(interactions.top_pairs.shape,
+                             (len(values), 100, 3, 2))
+            for c, class_values in enumerate(values):
+                np.testing.assert_array_almost_equal(
+                    interactions.mean_abs[c], np.abs(class_values).mean(axis=0)
+                )
+                # the strongest interaction of each row
+                pair_values = class_values + class_values.transpose(0, 2, 1)
+                pair_values[:, np.arange(n_attrs), np.arange(n_attrs)] = 0
+                np.testing.assert_array_almost_equal(
+                    np.abs(interactions.top_values[c, :, 0]),
+                    np.abs(pair_values).max(axis=(1, 2))
+                )
+                i, j = interactions.top_pairs[c, :, 0].T
+                np.testing.assert_array_almost_equal(
+                    interactions.top_values[c, :, 0],
+                    pair_values[np.arange(100), i, j]
+                )
+
+        table = get_interactions_table(interactions)
+        n_attrs = len(self.housing.domain.attributes)
+        self.assertEqual(len(table), n_attrs * (n_attrs - 1) // 2)
+        scores = table.X[:, 0]
+        np.testing.assert_array_equal(scores, np.sort(scores)[::-1])
+
+        model = TreeLearner()(self.iris)
+        self.assertRaises(ValueError, compute_shap_interactions,
+                          model, self.iris)
+
+    def test_summarize_background(self):
+        titanic = Table("titanic")
+        data = KNNLearner()(titanic).data_to_model_domain(titanic)
+        for method in (SUMMARY_KMEANS, SUMMARY_MINIBATCH_KMEANS):
+            summary = summarize_background(data, method, use_cache=False)
+            self.assertEqual(summary.method, method)
+            self.assertGreaterEqual(summary.elapsed, 0)
+            self.assertLessEqual(len(summary.data), 10)
+            self.assertEqual(summary.data.shape[1], data.X.shape[1])
+            self.assertAlmostEqual(summary.weights.sum(), 1)
+
+        summary = summarize_background(data, SUMMARY_STRATIFIED,
+                                       use_cache=False)
+        self.assertEqual(len(summary.data), 100)
+        # classes are represented proportionally: 1490 and 711 rows
+        np.testing.assert_array_almost_equal(
+            summary.weights * len(data), [1490 / 68] * 68 + [711 / 32] * 32
+        )
+
+        self.assertEqual(summarize_background(data).method, SUMMARY_KMEANS)
+        with patch("orangecontrib.explain.explainer.MAX_KMEANS_ROWS", 100):
+            self.assertEqual(summarize_background(data, SUMMARY_AUTO).method,
+                             SUMMARY_MINIBATCH_KMEANS)
+
+        # summaries are cached per content of data
+        with patch("orangecontrib.explain.explainer.background_cache",
+                   MemoryCache()):
+            summary = summarize_background(data)
+            self.assertFalse(summary.cached)
+            cached = summarize_background(data.copy())
+            self.assertTrue(cached.cached)
+            self.assertIs(cached.data, summary.data)
+            self.assertIs(cached.weights, summary.weights)
+            # the time of the lookup, not of the original summarization
+            with patch("time.perf_counter", side_effect=[10, 10.5]):
+                self.assertEqual(summarize_background(data).elapsed, 0.5)
+            self.assertIsNot(summarize_background(data[1:]).data,
+                             summary.data)
+
+        self.assertRaises(ValueError, summarize_background, data, "foo")
+
+        model = KNNLearner()(self.iris)
+        explainer = Explainer(model, self.iris,
+                              summary_method=SUMMARY_STRATIFIED)
+        self.assertEqual(explainer.background_summary.method,
+                         SUMMARY_STRATIFIED)
+        shap_values, _, _, _ = compute_shap_values(
+            model, self.iris[:10], self.iris,
+            summary_method=SUMMARY_STRATIFIED
+        )
+        np.testing.assert_array_almost_equal(
+            explainer.explain(self.iris[:10]), shap_values
+        )
+        self.assertIsNone(
+            Explainer(RandomForestLearner()(self.iris), self.iris)
+            .background_summary
+        )
+
+    def test_linear_explainer(self):
+        # multinomial
+        model = LogisticRegressionLearner()(self.iris)
+        with patch("orangecontrib.explain.explainer._explain_other_models") \
+                as explain_other:
+            shap_values, transformed, _, base_value = compute_shap_values(
+                model, self.iris[::10], self.iris
+            )
+            explain_other.assert_not_called()
+        np.testing.assert_array_almost_equal(
+            np.sum(shap_values, axis=2).T + base_value,
+            model.skl_model.decision_function(transformed.X)
+        )
+        np.testing.assert_array_almost_equal(
+            base_value,
+            model.skl_model.decision_function(self.iris.X.mean(axis=0)[None])[0]
+        )
+
+        # binary: explained in the log-odds space, class 0 is the opposite
+        titanic = Table("titanic")
+        model = LogisticRegressionLearner()(titanic)
+        shap_values, transformed, sample_mask, base_value = \
+            compute_shap_values(model, titanic, titanic)
+        # all rows explained
+        self.assertTrue(sample_mask.all())
+        self.assertTupleEqual(shap_values[0].shape, (len(titanic), 8))
+        np.testing.assert_array_almost_equal(
+            shap_values[1].sum(axis=1) + base_value[1],
+            model.skl_model.decision_function(transformed.X)
+        )
+        np.testing.assert_array_equal(shap_values[0], -shap_values[1])
+        np.testing.assert_array_equal(base_value[0], -base_value[1])
+
+        # regression
+        model = LinearRegressionLearner()(self.housing)
+        shap_values, transformed, _, base_value = compute_shap_values(
+            model, self.housing, self.housing
+        )
+        np.testing.assert_array_almost_equal(
+            shap_values[0].sum(axis=1) + base_value, model(transformed.X)
+        )
+
     def test_kernel_explainer_sgd(self):
         learner = SGDClassificationLearner()
         model = learner(self.titanic)
@@ -312,6 +868,41 @@ class TestExplainer(unittest.TestCase):
         self.assertTupleEqual(shap_values[1].shape, sparse_iris.X.shape)
         self.assertTupleEqual(shap_values[2].shape, sparse_iris.X.shape)
 
+    def test_sparse_trees(self):
+        # wide sparse data, like bag-of-words
+        random = np.random.RandomState(0)
+        x = sp.random(300, 2000, density=0.01, format="csr",
+                      random_state=random)
+        y = (x[:, :10].sum(axis=1).A1 > 0.1).astype(float)
+        domain = Domain(
+            [ContinuousVariable(f"w{i}") for i in range(2000)],
+            DiscreteVariable("y", values=("0", "1"))
+        )
+        data = Table.from_numpy(domain, x, y)
+        dense = Table.from_numpy(domain, x.toarray(), y)
+        model = RandomForestLearner(n_estimators=10, random_state=0)(data)
+
+        with patch("orangecontrib.explain.explainer._explain_other_models") \
+                as explain_other, \
+                patch("orangecontrib.explain.explainer.MAX_DENSE_SIZE",
+                      7 * 2000):
+            shap_values, _, _, base_value = compute_shap_values(
+                model, data, data
+            )
+            explain_other.assert_not_called()
+        expected, _, _, expected_base = compute_shap_values(
+            model, dense, dense
+        )
+        np.testing.assert_array_almost_equal(shap_values, expected)
+        np.testing.assert_array_almost_equal(base_value, expected_base)
+
+    def test_dense_chunks(self):
+        x = sp.random(50, 20, density=0.1, format="csr", random_state=0)
+        with patch("orangecontrib.explain.explainer.MAX_DENSE_SIZE", 100):
+            chunks = list(_dense_chunks(x))
+        self.assertEqual([len(c) for c in chunks], [5] * 10)
+        np.testing.assert_array_equal(np.vstack(chunks), x.toarray())
+
     def test_missing_values(self):
         heart_disease = Table("heart_disease.tab")
         learner = TreeLearner()
@@ -326,7 +917,7 @@ class TestExplainer(unittest.TestCase):
     def test_compute_colors(self):
         heart_disease = Table.from_file("heart_disease.tab")
         colors = compute_colors(heart_disease)
-        self.assertEqual(colors.dtype, int)
+        self.assertEqual(colors.dtype, np.uint8)
         self.assertTrue((colors <= 255).all())
         self.assertTrue((colors >= 0).all())
         self.assertTupleEqual(colors.shape, heart_disease.X.shape + (3,))
@@ -344,9 +935,98 @@ class TestExplainer(unittest.TestCase):
         colors = compute_colors(titanic_proc)
         self.assertTupleEqual(colors.shape, titanic_proc.X.shape + (3,))
 
+    def test_compute_colors_values(self):
+        x = np.array([[0, 1, np.nan, 5],
+                      [5, 1, 2, 5],
+                      [10, 1, 4, 5],
+                      [np.nan, 1, 6, 5]] * 10, dtype=float)
+        x[0, 0] = 100  # an outlier is clipped to the 95th percentile
+        domain = Domain([ContinuousVariable(n) for n in "abc"]
+                        + [DiscreteVariable("d", values=tuple("012345"))])
+        data = Table.from_numpy(domain, x)
+        colors = compute_colors(data)
+
+        low, high = np.array(RGB_LOW), np.array(RGB_HIGH)
+        np.testing.assert_array_equal(colors[1, 0], (low + high) // 2)
+        np.testing.assert_array_equal(colors[2, 0], high)
+        np.testing.assert_array_equal(colors[0, 0], high)
+        np.testing.assert_array_equal(colors[4, 0], low)
+        # missing values are gray, constant columns have the average color
+        np.testing.assert_array_equal(colors[3, 0], [100, 100, 100])
+        np.testing.assert_array_equal(colors[0, 2], [100, 100, 100])
+        np.testing.assert_array_equal(colors[:, 1], np.tile(
+            (0.5 * (high - low) + low).astype(int), (40, 1)
+        ))
+        np.testing.assert_array_equal(colors[:, 3], np.tile(
+            domain["d"].colors[5], (40, 1)
+        ))
+
+        # colors are computed in chunks of rows; sparse data is supported
+        with patch("orangecontrib.explain.explainer.MAX_DENSE_SIZE", 10):
+            np.testing.assert_array_equal(compute_colors(data), colors)
+            np.testing.assert_array_equal(
+                compute_colors(data.to_sparse()), colors
+            )
+
+    def test_get_min_max(self):
+        rng = np.random.default_rng(0)
+        x = np.round(rng.normal(size=(50, 4)) * 3)
+        x[rng.random(x.shape) < 0.3] = np.nan
+        x[:, 3] = np.nan
+        with np.testing.suppress_warnings() as sup:
+            sup.filter(RuntimeWarning)
+            expected = np.nanpercentile(x, [1, 5, 50, 95], axis=0)
+        quantiles, min_, max_ = _column_statistics(x, (1, 5, 50, 95))
+        np.testing.assert_array_equal(quantiles, expected)
+        np.testing.assert_array_equal(min_[:3], np.nanmin(x[:, :3], axis=0))
+        np.testing.assert_array_equal(max_[:3], np.nanmax(x[:, :3], axis=0))
+        self.assertTrue(np.isnan(min_[3]) and np.isnan(max_[3]))
+
+        # a column with a dominant value falls back to the minimum and maximum
+        x = np.zeros((100, 2))
+        x[:, 1] = np.arange(100)
+        x[0, 0], x[1, 0], x[2, 0] = -1, 2, np.nan
+        vmin, vmax = _get_min_max(x)
+        np.testing.assert_array_equal(vmin, [-1, 4.95])
+        np.testing.assert_array_equal(vmax, [2, 94.05])
+
+    def test_color_bounds_exact(self):
+        # percentiles are not sampled by default, even for tall data
+        x = np.random.default_rng(0).normal(size=(10 ** 6 + 1, 1))
+        data = Table.from_numpy(Domain([ContinuousVariable("a")]), x)
+        with patch("orangecontrib.explain.explainer.color_bounds_cache",
+                   None), \
+                patch("orangecontrib.explain.explainer._column_statistics",
+                      wraps=_column_statistics) as column_statistics:
+            compute_colors(data)
+        self.assertEqual(len(column_statistics.call_args[0][0]), len(x))
+
+        # when enabled, percentiles of tall data are estimated from a sample
+        x = np.random.default_rng(0).normal(size=(10000, 1))
+        data = Table.from_numpy(Domain([ContinuousVariable("a")]), x)
+        with patch("orangecontrib.explain.explainer.MAX_QUANTILE_ROWS",
+                   1000), \
+                patch("orangecontrib.explain.explainer._column_statistics",
+                      wraps=_column_statistics) as column_statistics:
+            compute_colors(data)
+        self.assertEqual(len(column_statistics.call_args[0][0]), 1000)
+
+    def test_color_bounds_cached(self):
+        data = Table("housing")
+        with patch("orangecontrib.explain.explainer.color_bounds_cache",
+                   MemoryCache()), \
+                patch("orangecontrib.explain.explainer._get_min_max",
+                      wraps=_get_min_max) as get_min_max:
+            colors = compute_colors(data)
+            self.assertEqual(get_min_max.call_count, 1)
+            np.testing.assert_array_equal(compute_colors(data.copy()), colors)
+            self.assertEqual(get_min_max.call_count, 1)
+            compute_colors(data[:100])
+            self.assertEqual(get_min_max.call_count, 2)
+
     def test_subsample(self):
         titanic = Table("titanic")
-        learner = LogisticRegressionLearner()
+        learner = RandomForestLearner(n_estimators=10)
         model = learner(titanic)
 
         shap_values, _, sample_mask, _ = compute_shap_values(
@@ -359,6 +1039,259 @@ class TestExplainer(unittest.TestCase):
         _, _, sample_mask_new, _ = compute_shap_values(model, titanic, titanic)
         np.testing.assert_array_equal(sample_mask, sample_mask_new)
 
+    def test_partial_results(self):
+        titanic = Table("titanic")
+        model = RandomForestLearner(n_estimators=10)(titanic)
+
+        chunks = []
+        shap_values, _, sample_mask, base_value = compute_shap_values(
+            model, titanic, titanic, n_samples=None,
+            partial_result_callback=lambda *args: chunks.append(args)
+        )
+        # all rows explained
+        self.assertTrue(sample_mask.all())
+        self.assertEqual(len(titanic), len(shap_values[0]))
+
+        self.assertGreater(len(chunks), 1)
+        indices = np.hstack([idx for _, _, idx, _ in chunks])
+        np.testing.assert_array_equal(np.arange(len(titanic)), indices)
+        for i in range(2):
+            np.testing.assert_array_equal(
+                shap_values[i], np.vstack([sv[i] for sv, _, _, _ in chunks])
+            )
+        np.testing.assert_array_equal(base_value, chunks[0][3])
+
+    def test_shap_cache(self):
+        model = KNNLearner()(self.iris)
+        data = self.iris[::10]
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch("orangecontrib.explain.explainer.shap_cache",
+                      DiskCache(tmp)):
+            shap_values, transformed, mask, base_value = compute_shap_values(
+                model, data, self.iris
+            )
+
+            with patch("orangecontrib.explain.explainer._explain_trees",
+                       side_effect=_explain_trees) as explain_trees:
+                shap_values2, transformed2, mask2, base_value2 = \
+                    compute_shap_values(model, data, self.iris)
+                explain_trees.assert_not_called()
+                np.testing.assert_array_equal(shap_values, shap_values2)
+                np.testing.assert_array_equal(transformed.X, transformed2.X)
+                np.testing.assert_array_equal(mask, mask2)
+                np.testing.assert_array_equal(base_value, base_value2)
+
+                # different parameters
+                compute_shap_values(model, data, self.iris, n_samples=10)
+                explain_trees.assert_called_once()
+
+                explain_trees.reset_mock()
+                compute_shap_values(model, data, self.iris, use_cache=False)
+                explain_trees.assert_called_once()
+
+                # different data
+                explain_trees.reset_mock()
+                compute_shap_values(model, data, self.iris[1::10])
+                explain_trees.assert_called_once()
+
+    def test_shap_cache_between_processes(self):
+        script = """if True:
+            import sys
+            import numpy as np
+            from Orange.classification import LogisticRegressionLearner
+            from Orange.data import Table
+            from orangecontrib.explain import explainer
+            from orangecontrib.explain.cache import DiskCache
+
+            explainer.shap_cache = DiskCache(sys.argv[1])
+            explainer.shap_memory_cache = explainer.shap_rows_cache = None
+            data = Table("heart_disease")
+            model = LogisticRegressionLearner()(data)
+            shap_values, _, _, _ = explainer.compute_shap_values(
+                model, data[:20], data)
+            np.save(sys.argv[2], shap_values)
+        """
+        data = self.hearth_disease
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_dir = os.path.join(tmp, "cache")
+            values_path = os.path.join(tmp, "values.npy")
+            subprocess.run([sys.executable, "-c", script, cache_dir,
+                            values_path], check=True)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+            # the model is trained again, as when a workflow is reopened
+            model = LogisticRegressionLearner()(data)
+            with patch("orangecontrib.explain.explainer.shap_cache",
+                       DiskCache(cache_dir)), \
+                    patch("orangecontrib.explain.explainer.Explainer",
+                          side_effect=AssertionError("not cached")):
+                shap_values, _, _, _ = compute_shap_values(
+                    model, data[:20], data
+                )
+            np.testing.assert_array_equal(shap_values, np.load(values_path))
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+    def test_enable_disk_cache(self):
+        explainer = orangecontrib.explain.explainer
+        self.assertIsNone(explainer.shap_cache)
+        model = KNNLearner()(self.iris)
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch("orangecontrib.explain.explainer.SHAP_CACHE_DIR", tmp):
+            enable_disk_cache()
+            self.assertEqual(explainer.shap_cache.directory, tmp)
+            compute_shap_values(model, self.iris[::10], self.iris)
+            self.assertEqual(len(os.listdir(tmp)), 1)
+
+            enable_disk_cache(False)
+            self.assertIsNone(explainer.shap_cache)
+            self.assertEqual(os.listdir(tmp), [])
+
+    def test_is_explanation_cached(self):
+        model = KNNLearner()(self.iris)
+        data = self.iris[::10]
+        self.assertFalse(is_explanation_cached(model, data, self.iris))
+        with patch("orangecontrib.explain.explainer.shap_memory_cache",
+                   MemoryCache()):
+            self.assertFalse(is_explanation_cached(model, data, self.iris))
+            compute_shap_values(model, data, self.iris)
+            self.assertTrue(is_explanation_cached(model, data, self.iris))
+            self.assertFalse(is_explanation_cached(model, data, self.iris,
+                                                   n_samples=10))
+            self.assertFalse(is_explanation_cached(model, self.iris[1::10],
+                                                   self.iris))
+
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch("orangecontrib.explain.explainer.shap_cache",
+                      DiskCache(tmp)):
+            self.assertFalse(is_explanation_cached(model, data, self.iris))
+            compute_shap_values(model, data, self.iris)
+            self.assertTrue(is_explanation_cached(model, data, self.iris))
+
+    def test_shap_memory_cache(self):
+        model = KNNLearner()(self.iris)
+        data = self.iris[::10]
+        with patch("orangecontrib.explain.explainer.shap_memory_cache",
+                   MemoryCache()), \
+                patch("orangecontrib.explain.explainer._explain_trees",
+                      side_effect=_explain_trees) as explain_trees:
+            shap_values, _, mask, _ = compute_shap_values(
+                model, data, self.iris
+            )
+            explain_trees.assert_called_once()
+
+            partial = Mock()
+            shap_values2, _, mask2, _ = compute_shap_values(
+                model, data, self.iris, partial_result_callback=partial
+            )
+            explain_trees.assert_called_once()
+            self.assertIs(shap_values, shap_values2)
+            np.testing.assert_array_equal(
+                partial.call_args[0][2], np.flatnonzero(mask)
+            )
+
+            compute_shap_values(model, data, self.iris, use_cache=False)
+            self.assertEqual(explain_trees.call_count, 2)
+
+    def test_shap_rows_cache(self):
+        model = KNNLearner()(self.iris)
+        expected, _, expected_mask, _ = compute_shap_values(
+            model, self.iris, self.iris, n_samples=None
+        )
+
+        rows_cache = MemoryCache()
+        with patch("orangecontrib.explain.explainer.shap_rows_cache",
+                   rows_cache), \
+                patch.object(Explainer, "shap_values", autospec=True,
+                             side_effect=Explainer.shap_values) as shap_values:
+            compute_shap_values(model, self.iris[:100], self.iris,
+                                n_samples=None)
+            self.assertEqual(
+                sum(len(args[1]) for args, _ in shap_values.call_args_list),
+                100
+            )
+
+            # only new rows are explained
+            shap_values.reset_mock()
+            chunks = []
+            values, _, mask, _ = compute_shap_values(
+                model, self.iris, self.iris, n_samples=None,
+                partial_result_callback=lambda *args: chunks.append(args)
+            )
+            self.assertEqual(
+                sum(len(args[1]) for args, _ in shap_values.call_args_list),
+                50
+            )
+            np.testing.assert_array_almost_equal(values, expected)
+            np.testing.assert_array_equal(mask, expected_mask)
+            np.testing.assert_array_almost_equal(
+                [np.vstack(v) for v in zip(*(c[0] for c in chunks))], expected
+            )
+
+            # sampled rows remain sampled when data grows
+            rows_cache.clear()
+            _, _, mask, _ = compute_shap_values(
+                model, self.iris[:100], self.iris, n_samples=50
+            )
+            shap_values.reset_mock()
+            _, _, mask2, _ = compute_shap_values(
+                model, self.iris, self.iris, n_samples=50
+            )
+            n_new = sum(len(args[1])
+                        for args, _ in shap_values.call_args_list)
+            self.assertEqual(n_new, np.sum(mask2[:100] != mask))
+            self.assertLess(n_new, 50)
+
+    def test_progressive_refinement(self):
+        # explanation of iris is exact; refinements add rows
+        model = KNNLearner()(self.iris)
+        results = []
+        shap_values, _, mask, base_value = compute_shap_values(
+            model, self.iris, self.iris, n_samples=None,
+            max_evaluations=10 ** 6,
+            refined_result_callback=lambda *args: results.append(args)
+        )
+        self.assertEqual([r[2].sum() for r in results], [10, 20, 40, 80, 150])
+        for values, _, mask_, _ in results[:-1]:
+            np.testing.assert_array_equal(
+                values[0], shap_values[0][mask_[mask]]
+            )
+        expected, _, _, _ = compute_shap_values(
+            model, self.iris, self.iris, n_samples=None
+        )
+        np.testing.assert_array_almost_equal(shap_values, expected)
+
+        # number of model's evaluations is limited
+        results.clear()
+        compute_shap_values(
+            model, self.iris, self.iris, n_samples=None,
+            max_evaluations=4000,
+            refined_result_callback=lambda *args: results.append(args)
+        )
+        self.assertEqual([r[2].sum() for r in results], [10, 20])
+
+        # with many features, refinements also add coalitions
+        housing = self.housing[:100]
+        model = KNNRegressionLearner()(housing)
+        results.clear()
+        with patch("orangecontrib.explain.explainer.Explainer",
+                   wraps=Explainer) as explainer:
+            compute_shap_values(
+                model, housing, housing, max_evaluations=10 ** 5,
+                refined_result_callback=lambda *args: results.append(args)
+            )
+        self.assertEqual([r[2].sum() for r in results], [10, 20])
+        self.assertEqual(
+            [call[0][4] for call in explainer.call_args_list], [100, 200]
+        )
+
+        # the first result is computed in any case
+        results.clear()
+        compute_shap_values(
+            model, housing, housing, time_budget=0,
+            refined_result_callback=lambda *args: results.append(args)
+        )
+        self.assertEqual(len(results), 1)
+
     def test_shap_random_seed(self):
         model = LogisticRegressionLearner()(self.iris)
 
@@ -424,6 +1357,74 @@ class TestExplainer(unittest.TestCase):
         )
         self.assertTupleEqual((3, 1), predictions.shape)
 
+    def test_explain_predictions_linear_additive(self):
+        # linear classifiers are explained in the space of log-odds (logits),
+        # so the predictions are values of the decision function
+        for data, space in ((self.hearth_disease, "log-odds"),
+                            (self.iris, "logit")):
+            model = LogisticRegressionLearner()(data)
+            self.assertEqual(space, explanation_space(model))
+            shap_values, predictions, transformed, _, base_value = \
+                explain_predictions(model, data, data)
+            for i, values in enumerate(shap_values):
+                np.testing.assert_allclose(
+                    base_value[i] + values.sum(axis=1), predictions[:, i],
+                    atol=1e-4
+                )
+            if len(base_value) == 2:
+                np.testing.assert_allclose(
+                    predictions[:, 1],
+                    model.skl_model.decision_function(transformed.X),
+                    atol=1e-6
+                )
+
+        model = LinearRegressionLearner()(self.housing)
+        self.assertIsNone(explanation_space(model))
+        shap_values, predictions, _, _, base_value = \
+            explain_predictions(model, self.housing, self.housing)
+        np.testing.assert_allclose(
+            base_value[0] + shap_values[0].sum(axis=1), predictions[:, 0],
+            rtol=1e-5
+        )
+        self.assertIsNone(explanation_space(RandomForestLearner()(self.iris)))
+
+    def test_explain_predictions_trees(self):
+        iris_reg = self.iris.transform(
+            Domain(self.iris.domain.attributes[:3],
+                   self.iris.domain.attributes[3])
+        )
+        for learner, data in (
+                (TreeLearner(), self.titanic[::10]),
+                (TreeLearner(), self.iris),
+                (RandomForestLearner(n_estimators=10), self.iris),
+                (TreeRegressionLearner(), iris_reg),
+        ):
+            model = learner(data)
+            ret = model.Probs if model.domain.class_var.is_discrete \
+                else model.Value
+            expected = model(data, ret).reshape(len(data), -1)
+
+            partial = []
+            shap_values, predictions, _, mask, _ = explain_predictions(
+                model, data, data, n_samples=50,
+                partial_result_callback=lambda *args: partial.append(args)
+            )
+            self.assertEqual(mask.sum(), 50)
+            # explained rows are predicted from SHAP values
+            np.testing.assert_array_almost_equal(predictions, expected)
+            for _, pred, _, row_indices, _ in partial:
+                np.testing.assert_array_almost_equal(
+                    pred, expected[row_indices]
+                )
+
+        # only rows that are not explained are predicted by the tree
+        model = TreeLearner()(self.iris)
+        predict = Mock(wraps=model.predict_storage)
+        model.predict_storage = predict
+        explain_predictions(model, self.iris, self.iris, n_samples=50)
+        predict.assert_called_once()
+        self.assertEqual(len(predict.call_args[0][0]), 100)
+
     def test_prepare_force_plot_data_multi_inst(self):
         base_value = np.array([3])
         shap_values = [
@@ -501,6 +1502,99 @@ class TestExplainer(unittest.TestCase):
             np.testing.assert_array_equal(neg_data[i][0], y2)
             np.testing.assert_array_equal(neg_data[i][1], y1)
 
+    def test_explanation_result(self):
+        data = Table("housing")[:20]
+        values = [np.arange(60, dtype=float).reshape(5, 12) - 30]
+        mask = np.zeros(20, dtype=bool)
+        mask[[1, 4, 7, 8, 15]] = True
+        predictions = np.arange(20, dtype=float)[:, None]
+        result = ExplanationResult.from_mask(
+            values, mask, transformed_data=data, predictions=predictions
+        )
+        self.assertEqual(result.values.dtype, np.float32)
+        self.assertEqual(result.values.shape, (1, 5, 12))
+        self.assertTrue(result.values.flags.c_contiguous)
+        assert_array_equal(result.row_indices, [1, 4, 7, 8, 15])
+        assert_array_equal(result.mask, mask)
+        self.assertEqual(result.names[0], data.domain.attributes[0].name)
+        self.assertRaises(AttributeError, setattr, result, "other", 1)
+
+        # derived values are computed once
+        with patch("orangecontrib.explain.explainer.compute_colors",
+                   wraps=compute_colors) as colors:
+            assert_array_equal(result.colors, compute_colors(data[mask]))
+            result.colors  # pylint: disable=pointless-statement
+            self.assertEqual(colors.call_count, 1)
+        assert_array_equal(result.mean_abs(0),
+                           np.mean(np.abs(values[0]), axis=0))
+        self.assertIs(result.mean_abs(0), result.mean_abs(0))
+        with patch("orangecontrib.explain.explainer.get_instance_ordering",
+                   wraps=get_instance_ordering) as ordering:
+            order = result.ordering(0, OUTPUT_ORDER, data)
+            assert_array_equal(order, [4, 3, 2, 1, 0])
+            self.assertIs(result.ordering(0, OUTPUT_ORDER, data), order)
+            self.assertEqual(ordering.call_count, 1)
+
+        # rows are sorted by their indices
+        colors = np.arange(5)[:, None, None] * np.ones((1, 12, 3))
+        result = ExplanationResult(
+            values, [8, 1, 15, 4, 7], 20, colors=colors,
+            transformed_data=data
+        )
+        assert_array_equal(result.row_indices, [1, 4, 7, 8, 15])
+        assert_array_equal(result.values[0], values[0][[1, 3, 4, 0, 2]])
+        assert_array_equal(result.colors, colors[[1, 3, 4, 0, 2]])
+
+    def test_instance_ordering_large(self):
+        rng = np.random.default_rng(0)
+        # three well separated groups of rows, shuffled
+        labels = rng.permutation(np.repeat(np.arange(3), 100))
+        shap_values = rng.normal(size=(300, 4)) + labels[:, None] * 10
+        data = Table.from_numpy(
+            Domain([ContinuousVariable("x")]), labels[:, None].astype(float)
+        )
+        predictions = np.zeros(300)
+
+        with patch("orangecontrib.explain.explainer.MAX_HCLUST_ROWS", 30), \
+                patch("orangecontrib.explain.explainer.hclust_ordering",
+                      wraps=hclust_ordering) as hclust:
+            idxs = get_instance_ordering(
+                shap_values, predictions, data, SIMILARITY_ORDER)
+            # only the sample is clustered
+            self.assertEqual(len(hclust.call_args[0][0]), 30)
+            assert_array_equal(np.sort(idxs), np.arange(300))
+            # groups are not split
+            self.assertEqual(np.count_nonzero(np.diff(labels[idxs])), 2)
+
+            idxs = get_instance_ordering(
+                shap_values, predictions, data, data.domain[0])
+            assert_array_equal(np.sort(idxs), np.arange(300))
+            assert_array_equal(labels[idxs], np.sort(labels))
+
+    def test_prepare_force_plot_data_multi_inst_random(self):
+        shap_values = np.random.default_rng(0).normal(size=(20, 13))
+        domain = Table("housing").domain
+        _, pos_data, neg_data, pos_labels, neg_labels = \
+            prepare_force_plot_data_multi_inst(shap_values, 2, domain)
+
+        outputs = shap_values.sum(axis=1) + 2
+        positive, negative = shap_values.clip(min=0), shap_values.clip(max=0)
+        pos_idxs = np.argsort(-positive.sum(axis=0))
+        neg_idxs = np.argsort(negative.sum(axis=0))
+        self.assertListEqual(
+            pos_labels, [domain.attributes[i].name for i in pos_idxs])
+        self.assertListEqual(
+            neg_labels, [domain.attributes[i].name for i in neg_idxs])
+        for i in range(13):
+            np.testing.assert_allclose(
+                pos_data[i],
+                [outputs - positive[:, pos_idxs[:i]].sum(axis=1),
+                 outputs - positive[:, pos_idxs[:i + 1]].sum(axis=1)])
+            np.testing.assert_allclose(
+                neg_data[i],
+                [outputs - negative[:, neg_idxs[:i + 1]].sum(axis=1),
+                 outputs - negative[:, neg_idxs[:i]].sum(axis=1)])
+
     def test_prepare_force_plot_data_target_0(self):
         shap_values = [
             np.array([[1, -2, 6, 5], [-2, -3, -1, -5], [1, 2, 4, 5]]),
@@ -725,6 +1819,52 @@ class TestExplainer(unittest.TestCase):
         )
         self.assertListEqual([(-5, 4), (3, 13), (-6, 4)], ranges)
 
+    def test_force_plot_rows(self):
+        shap_values = [
+            np.random.random((3, 4)),
+            np.array([[1, -2, 6, 5], [-2, -3, -1, -5], [1, 2, 4, 5]]),
+        ]
+        predictions = np.array([[1, 2], [1, 3], [1, 4]])
+        data = self.iris[:3]
+        expected = prepare_force_plot_data(
+            shap_values, data, predictions, 1, top_n_features=3
+        )
+        rows = ForcePlotRows(
+            shap_values, data, predictions, 1, top_n_features=3
+        )
+        self.assertEqual(len(rows), 3)
+        for i in (0, 2, -1):
+            self.assertTupleEqual(rows[i], tuple(e[i] for e in expected))
+        self.assertRaises(IndexError, rows.__getitem__, 3)
+
+        # only the requested row is prepared
+        with patch("orangecontrib.explain.explainer._force_plot_rows",
+                   wraps=_force_plot_rows) as force_plot_rows:
+            rows[1]
+            self.assertEqual(len(force_plot_rows.call_args[0][0]), 1)
+
+        # the same for sparse data
+        sparse_rows = ForcePlotRows(
+            shap_values, data.to_sparse(), predictions, 1, top_n_features=3
+        )
+        self.assertTupleEqual(sparse_rows[1], rows[1])
+
+    def test_top_features(self):
+        abs_values = np.array([[1, 3, 2, 3, 3, 0],
+                               [0, 0, 0, 0, 0, 0],
+                               [6, 5, 4, 3, 2, 1]])
+        assert_array_equal(
+            _top_features(abs_values, 4),
+            [[4, 3, 1, 2], [5, 4, 3, 2], [0, 1, 2, 3]]
+        )
+        assert_array_equal(
+            _top_features(abs_values, 2), [[4, 3], [5, 4], [0, 1]]
+        )
+        assert_array_equal(
+            _top_features(abs_values, 10),
+            [[4, 3, 1, 2, 0, 5], [5, 4, 3, 2, 1, 0], [0, 1, 2, 3, 4, 5]]
+        )
+
     def test_no_class(self):
         iris_no_class = Table.from_table(
             Domain(self.iris.domain.attributes), self.iris
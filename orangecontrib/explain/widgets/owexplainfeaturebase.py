@@ -1,6 +1,6 @@
 # pylint: disable=missing-docstring,no-name-in-module,invalid-name
 # pylint: disable=too-few-public-methods
-from typing import Tuple, Optional, List, Dict, Union
+from typing import Tuple, Optional, List, Dict, Union, Callable
 from types import SimpleNamespace
 
 import numpy as np
@@ -10,7 +10,8 @@ from AnyQt.QtGui import QPen, QPainter, QFont, QFontMetrics, QResizeEvent, \
     QColor
 from AnyQt.QtWidgets import QGraphicsItemGroup, QGraphicsLineItem, \
     QGraphicsScene, QGraphicsWidget, QGraphicsGridLayout, QSizePolicy, \
-    QGraphicsSimpleTextItem, QGraphicsSceneMouseEvent, QGraphicsRectItem
+    QGraphicsSimpleTextItem, QGraphicsSceneMouseEvent, QGraphicsRectItem, \
+    QWidget
 
 from orangewidget.utils.visual_settings_dlg import VisualSettingsDialog
 
@@ -29,6 +30,8 @@ from Orange.widgets.visualize.utils.customizableplot import \
 from Orange.widgets.visualize.utils.plotutils import AxisItem
 from Orange.widgets.widget import Input, Output, OWWidget, Msg
 
+from orangecontrib.explain.explainer import N_SAMPLES
+
 MAX_N_ITEMS = 100
 
 
@@ -381,6 +384,74 @@ class GraphicsView(StickyGraphicsView):
         super().resizeEvent(ev)
 
 
+class ExplanationParametersMixin:
+    """
+    Settings and controls of the explanation, shared by widgets that explain
+    rows with SHAP values: whether all rows are explained (or a sample of
+    N_SAMPLES rows) and the time limit of the progressive refinement.
+    """
+    explain_all_rows = Setting(False)
+    use_time_limit = Setting(False)
+    time_limit = Setting(10)
+
+    def _add_explanation_box(self, callback: Callable) -> QWidget:
+        box = gui.vBox(self.controlArea, "Explanation")
+        gui.checkBox(box, self, "explain_all_rows", "Explain all rows",
+                     tooltip=f"When unchecked, at most {N_SAMPLES} randomly "
+                             f"sampled rows are explained.",
+                     callback=callback)
+        gui.spin(box, self, "time_limit", 1, 3600, label="Time limit:",
+                 posttext="s", checked="use_time_limit", controlWidth=50,
+                 tooltip="Explain a small sample first and refine the "
+                         "explanation while the next refinement is "
+                         "expected to finish within the limit.",
+                 callback=callback, checkCallback=callback)
+        return box
+
+    def explanation_parameters(self) -> Tuple[Optional[int], Optional[float]]:
+        """ The number of explained rows (None for all) and the time limit """
+        return None if self.explain_all_rows else N_SAMPLES, \
+            self.time_limit if self.use_time_limit else None
+
+
+class ExplainedChunks:
+    """
+    SHAP values of chunks of rows, reported by partial_result_callback of
+    get_shap_values_and_colors and explain_predictions, joined into a
+    partial explanation of all rows explained so far.
+    """
+    def __init__(self, n_rows: int):
+        # the number of rows that are explained in total
+        self.n_rows = n_rows
+        self.__values: List[np.ndarray] = []
+        self.__row_indices: List[np.ndarray] = []
+        self.__colors: List[np.ndarray] = []
+
+    def add(self, values: np.ndarray, row_indices: np.ndarray,
+            colors: Optional[np.ndarray] = None) -> bool:
+        """
+        Add a chunk; return False for the last chunk, which needs not be
+        shown since the final results follow immediately.
+        """
+        self.__values.append(values)
+        self.__row_indices.append(row_indices)
+        if colors is not None:
+            self.__colors.append(colors)
+        return len(self.row_indices) < self.n_rows
+
+    @property
+    def values(self) -> np.ndarray:
+        return np.concatenate(self.__values, axis=1)
+
+    @property
+    def row_indices(self) -> np.ndarray:
+        return np.hstack(self.__row_indices)
+
+    @property
+    def colors(self) -> Optional[np.ndarray]:
+        return np.vstack(self.__colors) if self.__colors else None
+
+
 class OWExplainFeatureBase(OWWidget, ConcurrentWidgetMixin, openclass=True):
     class Inputs:
         data = Input("Data", Table, default=True)
@@ -582,8 +653,9 @@ class OWExplainFeatureBase(OWWidget, ConcurrentWidgetMixin, openclass=True):
         raise NotImplementedError
 
     # Concurrent
-    def on_partial_result(self, _):
-        pass
+    def on_partial_result(self, results: Optional[BaseResults]):
+        self.results = results
+        self.update_scene()
 
     def on_done(self, results: Optional[BaseResults]):
         self.results = results
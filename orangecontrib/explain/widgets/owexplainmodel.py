@@ -15,23 +15,40 @@ from Orange.classification import RandomForestLearner
 from Orange.data import Table, Domain, ContinuousVariable, StringVariable
 from Orange.data.util import get_unique_names
 from Orange.regression import RandomForestRegressionLearner
+from Orange.util import wrap_callback
 from Orange.widgets import gui
 from Orange.widgets.settings import Setting, ContextSetting, \
     ClassValuesContextHandler
 from Orange.widgets.utils.concurrent import TaskState
 from Orange.widgets.utils.widgetpreview import WidgetPreview
 from Orange.widgets.visualize.utils.customizableplot import Updater
-from Orange.widgets.widget import Output
+from Orange.widgets.widget import Output, Msg
 
-from orangecontrib.explain.explainer import \
-    get_shap_values_and_colors, RGB_LOW, RGB_HIGH, temp_seed
+from orangecontrib.explain.explainer import ExplanationResult, \
+    get_shap_values_and_colors, supports_approximation, n_explained_rows, \
+    is_explanation_cached, explanation_space, compute_shap_interactions, \
+    get_interactions_table, supports_interactions, RGB_LOW, RGB_HIGH, \
+    N_SAMPLES
 from orangecontrib.explain.widgets.owexplainfeaturebase import \
-    OWExplainFeatureBase, BaseResults, FeaturesPlot, BaseParameterSetter, \
-    FeatureItem, SelectionRect as BaseSelectionRect, MAX_N_ITEMS
+    OWExplainFeatureBase, FeaturesPlot, BaseParameterSetter, \
+    FeatureItem, SelectionRect as BaseSelectionRect, MAX_N_ITEMS, \
+    ExplanationParametersMixin, ExplainedChunks
 
 
-class Results(BaseResults):
-    colors: Optional[List[np.ndarray]] = None
+# maximal number of rows shown in the plot; scores and outputs use all rows
+MAX_DISPLAYED_ROWS = N_SAMPLES
+
+
+def displayed_rows(n_rows: int) -> np.ndarray:
+    """
+    Indices of rows that are drawn in the plot: all rows or, for large data,
+    a (deterministic) random sample of MAX_DISPLAYED_ROWS rows, since each
+    row of each feature is a separate graphics item.
+    """
+    if n_rows <= MAX_DISPLAYED_ROWS:
+        return np.arange(n_rows)
+    rng = np.random.default_rng(0)
+    return np.sort(rng.choice(n_rows, MAX_DISPLAYED_ROWS, replace=False))
 
 
 class Legend(QGraphicsWidget):
@@ -146,11 +163,12 @@ class ViolinItem(FeatureItem):
             place_point(x, y, c)
 
     def _prepare_y_data(self, shaps: np.ndarray) -> np.ndarray:
-        with temp_seed(0):
-            n, nbins = len(shaps), 100
-            min_, max_ = np.min(shaps), np.max(shaps)
-            quant = np.round(nbins * (shaps - min_) / (max_ - min_ + 1e-8))
-            inds = np.argsort(quant + np.random.randn(n) * 1e-6)
+        # a local generator keeps the layout deterministic and thread-safe
+        rng = np.random.default_rng(0)
+        n, nbins = len(shaps), 100
+        min_, max_ = np.min(shaps), np.max(shaps)
+        quant = np.round(nbins * (shaps - min_) / (max_ - min_ + 1e-8))
+        inds = np.argsort(quant + rng.standard_normal(n) * 1e-6)
 
         layer, last_bin = 0, -1
         ys = np.zeros(n)
@@ -320,19 +338,18 @@ class ViolinPlot(FeaturesPlot):
         self._range = -abs_max, abs_max
 
     def _set_items(self, x: np.ndarray, labels: List[str], colors: np.ndarray):
-        with temp_seed(0):
-            for i in range(x.shape[1]):
-                item = ViolinItem(self, labels[i], self._range,
-                                  self.item_column_width)
-                item.set_data(x[:, i], colors[:, i])
-                item.selection_changed.connect(self.select)
-                self._items.append(item)
-                self._layout.addItem(item, i, FeaturesPlot.ITEM_COLUMN)
-                if i == MAX_N_ITEMS - 1:
-                    break
-
-
-class OWExplainModel(OWExplainFeatureBase):
+        for i in range(x.shape[1]):
+            item = ViolinItem(self, labels[i], self._range,
+                              self.item_column_width)
+            item.set_data(x[:, i], colors[:, i])
+            item.selection_changed.connect(self.select)
+            self._items.append(item)
+            self._layout.addItem(item, i, FeaturesPlot.ITEM_COLUMN)
+            if i == MAX_N_ITEMS - 1:
+                break
+
+
+class OWExplainModel(OWExplainFeatureBase, ExplanationParametersMixin):
     name = "Explain Model"
     description = "Model explanation widget."
     keywords = ["explain", "explain prediction", "explain model"]
@@ -344,10 +361,16 @@ class OWExplainModel(OWExplainFeatureBase):
 
     class Outputs(OWExplainFeatureBase.Outputs):
         impact = Output("Impact", Table)
+        interactions = Output("Interactions", Table)
+
+    class Information(OWExplainFeatureBase.Information):
+        no_interactions = Msg("Interactions are computed only for "
+                              "scikit-learn's tree models.")
 
     settingsHandler = ClassValuesContextHandler()
     target_index = ContextSetting(0)
     show_legend = Setting(True)
+    compute_interactions = Setting(False)
 
     PLOT_CLASS = ViolinPlot
 
@@ -363,6 +386,13 @@ class OWExplainModel(OWExplainFeatureBase):
             callback=self.__target_combo_changed,
             contentsLength=12)
 
+        box = self._add_explanation_box(self.__parameter_changed)
+        gui.checkBox(box, self, "compute_interactions", "Feature interactions",
+                     tooltip="Output mean absolute SHAP interaction values "
+                             "of feature pairs (for scikit-learn's tree "
+                             "models).",
+                     callback=self.__parameter_changed)
+
         super()._add_controls()
         gui.checkBox(self.display_box, self, "show_legend", "Show legend",
                      callback=self.__show_check_changed)
@@ -371,8 +401,13 @@ class OWExplainModel(OWExplainFeatureBase):
         self.update_scene()
         self.update_scores()
         self.update_impact()
+        self.update_interactions()
         self._clear_selection()
 
+    def __parameter_changed(self):
+        self.clear()
+        self.start(self.run, *self.get_runner_parameters())
+
     def __show_check_changed(self):
         if self.plot is not None:
             self.plot.show_legend(self.show_legend)
@@ -393,27 +428,41 @@ class OWExplainModel(OWExplainFeatureBase):
             else:
                 raise NotImplementedError
 
+    def get_runner_parameters(self) -> Tuple[Optional[Table], Optional[Model],
+                                             Optional[int], Optional[float],
+                                             bool]:
+        return (self.data, self.model, *self.explanation_parameters(),
+                self.compute_interactions)
+
+    def clear(self):
+        super().clear()
+        self.Information.no_interactions.clear()
+
     # Plot setup
     def update_scene(self):
         super().update_scene()
         if self.results is not None:
-            assert isinstance(self.results.x, list)
-            x = self.results.x[self.target_index]
-            scores_x = np.mean(np.abs(x), axis=0)
+            rows = displayed_rows(len(self.results.row_indices))
+            x = self.results.values[self.target_index][rows]
+            scores_x = self.results.mean_abs(self.target_index)
             indices = np.argsort(scores_x)[::-1]
-            colors = self.results.colors
+            colors = self.results.colors[rows]
             names = [self.results.names[i] for i in indices]
             if x.shape[1]:
                 self.setup_plot(x[:, indices], names, colors[:, indices])
 
     def setup_plot(self, values, names, *plot_args):
         super().setup_plot(values, names, *plot_args)
+        space = explanation_space(self.model) if self.model else None
+        if space:
+            self.plot.bottom_axis.setLabel(
+                f"{ViolinPlot.BOTTOM_AXIS_LABEL} ({space})")
         self.plot.show_legend(self.show_legend)
 
     # Selection
     def update_selection(self, min_val: float, max_val: float, attr_name: str):
         assert self.results is not None
-        x = self.results.x[self.target_index]
+        x = self.results.values[self.target_index]
         column = self.results.names.index(attr_name)
         mask = self.results.mask.copy()
         mask[self.results.mask] = np.logical_and(x[:, column] <= max_val,
@@ -437,7 +486,8 @@ class OWExplainModel(OWExplainFeatureBase):
         mask[row_indices] = True
         mask = np.logical_and(self.results.mask, mask)
         row_indices = np.flatnonzero(mask[self.results.mask])
-        column = self.results.x[self.target_index][row_indices, col_index]
+        x = self.results.values[self.target_index]
+        column = x[row_indices, col_index]
         x1, x2 = np.min(column), np.max(column)
         self.plot.select_from_settings(x1, x2, attr_name)
         super().select_pending(())
@@ -448,8 +498,7 @@ class OWExplainModel(OWExplainFeatureBase):
             if self.selection and self.selection[1] else None
 
     def get_scores_table(self) -> Table:
-        x = self.results.x[self.target_index]
-        scores = np.mean(np.abs(x), axis=0)
+        scores = self.results.mean_abs(self.target_index)
         domain = Domain([ContinuousVariable("Score")],
                         metas=[StringVariable("Feature")])
         scores_table = Table(domain, scores[:, None],
@@ -465,7 +514,7 @@ class OWExplainModel(OWExplainFeatureBase):
 
     def get_impact_table(self) -> Table:
         data = self.data
-        x = self.results.x[self.target_index]
+        x = self.results.values[self.target_index]
         mask = self.results.mask
         proposed = [f"I({n})" for n in self.results.names]
         names = [v.name for v in data.domain.class_vars + data.domain.metas]
@@ -476,10 +525,21 @@ class OWExplainModel(OWExplainFeatureBase):
         impact_table.name = "Feature Impact"
         return impact_table
 
+    def update_interactions(self):
+        interactions = None
+        if self.results is not None and self.results.interactions is not None:
+            interactions = get_interactions_table(self.results.interactions,
+                                                  max(self.target_index, 0))
+        self.Outputs.interactions.send(interactions)
+
     # Concurrent
-    def on_done(self, results: Optional[BaseResults]):
+    def on_done(self, results: Optional[ExplanationResult]):
         super().on_done(results)
         self.update_impact()
+        self.update_interactions()
+        if results is not None and self.compute_interactions \
+                and results.interactions is None:
+            self.Information.no_interactions()
 
     # Misc
     def send_report(self):
@@ -493,7 +553,9 @@ class OWExplainModel(OWExplainFeatureBase):
         super().send_report()
 
     @staticmethod
-    def run(data: Table, model: Model, state: TaskState) -> Results:
+    def run(data: Table, model: Model, n_samples: Optional[int],
+            time_budget: Optional[float], interactions: bool,
+            state: TaskState) -> Optional[ExplanationResult]:
         if not data or not model:
             return None
 
@@ -504,9 +566,83 @@ class OWExplainModel(OWExplainFeatureBase):
             if state.is_interruption_requested():
                 raise Exception
 
-        x, names, mask, colors = get_shap_values_and_colors(model, data,
-                                                            callback)
-        return Results(x=x, colors=colors, names=names, mask=mask)
+        results = OWExplainModel._explain(data, model, n_samples,
+                                          time_budget, callback, state)
+        if interactions and supports_interactions(model):
+            # show the explanation while interactions are computed
+            state.set_partial_result(results)
+            try:
+                results.interactions = compute_shap_interactions(
+                    model, data, callback, n_samples
+                )
+            except ValueError:
+                # the model is rejected by the installed TreeExplainer
+                pass
+        return results
+
+    @staticmethod
+    def _explain(data: Table, model: Model, n_samples: Optional[int],
+                 time_budget: Optional[float], callback: Callable,
+                 state: TaskState) -> ExplanationResult:
+        if time_budget is not None:
+            # show each refinement of the explanation
+            def refined_result(x, names, mask, colors):
+                state.set_partial_result(
+                    ExplanationResult.from_mask(x, mask, names, colors=colors)
+                )
+
+            x, names, mask, colors = get_shap_values_and_colors(
+                model, data, callback, n_samples, time_budget=time_budget,
+                refined_result_callback=refined_result
+            )
+            return ExplanationResult.from_mask(x, mask, names, colors=colors)
+
+        if supports_approximation(model) \
+                and not is_explanation_cached(model, data, data, n_samples):
+            # show an approximate explanation first; the exact one, which
+            # can take much longer, then replaces it chunk by chunk
+            x, names, mask, colors = get_shap_values_and_colors(
+                model, data, wrap_callback(callback, end=0.1), n_samples,
+                approximate=True
+            )
+            approx = ExplanationResult.from_mask(x, mask, names,
+                                                 colors=colors)
+            state.set_partial_result(approx)
+
+            # both passes explain the same sample of rows
+            values = approx.values.copy()
+            positions = np.cumsum(mask) - 1
+            n_done = 0
+
+            def exact_partial_result(x, _, row_indices, __):
+                nonlocal n_done
+                values[:, positions[row_indices]] = x
+                n_done += len(row_indices)
+                if n_done == len(approx.row_indices):
+                    return  # the last chunk; final results follow immediately
+                # colors of the approximation are normalized on all rows
+                state.set_partial_result(ExplanationResult(
+                    values.copy(), approx.row_indices, len(data), names,
+                    colors=approx.colors))
+
+            x, names, mask, colors = get_shap_values_and_colors(
+                model, data, wrap_callback(callback, start=0.1), n_samples,
+                partial_result_callback=exact_partial_result
+            )
+            return ExplanationResult.from_mask(x, mask, names, colors=colors)
+
+        chunks = ExplainedChunks(n_explained_rows(model, len(data), n_samples))
+
+        def partial_result(x, names, row_indices, colors):
+            if chunks.add(x, row_indices, colors):
+                state.set_partial_result(ExplanationResult(
+                    chunks.values, chunks.row_indices, len(data), names,
+                    colors=chunks.colors))
+
+        x, names, mask, colors = get_shap_values_and_colors(
+            model, data, callback, n_samples,
+            partial_result_callback=partial_result)
+        return ExplanationResult.from_mask(x, mask, names, colors=colors)
 
 
 if __name__ == "__main__":  # pragma: no cover
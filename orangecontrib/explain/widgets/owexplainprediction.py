@@ -26,18 +26,12 @@ from Orange.widgets.utils.widgetpreview import WidgetPreview
 from Orange.widgets.widget import Input, Output, OWWidget, Msg
 
 from orangecontrib.explain.explainer import RGB_LOW, RGB_HIGH, \
-    explain_predictions, prepare_force_plot_data
-
-
-class RunnerResults(SimpleNamespace):
-    values = None  # type: Optional[List[np.ndarray]]
-    predictions = None  # type: Optional[np.ndarray]
-    transformed_data = None  # type: Optional[Table]
-    base_value = None  # type: Optional[float]
+    explain_predictions, explanation_space, ExplanationResult, \
+    ForcePlotRows
 
 
 def run(data: Table, background_data: Table, model: Model, state: TaskState) \
-        -> RunnerResults:
+        -> Optional[ExplanationResult]:
     if not data or not background_data or not model:
         return None
 
@@ -48,10 +42,10 @@ def run(data: Table, background_data: Table, model: Model, state: TaskState) \
         if state.is_interruption_requested():
             raise Exception
 
-    values, pred, data, _, base_value = explain_predictions(
+    values, pred, data, mask, base_value = explain_predictions(
         model, data, background_data, callback)
-    return RunnerResults(values=values, predictions=pred,
-                         transformed_data=data, base_value=base_value)
+    return ExplanationResult.from_mask(values, mask, transformed_data=data,
+                                       predictions=pred, base_value=base_value)
 
 
 def _collides(ind_y1: float, ind_y2: float, y1: float, y2: float, d=4) -> bool:
@@ -514,7 +508,7 @@ class OWExplainPrediction(OWWidget, ConcurrentWidgetMixin):
     def __init__(self):
         OWWidget.__init__(self)
         ConcurrentWidgetMixin.__init__(self)
-        self.__results = None  # type: Optional[Results]
+        self.__results = None  # type: Optional[ExplanationResult]
         self.model = None  # type: Optional[Model]
         self.background_data = None  # type: Optional[Table]
         self.data = None  # type: Optional[Table]
@@ -649,24 +643,26 @@ class OWExplainPrediction(OWWidget, ConcurrentWidgetMixin):
             data = self.__results.transformed_data
             pred = self.__results.predictions
             base = self.__results.base_value
-            values, _, labels, ranges = prepare_force_plot_data(
-                self.__results.values, data, pred, self.target_index)
-
             index = 0
+            values, _, labels, range_ = ForcePlotRows(
+                self.__results.values, data, pred, self.target_index)[index]
+
             HIGH, LOW = 0, 1
-            plot_data = PlotData(high_values=values[index][HIGH],
-                                 low_values=values[index][LOW][::-1],
-                                 high_labels=labels[index][HIGH],
-                                 low_labels=labels[index][LOW][::-1],
-                                 value_range=ranges[index],
+            plot_data = PlotData(high_values=values[HIGH],
+                                 low_values=values[LOW][::-1],
+                                 high_labels=labels[HIGH],
+                                 low_labels=labels[LOW][::-1],
+                                 value_range=range_,
                                  model_output=pred[index][self.target_index],
                                  base_value=base[self.target_index])
             self.setup_plot(plot_data)
 
-            self.mo_info = f"Model prediction: {_str(plot_data.model_output)}"
-            self.bv_info = f"Base value: {_str(plot_data.base_value)}"
+            space = explanation_space(self.model)
+            space = f" ({space})" if space else ""
+            self.mo_info = f"Model prediction{space}: " \
+                           f"{_str(plot_data.model_output)}"
+            self.bv_info = f"Base value{space}: {_str(plot_data.base_value)}"
 
-            assert isinstance(self.__results.values, list)
             scores = self.__results.values[self.target_index][0, :]
             names = [a.name for a in data.domain.attributes]
             scores = self.create_scores_table(scores, names)
@@ -697,7 +693,7 @@ class OWExplainPrediction(OWWidget, ConcurrentWidgetMixin):
     def on_partial_result(self, _):
         pass
 
-    def on_done(self, results: Optional[RunnerResults]):
+    def on_done(self, results: Optional[ExplanationResult]):
         self.__results = results
         self.update_scene()
 
@@ -1,5 +1,4 @@
 from itertools import chain
-from types import SimpleNamespace
 from typing import Optional, List, Tuple, Any
 from xml.sax.saxutils import escape
 
@@ -35,19 +34,15 @@ from Orange.widgets.widget import Input, Output, OWWidget, Msg
 
 from orangecontrib.explain.explainer import explain_predictions, \
     prepare_force_plot_data_multi_inst, RGB_HIGH, RGB_LOW, \
-    INSTANCE_ORDERINGS, get_instance_ordering
+    INSTANCE_ORDERINGS, ExplanationResult, explanation_space, \
+    n_explained_rows
+from orangecontrib.explain.widgets.owexplainfeaturebase import \
+    ExplanationParametersMixin, ExplainedChunks
 
 
-class RunnerResults(SimpleNamespace):
-    values: Optional[List[np.ndarray]] = None
-    predictions: Optional[np.ndarray] = None
-    transformed_data: Optional[Table] = None
-    mask: Optional[np.ndarray] = None
-    base_value: Optional[float] = None
-
-
-def run(data: Table, background_data: Table, model: Model, state: TaskState) \
-        -> Optional[RunnerResults]:
+def run(data: Table, background_data: Table, model: Model,
+        n_samples: Optional[int], time_budget: Optional[float],
+        state: TaskState) -> Optional[ExplanationResult]:
     if not data or not background_data or not model:
         return None
 
@@ -58,13 +53,38 @@ def run(data: Table, background_data: Table, model: Model, state: TaskState) \
         if state.is_interruption_requested():
             raise Exception
 
+    chunks = ExplainedChunks(n_explained_rows(model, len(data), n_samples))
+    predictions = None
+
+    def partial_result(values, pred, transformed_data, row_indices,
+                       base_value):
+        nonlocal predictions
+        if predictions is None:
+            predictions = np.full((len(data), pred.shape[1]), np.nan)
+        predictions[row_indices] = pred
+        if chunks.add(values, row_indices):
+            state.set_partial_result(ExplanationResult(
+                chunks.values, chunks.row_indices, len(data),
+                transformed_data=transformed_data,
+                predictions=predictions.copy(),
+                base_value=base_value))
+
+    def refined_result(values, pred, transformed_data, sample_mask,
+                       base_value):
+        state.set_partial_result(ExplanationResult.from_mask(
+            values, sample_mask,
+            transformed_data=transformed_data,
+            predictions=pred,
+            base_value=base_value))
+
     values, pred, data, sample_mask, base_value = explain_predictions(
-        model, data, background_data, callback)
-    return RunnerResults(values=values,
-                         predictions=pred,
-                         transformed_data=data,
-                         mask=sample_mask,
-                         base_value=base_value)
+        model, data, background_data, callback, n_samples,
+        partial_result_callback=partial_result, time_budget=time_budget,
+        refined_result_callback=refined_result)
+    return ExplanationResult.from_mask(values, sample_mask,
+                                       transformed_data=data,
+                                       predictions=pred,
+                                       base_value=base_value)
 
 
 class SelectionRect(pg.GraphicsObject):
@@ -509,7 +529,8 @@ class ForcePlot(pg.PlotWidget):
         return path.contains(point)
 
 
-class OWExplainPredictions(OWWidget, ConcurrentWidgetMixin):
+class OWExplainPredictions(OWWidget, ConcurrentWidgetMixin,
+                           ExplanationParametersMixin):
     name = "Explain Predictions"
     description = "Predictions explanation widget."
     keywords = ["explain", "explain prediction", "explain model"]
@@ -553,7 +574,7 @@ class OWExplainPredictions(OWWidget, ConcurrentWidgetMixin):
     def __init__(self):
         OWWidget.__init__(self)
         ConcurrentWidgetMixin.__init__(self)
-        self.__results: Optional[RunnerResults] = None
+        self.__results: Optional[ExplanationResult] = None
         self.model: Optional[Model] = None
         self.background_data: Optional[Table] = None
         self.data: Optional[Table] = None
@@ -611,6 +632,8 @@ class OWExplainPredictions(OWWidget, ConcurrentWidgetMixin):
         model[:] = self.ANNOTATIONS
         self._annot_combo.setModel(model)
 
+        self._add_explanation_box(self.__on_parameter_changed)
+
         box = gui.vBox(self.controlArea, "", margin=True,
                        contentsMargins=(8, 4, 8, 4))
         gui.checkBox(box, self, "show_tooltip", "Show tooltips",
@@ -621,6 +644,9 @@ class OWExplainPredictions(OWWidget, ConcurrentWidgetMixin):
 
         gui.rubber(self.controlArea)
 
+    def __on_parameter_changed(self):
+        self.handleNewSignals()
+
     def __on_target_changed(self):
         self.selection_ranges = []
         self.setup_plot()
@@ -716,7 +742,8 @@ class OWExplainPredictions(OWWidget, ConcurrentWidgetMixin):
 
     def handleNewSignals(self):
         self.clear()
-        self.start(run, self.data, self.background_data, self.model)
+        self.start(run, self.data, self.background_data, self.model,
+                   *self.explanation_parameters())
         self.commit.deferred()
 
     def clear(self):
@@ -737,15 +764,9 @@ class OWExplainPredictions(OWWidget, ConcurrentWidgetMixin):
             return
 
         order = self._order_combo.model()[self.order_index]
-        values_idxs = get_instance_ordering(
-            self.__results.values[self.target_index],
-            self.__results.predictions[self.__results.mask, self.target_index],
-            self.data[self.__results.mask],
-            order
-        )
-
-        data_idxs = np.arange(len(self.data))
-        self.__data_idxs = data_idxs[self.__results.mask][values_idxs]
+        values_idxs = self.__results.ordering(
+            self.target_index, order, self.data)
+        self.__data_idxs = self.__results.row_indices[values_idxs]
 
         x_data, pos_y_data, neg_y_data, pos_labels, neg_labels = \
             prepare_force_plot_data_multi_inst(
@@ -765,6 +786,9 @@ class OWExplainPredictions(OWWidget, ConcurrentWidgetMixin):
         target = self.model.domain.class_var
         if self.model.domain.has_discrete_class:
             target = f"{target} = {target.values[self.target_index]}"
+        space = explanation_space(self.model)
+        if space:
+            target = f"{target}, {space}"
         y_label = f"Output value ({target})"
 
         self.graph.set_data(x_data, pos_y_data, neg_y_data,
@@ -787,10 +811,11 @@ class OWExplainPredictions(OWWidget, ConcurrentWidgetMixin):
         else:
             raise NotImplementedError(annotator)
 
-    def on_partial_result(self, _):
-        pass
+    def on_partial_result(self, results: ExplanationResult):
+        self.__results = results
+        self.setup_plot()
 
-    def on_done(self, results: Optional[RunnerResults]):
+    def on_done(self, results: Optional[ExplanationResult]):
         self.__results = results
         if results is not None and not all(results.mask):
             self.Information.data_sampled()
@@ -837,8 +862,8 @@ class OWExplainPredictions(OWWidget, ConcurrentWidgetMixin):
     def output_scores(self):
         scores = None
         if self.__results is not None:
-            mask = self.__results.mask
-            data = self.__results.transformed_data[mask]
+            data = self.__results.transformed_data[
+                self.__results.row_indices]
             domain = data.domain
             attrs = [ContinuousVariable(f"S({a.name})")
                      for a in domain.attributes]
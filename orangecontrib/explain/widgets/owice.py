@@ -649,9 +649,9 @@ class OWICE(OWWidget, ConcurrentWidgetMixin):
 
         if self.data and len(self.data) > self.MAX_INSTANCES:
             self.__sampled_mask[:] = False
-            np.random.seed(0)
+            rng = np.random.default_rng(0)
             kws = {"size": self.MAX_INSTANCES, "replace": False}
-            self.__sampled_mask[np.random.choice(len(self.data), **kws)] = True
+            self.__sampled_mask[rng.choice(len(self.data), **kws)] = True
             self.Information.data_sampled()
 
     def handleNewSignals(self):
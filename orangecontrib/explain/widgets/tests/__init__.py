@@ -0,0 +1,73 @@
+from typing import List, Optional, Tuple
+from unittest.mock import Mock
+
+import numpy as np
+
+from Orange.base import Model
+from Orange.classification import KNNLearner, LogisticRegressionLearner, \
+    RandomForestLearner
+from Orange.data import Table
+from Orange.widgets.utils.concurrent import TaskState
+
+from orangecontrib.explain.explainer import ExplanationResult, N_SAMPLES
+
+
+class ExplanationRunnerTests:
+    """
+    Tests of partial results reported by runners of widgets that explain
+    rows with SHAP values. Widget tests implement run_task, which calls the
+    widget's runner with the given parameters.
+    """
+    def run_task(self, data: Table, model: Model, n_samples: Optional[int],
+                 time_budget: Optional[float], state: TaskState) \
+            -> ExplanationResult:
+        raise NotImplementedError
+
+    def explain(
+        self,
+        data: Table,
+        model: Model,
+        n_samples: Optional[int] = N_SAMPLES,
+        time_budget: Optional[float] = None,
+    ) -> Tuple[ExplanationResult, List[ExplanationResult]]:
+        """ Run the task; return the result and reported partial results """
+        state = Mock()
+        state.is_interruption_requested.return_value = False
+        results = self.run_task(data, model, n_samples, time_budget, state)
+        partial = [c[0][0] for c in state.set_partial_result.call_args_list]
+        return results, partial
+
+    def test_partial_results(self):
+        heart = Table("heart_disease")
+        model = RandomForestLearner(n_estimators=10, random_state=0)(heart)
+        results, partial = self.explain(heart, model)
+        self.assertGreater(len(partial), 0)
+        for res in partial:
+            self.assertLess(res.mask.sum(), len(heart))
+            self.assertEqual(res.values.shape[1], res.mask.sum())
+            np.testing.assert_array_equal(
+                res.values, results.values[:, res.mask[results.mask]]
+            )
+
+    def test_partial_results_linear(self):
+        # linear models are explained on all rows, regardless of n_samples;
+        # the last chunk is not reported, the final results follow
+        titanic = Table("titanic")
+        model = LogisticRegressionLearner()(titanic)
+        results, partial = self.explain(titanic, model)
+        self.assertTrue(results.mask.all())
+        self.assertGreater(len(partial), 0)
+        for res in partial:
+            self.assertLess(res.mask.sum(), len(titanic))
+
+    def test_time_limit(self):
+        heart = Table("heart_disease")
+        model = KNNLearner()(heart)
+        results, partial = self.explain(heart, model, time_budget=1)
+
+        # each refinement is shown; the last one is the result
+        self.assertGreater(len(partial), 0)
+        sizes = [res.mask.sum() for res in partial]
+        self.assertEqual(sizes, sorted(sizes))
+        np.testing.assert_array_equal(partial[-1].mask, results.mask)
+        np.testing.assert_array_equal(partial[-1].values, results.values)
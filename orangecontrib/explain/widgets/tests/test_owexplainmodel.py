@@ -2,6 +2,7 @@
 import inspect
 import itertools
 import unittest
+from unittest.mock import Mock, patch
 
 import numpy as np
 
@@ -18,16 +19,22 @@ from orangewidget.tests.base import WidgetTest
 import Orange
 from Orange.base import Learner
 from Orange.classification import RandomForestLearner, OneClassSVMLearner, \
-    IsolationForestLearner, EllipticEnvelopeLearner, LocalOutlierFactorLearner
+    IsolationForestLearner, EllipticEnvelopeLearner, \
+    LocalOutlierFactorLearner, LogisticRegressionLearner, KNNLearner, \
+    TreeLearner
 from Orange.data import Table, Domain, ContinuousVariable
 from Orange.regression import RandomForestRegressionLearner
 
+from orangecontrib.explain.cache import MemoryCache
+from orangecontrib.explain.explainer import ExplanationResult, N_SAMPLES
+from orangecontrib.explain.tests import disable_caches
 from orangecontrib.explain.widgets.owexplainfeaturebase import VariableItem
 from orangecontrib.explain.widgets.owexplainmodel import OWExplainModel, \
-    ViolinPlot, ViolinItem, Results
+    ViolinPlot, ViolinItem, MAX_DISPLAYED_ROWS
+from orangecontrib.explain.widgets.tests import ExplanationRunnerTests
 
 
-def dummy_run(data, model, _):
+def dummy_run(data, model, *_):
     if not data or model is None:
         return None
     m, n = data.X.shape
@@ -36,13 +43,12 @@ def dummy_run(data, model, _):
     mask = np.ones(m, dtype=bool)
     mask[150:] = False
     m = min(150, m)
-    return Results(x=[np.ones((m, n)) for _ in range(k)],
-                   colors=np.zeros((m, n) + (3,), dtype=int),
-                   names=[str(i) for i in range(n)],
-                   mask=mask)
+    return ExplanationResult.from_mask(
+        np.ones((k, m, n)), mask, [str(i) for i in range(n)],
+        colors=np.zeros((m, n) + (3,), dtype=int))
 
 
-class TestOWExplainModel(WidgetTest):
+class TestOWExplainModel(WidgetTest, ExplanationRunnerTests):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -54,8 +60,16 @@ class TestOWExplainModel(WidgetTest):
             random_state=42)(cls.housing)
 
     def setUp(self):
+        disable_caches(self)
         self.widget = self.create_widget(OWExplainModel)
 
+    def run_task(self, data, model, n_samples, time_budget, state):
+        # without the approximation, rows are reported in chunks
+        with patch("orangecontrib.explain.widgets.owexplainmodel."
+                   "supports_approximation", Mock(return_value=False)):
+            return self.widget.run(data, model, n_samples, time_budget,
+                                   False, state)
+
     def test_classification_data_classification_model(self):
         self.send_signal(self.widget.Inputs.data, self.iris)
         self.send_signal(self.widget.Inputs.model, self.rf_cls)
@@ -250,6 +264,39 @@ class TestOWExplainModel(WidgetTest):
         self.send_signal(self.widget.Inputs.data, None)
         self.assertPlotEmpty(self.widget.plot)
 
+    def test_explanation_space(self):
+        self.send_signal(self.widget.Inputs.data, self.iris)
+        self.send_signal(self.widget.Inputs.model, self.rf_cls)
+        self.wait_until_finished()
+        self.assertEqual(self.widget.plot.bottom_axis.labelText,
+                         "Impact on model output")
+
+        for data, space in ((self.heart, "log-odds"), (self.iris, "logit")):
+            self.send_signal(self.widget.Inputs.data, data)
+            self.send_signal(self.widget.Inputs.model,
+                             LogisticRegressionLearner()(data))
+            self.wait_until_finished()
+            self.assertEqual(self.widget.plot.bottom_axis.labelText,
+                             f"Impact on model output ({space})")
+
+    def test_displayed_rows(self):
+        n = 3 * MAX_DISPLAYED_ROWS
+        values = np.random.default_rng(0).random((1, n, 4))
+        results = ExplanationResult(
+            values, np.arange(n), n, list("abcd"),
+            colors=np.zeros((n, 4, 3), dtype=int))
+        self.widget.on_partial_result(results)
+
+        # the plot shows a sample of rows, scores are computed on all rows
+        layout = self.widget.plot.layout()
+        for i in range(layout.rowCount() - 1):
+            item = layout.itemAt(i, 1)
+            self.assertEqual(len(item._group.childItems()),
+                             MAX_DISPLAYED_ROWS)
+        np.testing.assert_array_almost_equal(
+            self.widget.get_scores_table().X[:, 0],
+            np.abs(values[0]).mean(axis=0))
+
     @unittest.mock.patch("orangecontrib.explain.widgets.owexplainmodel."
                          "OWExplainModel.run")
     def test_data_sampled_info(self, mocked_run):
@@ -270,6 +317,125 @@ class TestOWExplainModel(WidgetTest):
         self.wait_until_finished()
         self.assertFalse(self.widget.Information.data_sampled.is_shown())
 
+    def test_partial_results_plot(self):
+        _, partial = self.explain(self.housing, self.rf_reg)
+        for res in partial:
+            self.assertEqual(len(res.colors), res.mask.sum())
+
+        self.send_signal(self.widget.Inputs.data, self.housing)
+        self.wait_until_finished()
+        self.assertPlotEmpty(self.widget.plot)
+        self.widget.on_partial_result(partial[0])
+        self.assertDomainInPlot(self.widget.plot, self.housing.domain)
+
+    def test_explain_all_rows(self):
+        titanic = Table("titanic")
+        model = RandomForestLearner(n_estimators=10, random_state=0)(titanic)
+        self.send_signal(self.widget.Inputs.data, titanic)
+        self.send_signal(self.widget.Inputs.model, model)
+        self.wait_until_finished()
+        self.assertEqual(N_SAMPLES, self.widget.results.mask.sum())
+        self.assertTrue(self.widget.Information.data_sampled.is_shown())
+
+        self.widget.controls.explain_all_rows.click()
+        self.wait_until_finished(timeout=30000)
+        self.assertTrue(self.widget.results.mask.all())
+        self.assertFalse(self.widget.Information.data_sampled.is_shown())
+
+    def test_time_limit_controls(self):
+        model = KNNLearner()(self.heart)
+        self.send_signal(self.widget.Inputs.data, self.heart)
+        self.send_signal(self.widget.Inputs.model, model)
+        self.widget.controls.time_limit.setValue(1)
+        self.widget.controls.use_time_limit.click()
+        self.wait_until_finished(timeout=30000)
+        self.assertIsNotNone(self.widget.results)
+        self.assertIsNotNone(self.widget.plot)
+
+    def test_approximate_first(self):
+        state = Mock()
+        state.is_interruption_requested.return_value = False
+        results = self.widget.run(self.housing, self.rf_reg, N_SAMPLES,
+                                  None, False, state)
+
+        # the approximate explanation of all rows is shown first
+        partial = [c[0][0] for c in state.set_partial_result.call_args_list]
+        approx = partial[0]
+        np.testing.assert_array_equal(approx.mask, results.mask)
+        self.assertEqual(approx.names, results.names)
+        self.assertEqual(approx.values.shape, results.values.shape)
+        self.assertFalse(np.allclose(approx.values, results.values))
+
+        # exact chunks then replace approximate values of their rows
+        self.assertGreater(len(partial), 1)
+        n_exact = 0
+        for res in partial[1:]:
+            np.testing.assert_array_equal(res.mask, results.mask)
+            np.testing.assert_array_equal(res.colors, approx.colors)
+            exact = np.all(res.values == results.values, axis=(0, 2))
+            np.testing.assert_array_equal(
+                res.values[:, ~exact], approx.values[:, ~exact]
+            )
+            self.assertGreater(exact.sum(), n_exact)
+            n_exact = exact.sum()
+        self.assertLess(n_exact, len(results.row_indices))
+
+        # exact results replace it
+        self.send_signal(self.widget.Inputs.data, self.housing)
+        self.send_signal(self.widget.Inputs.model, self.rf_reg)
+        self.wait_until_finished()
+        np.testing.assert_array_almost_equal(
+            self.widget.results.values, results.values
+        )
+
+    def test_cached_not_approximated(self):
+        state = Mock()
+        state.is_interruption_requested.return_value = False
+        with patch("orangecontrib.explain.explainer.shap_memory_cache",
+                   MemoryCache()):
+            results = self.widget.run(self.housing, self.rf_reg, N_SAMPLES,
+                                      None, False, state)
+            state.reset_mock()
+            with patch("orangecontrib.explain.explainer._explain_trees") \
+                    as explain_trees:
+                cached = self.widget.run(self.housing, self.rf_reg,
+                                         N_SAMPLES, None, False, state)
+                explain_trees.assert_not_called()
+        # the exact explanation is shown without the approximation
+        state.set_partial_result.assert_not_called()
+        np.testing.assert_array_equal(cached.values, results.values)
+
+    def test_interactions(self):
+        self.send_signal(self.widget.Inputs.data, self.iris)
+        self.send_signal(self.widget.Inputs.model, self.rf_cls)
+        self.wait_until_finished()
+        self.assertIsNone(self.get_output(self.widget.Outputs.interactions))
+
+        self.widget.controls.compute_interactions.click()
+        self.wait_until_finished()
+        output = self.get_output(self.widget.Outputs.interactions)
+        n_attrs = len(self.iris.domain.attributes)
+        self.assertEqual(len(output), n_attrs * (n_attrs - 1) // 2)
+        self.assertTrue(np.all(np.diff(output.X[:, 0]) <= 0))
+        self.assertFalse(self.widget.Information.no_interactions.is_shown())
+
+        # interactions of another target class
+        self.widget._target_combo.setCurrentIndex(1)
+        self.widget._target_combo.activated.emit(1)
+        output2 = self.get_output(self.widget.Outputs.interactions)
+        self.assertFalse(np.array_equal(output.X, output2.X))
+
+        # Orange's trees are not supported
+        self.send_signal(self.widget.Inputs.model, TreeLearner()(self.iris))
+        self.wait_until_finished()
+        self.assertIsNone(self.get_output(self.widget.Outputs.interactions))
+        self.assertTrue(self.widget.Information.no_interactions.is_shown())
+
+        self.send_signal(self.widget.Inputs.model, None)
+        self.wait_until_finished()
+        self.assertIsNone(self.get_output(self.widget.Outputs.interactions))
+        self.assertFalse(self.widget.Information.no_interactions.is_shown())
+
     def test_send_report(self):
         self.widget.send_report()
         self.send_signal(self.widget.Inputs.data, self.iris)
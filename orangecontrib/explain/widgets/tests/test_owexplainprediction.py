@@ -10,10 +10,12 @@ from orangewidget.tests.base import WidgetTest
 import Orange
 from Orange.base import Learner
 from Orange.classification import RandomForestLearner, OneClassSVMLearner, \
-    IsolationForestLearner, EllipticEnvelopeLearner, LocalOutlierFactorLearner
+    IsolationForestLearner, EllipticEnvelopeLearner, \
+    LocalOutlierFactorLearner, LogisticRegressionLearner
 from Orange.data import Table
 from Orange.regression import RandomForestRegressionLearner
 
+from orangecontrib.explain.tests import disable_caches
 from orangecontrib.explain.widgets.owexplainprediction import StripePlot, \
     OWExplainPrediction
 
@@ -30,6 +32,7 @@ class TestOWExplainPrediction(WidgetTest):
             random_state=42)(cls.housing)
 
     def setUp(self):
+        disable_caches(self)
         self.widget = self.create_widget(OWExplainPrediction)
 
     def test_inputs(self):
@@ -70,6 +73,24 @@ class TestOWExplainPrediction(WidgetTest):
         self.assertPlotEmpty(self.widget._stripe_plot)
         self.assertTrue(self.widget.Error.domain_transform_err.is_shown())
 
+    def test_explanation_space(self):
+        self.send_signal(self.widget.Inputs.background_data, self.iris)
+        self.send_signal(self.widget.Inputs.data, self.iris[:1])
+        self.send_signal(self.widget.Inputs.model, self.rf_cls)
+        self.wait_until_finished()
+        self.assertTrue(self.widget.mo_info.startswith("Model prediction: "))
+
+        for data, space in ((self.heart, "log-odds"), (self.iris, "logit")):
+            self.send_signal(self.widget.Inputs.background_data, data)
+            self.send_signal(self.widget.Inputs.data, data[:1])
+            self.send_signal(self.widget.Inputs.model,
+                             LogisticRegressionLearner()(data))
+            self.wait_until_finished()
+            self.assertTrue(self.widget.mo_info.startswith(
+                f"Model prediction ({space}): "))
+            self.assertTrue(self.widget.bv_info.startswith(
+                f"Base value ({space}): "))
+
     def test_output_scores(self):
         self.send_signal(self.widget.Inputs.background_data, self.iris)
         self.send_signal(self.widget.Inputs.data, self.iris[:1])
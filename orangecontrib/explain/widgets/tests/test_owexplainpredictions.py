@@ -1,7 +1,7 @@
 # pylint: disable=missing-docstring
 import unittest
 from typing import Type
-from unittest.mock import Mock, patch
+from unittest.mock import Mock
 
 import numpy as np
 from AnyQt.QtCore import QPointF, Qt
@@ -10,15 +10,17 @@ from AnyQt.QtWidgets import QToolTip
 
 from Orange.base import Learner
 from Orange.classification import RandomForestLearner, CalibratedLearner, \
-    ThresholdLearner
+    ThresholdLearner, KNNLearner
 from Orange.data import Table
 from Orange.regression import RandomForestRegressionLearner
 from Orange.tests.test_classification import all_learners as all_cls_learners
 from Orange.tests.test_regression import all_learners as all_reg_learners
 from Orange.widgets.tests.utils import simulate
 from orangecontrib.explain.explainer import INSTANCE_ORDERINGS
+from orangecontrib.explain.tests import disable_caches
 from orangecontrib.explain.widgets.owexplainpredictions import ForcePlot, \
-    OWExplainPredictions
+    OWExplainPredictions, run
+from orangecontrib.explain.widgets.tests import ExplanationRunnerTests
 from orangewidget.tests.base import WidgetTest
 
 # FIXME: remove when the minimum supported version is 3.32
@@ -98,7 +100,7 @@ class TestForcePlot(WidgetTest):
         self.assertEqual(len(selection_handler.call_args[0][0]), 0)
 
 
-class TestOWExplainPredictions(WidgetTest):
+class TestOWExplainPredictions(WidgetTest, ExplanationRunnerTests):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -109,8 +111,12 @@ class TestOWExplainPredictions(WidgetTest):
         cls.rf_reg = RandomForestRegressionLearner(**kwargs)(cls.housing)
 
     def setUp(self):
+        disable_caches(self)
         self.widget = self.create_widget(OWExplainPredictions)
 
+    def run_task(self, data, model, n_samples, time_budget, state):
+        return run(data, data, model, n_samples, time_budget, state)
+
     def test_input_one_instance(self):
         self.send_signal(self.widget.Inputs.background_data, self.heart)
         self.send_signal(self.widget.Inputs.data, self.heart[:1])
@@ -133,6 +139,12 @@ class TestOWExplainPredictions(WidgetTest):
         output = self.get_output(self.widget.Outputs.scores)
         self.assertEqual(len(output), 1000)
 
+        self.widget.controls.explain_all_rows.click()
+        self.wait_until_finished(timeout=30000)
+        self.assertFalse(self.widget.Information.data_sampled.is_shown())
+        output = self.get_output(self.widget.Outputs.scores)
+        self.assertEqual(len(output), len(titanic))
+
         self.send_signal(self.widget.Inputs.data, None)
         self.assertFalse(self.widget.Information.data_sampled.is_shown())
 
@@ -240,6 +252,35 @@ class TestOWExplainPredictions(WidgetTest):
         self.assertEqual(self.widget._annot_combo.currentText(), "None")
         self.assertEqual(self.widget._annot_combo.count(), 2)
 
+    def test_partial_results_plot(self):
+        results, partial = self.explain(self.heart, self.rf_cls)
+        for res in partial:
+            np.testing.assert_array_equal(
+                res.predictions[res.mask], results.predictions[res.mask]
+            )
+
+        self.send_signal(self.widget.Inputs.background_data, self.heart)
+        self.send_signal(self.widget.Inputs.data, self.heart)
+        self.send_signal(self.widget.Inputs.model, self.rf_cls)
+        self.wait_until_finished()
+        self.widget.graph.clear_all()
+        self.widget.on_partial_result(partial[0])
+        self.assertPlotNotEmpty(self.widget.graph)
+
+    def test_time_limit_controls(self):
+        model = KNNLearner()(self.heart)
+        results, partial = self.explain(self.heart, model, time_budget=1)
+        np.testing.assert_array_equal(partial[-1].predictions,
+                                      results.predictions)
+
+        self.send_signal(self.widget.Inputs.background_data, self.heart)
+        self.send_signal(self.widget.Inputs.data, self.heart)
+        self.send_signal(self.widget.Inputs.model, model)
+        self.widget.controls.time_limit.setValue(1)
+        self.widget.controls.use_time_limit.click()
+        self.wait_until_finished(timeout=30000)
+        self.assertPlotNotEmpty(self.widget.graph)
+
     def test_setup_plot(self):
         self.widget.graph.set_data = Mock()
         self.widget.graph.set_axis = Mock()